@@ -1,11 +1,16 @@
 import os
 import sys
-import webbrowser
+
+from typing import List, Optional
 
 from aiohttp import web
 
-from . import db, message, routes
-from .executor.image import executor as image_executor
+from . import db, message, retention, routes
+from .db import backup as db_backup, migrations, trace
+from .executor.image import (
+    BACKENDS, PRECISIONS, RESULT_CACHE_SIZE, GeneratorConfig,
+    executor as image_executor, parse_cpus)
+from .routes.metrics import middleware as metrics_middleware
 
 
 #: The port on which to listen.
@@ -15,9 +20,101 @@ PORT = os.getenv('IJAVE_PORT', '8080')
 IJAVE_STATIC_DIR = os.getenv('IJAVE_STATIC_DIR')
 
 
+def application(
+        database: db.Database,
+        latent_previews: bool = False,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        config: Optional[GeneratorConfig] = None) -> web.Application:
+    """Constructs the application.
+
+    The image executor, the compactor and the background migrator are
+    started when the application starts, and stopped when it is cleaned up.
+
+    :param database: The application database.
+
+    :param latent_previews: Whether to store intermediate images as latents.
+
+    :param result_cache_size: The maximum total size, in bytes, of cached
+        generation results.
+
+    :param config: The configuration of the generator process. If not
+        specified, it is read from the environment.
+
+    :return: an application
+    """
+    async def on_startup(app):
+        app.image_executor.start()
+        app.compactor.start()
+        app.migrator.start()
+
+    async def on_cleanup(app):
+        app.migrator.stop()
+        app.compactor.stop()
+        app.image_executor.stop()
+
+    app = web.Application(middlewares=[metrics_middleware])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes(routes.ALL)
+    app.db = database
+
+    app.broker = message.Broker()
+    app.image_executor = image_executor(
+        app.db,
+        app.broker,
+        latent_previews=latent_previews,
+        result_cache_size=result_cache_size,
+        config=config)
+    app.compactor = retention.Compactor(app.db)
+    app.migrator = migrations.Migrator(app.db)
+
+    return app
+
+
+def estimate(database: str):
+    """Prints the estimated cost of pending migrations.
+
+    :param database: The database file.
+    """
+    import pathlib
+    import sqlite3
+
+    conn = sqlite3.connect(
+        pathlib.Path(database).absolute().as_uri() + '?mode=ro',
+        uri=True)
+    try:
+        estimates = migrations.estimate(conn)
+    finally:
+        conn.close()
+
+    if not estimates:
+        print('No pending migrations')
+    for e in estimates:
+        print('{} ({}{})'.format(
+            e.name,
+            'blocking' if e.blocking else 'background',
+            ', {} background batches'.format(e.batches)
+            if e.batches is not None else ''))
+        for (table, size) in e.tables.items():
+            print('    {}: {} rows{}'.format(
+                table,
+                size.rows,
+                ', {:.1f} MiB'.format(size.size / 1024 / 1024)
+                if size.size is not None else ''))
+
+
 def main(
-        version: str, database: db.Database, port: int, launch: bool,
-        address: str):
+        version: str, database: str, port: int, launch: bool,
+        address: str, migrate_dry_run: bool, vacuum: bool,
+        trace_database: bool,
+        slow_statement: float, trace_sample_rate: float,
+        backup: Optional[str], backup_interval: float,
+        standby: Optional[str], backup_pages: int, backup_pause: float,
+        latent_previews: bool,
+        result_cache_size: int, backend: str, synthetic_latency: float,
+        profile_directory: Optional[str], precision: str, jit_compile: bool,
+        intra_op_threads: Optional[int], inter_op_threads: Optional[int],
+        cpu_affinity: Optional[List[int]]):
     import logging
 
     logging.basicConfig(level=logging.DEBUG)
@@ -25,14 +122,62 @@ def main(
     async def on_prepare(request, response):
         response.headers['server'] = 'Inane Jave/' + version
 
-    app = web.Application()
+    if migrate_dry_run:
+        estimate(database)
+        return
+
+    database = db.Database(database)
+
+    if vacuum:
+        print('=== Vacuuming database ===')
+        sys.stdout.flush()
+        database.vacuum()
+
+    if trace_database:
+        database.trace(trace.Tracer(
+            slow_statement=slow_statement,
+            sample_rate=trace_sample_rate))
+
+    app = application(
+        database,
+        latent_previews=latent_previews,
+        result_cache_size=result_cache_size,
+        config=GeneratorConfig(
+            backend=backend,
+            synthetic_latency=synthetic_latency,
+            profile_directory=profile_directory,
+            precision=precision,
+            jit_compile=jit_compile,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            cpu_affinity=cpu_affinity))
     app.on_response_prepare.append(on_prepare)
-    app.add_routes(routes.ALL)
-    app.db = database
 
-    app.broker = message.Broker()
-    app.image_executor = image_executor(app.db, app.broker)
-    app.image_executor.start()
+    threads = []
+    if backup is not None:
+        threads.append(db_backup.Backup(
+            database,
+            backup,
+            interval=backup_interval,
+            pages=backup_pages,
+            pause=backup_pause))
+    if standby is not None:
+        threads.append(db_backup.Standby(
+            database,
+            standby,
+            pages=backup_pages,
+            pause=backup_pause))
+
+    async def start_backups(app):
+        for thread in threads:
+            thread.start()
+
+    async def stop_backups(app):
+        for thread in threads:
+            thread.stop()
+
+    app.on_startup.append(start_backups)
+    app.on_cleanup.append(stop_backups)
 
     if IJAVE_STATIC_DIR is not None:
         async def serve_index(req):
@@ -45,11 +190,10 @@ def main(
     print('=== Starting web server ===')
     sys.stdout.flush()
     if launch:
+        import webbrowser
         webbrowser.open('http://localhost:{}'.format(PORT))
     web.run_app(app, port=port, host=address)
 
-    app.image_executor.stop()
-
 
 if __name__ == '__main__':
     import argparse
@@ -71,14 +215,153 @@ if __name__ == '__main__':
 
     parser.add_argument(
         'database',
-        help='the database file backing the application',
-        type=db.Database)
+        help='the database file backing the application')
 
     parser.add_argument(
         '--launch',
         help='open the application in a web browser',
         action='store_true')
 
+    parser.add_argument(
+        '--migrate-dry-run',
+        help='print the pending migrations and the sizes of the tables they '
+        'refer to, and exit without modifying the database',
+        action='store_true')
+
+    parser.add_argument(
+        '--vacuum',
+        help='rebuild the database file before starting, reclaiming all '
+        'free space and enabling incremental reclamation for old databases',
+        action='store_true')
+
+    parser.add_argument(
+        '--trace-database',
+        help='record database transactions, slow statements and sampled '
+        'statements, available from /api/admin/db/trace',
+        action='store_true')
+
+    parser.add_argument(
+        '--slow-statement',
+        help='the duration, in milliseconds, above which database '
+        'statements are traced and logged with their query plans',
+        type=lambda s: float(s) / 1000,
+        default=trace.SLOW_STATEMENT)
+
+    parser.add_argument(
+        '--trace-sample-rate',
+        help='the fraction of database statements sampled when tracing',
+        type=float,
+        default=0.0)
+
+    parser.add_argument(
+        '--backup',
+        help='periodically back up the database to this file while the '
+        'server is running; strftime formats such as %%Y%%m%%d are expanded',
+        metavar='PATH')
+
+    parser.add_argument(
+        '--backup-interval',
+        help='the number of hours between backups',
+        type=lambda s: float(s) * 60 * 60,
+        default=db_backup.INTERVAL)
+
+    parser.add_argument(
+        '--standby',
+        help='maintain a standby copy of the database in this file, updated '
+        'as transactions commit',
+        metavar='PATH')
+
+    parser.add_argument(
+        '--backup-pages',
+        help='the number of database pages copied at a time by backups',
+        type=int,
+        default=db_backup.PAGES)
+
+    parser.add_argument(
+        '--backup-pause',
+        help='the duration, in milliseconds, to yield the database between '
+        'backup steps',
+        type=lambda s: float(s) / 1000,
+        default=db_backup.PAUSE)
+
+    parser.add_argument(
+        '--latent-previews',
+        help='store intermediate images as latents, and decode them only '
+        'when requested',
+        action='store_true')
+
+    parser.add_argument(
+        '--result-cache-size',
+        help='the maximum total size, in MiB, of cached generation results; '
+        'use 0 to disable the cache',
+        type=lambda s: int(float(s) * 1024 * 1024),
+        default=RESULT_CACHE_SIZE)
+
+    try:
+        config = GeneratorConfig.from_env()
+    except ValueError as e:
+        sys.stderr.write('Invalid generator configuration: {}\n'.format(e))
+        sys.exit(1)
+
+    parser.add_argument(
+        '--backend',
+        help='the generator backend; the synthetic backend generates '
+        'deterministic images without any models, for load testing; '
+        'defaults to $IJAVE_BACKEND',
+        choices=sorted(BACKENDS),
+        default=config.backend)
+
+    parser.add_argument(
+        '--synthetic-latency',
+        help='the number of seconds each call to the synthetic backend '
+        'takes; defaults to $IJAVE_SYNTHETIC_LATENCY',
+        type=float,
+        default=config.synthetic_latency)
+
+    parser.add_argument(
+        '--profile-directory',
+        help='the directory to which generator profiler traces are written '
+        'when requested through the API; profiling is disabled unless this '
+        'is set; defaults to $IJAVE_PROFILE_DIR',
+        default=config.profile_directory)
+
+    parser.add_argument(
+        '--precision',
+        help='the numeric precision of the generator models; bfloat16 uses '
+        'mixed precision, and auto uses it only if the CPU supports it; '
+        'defaults to $IJAVE_PRECISION',
+        choices=PRECISIONS,
+        default=config.precision)
+
+    parser.add_argument(
+        '--no-jit-compile',
+        help='do not JIT compile the generator models; defaults to '
+        '$IJAVE_JIT_COMPILE',
+        dest='jit_compile',
+        action='store_false',
+        default=config.jit_compile)
+
+    parser.add_argument(
+        '--intra-op-threads',
+        help='the number of threads used within a generator operation; '
+        'defaults to $IJAVE_INTRA_OP_THREADS',
+        type=int,
+        default=config.intra_op_threads)
+
+    parser.add_argument(
+        '--inter-op-threads',
+        help='the number of generator operations executed in parallel; '
+        'defaults to $IJAVE_INTER_OP_THREADS',
+        type=int,
+        default=config.inter_op_threads)
+
+    parser.add_argument(
+        '--cpu-affinity',
+        help='the CPUs to which to pin the generator, such as 0-3,8; '
+        'defaults to $IJAVE_CPU_AFFINITY',
+        type=parse_cpus,
+        default=config.cpu_affinity)
+
     parser.add_argument(
         '--address',
         help='the address on which to listen',
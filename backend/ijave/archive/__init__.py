@@ -0,0 +1,304 @@
+"""
+Project archives
+----------------
+
+This module converts projects to and from *tar* archives, so that they can be
+moved between servers.
+
+An archive contains the following members, in this order:
+
+``project.json``
+    The archive format version and the project.
+
+``prompts/<id>.json``
+    A prompt and the state of its image executor cache, if any.
+
+``prompts/<id>.latent``
+    The latent of the image executor cache, if any.
+
+``images/<id>.json``
+    An image without its data and the ID of the prompt containing it.
+
+``images/<id>.data``
+    The image data.
+
+``end.json``
+    The number of prompts and images in the archive. This is used to detect
+    truncated archives.
+
+The members of a prompt are followed by the members of all its images.
+"""
+import json
+import tarfile
+
+from typing import BinaryIO, Iterator, List, Optional
+
+from .. import db, ent
+
+
+#: The version of the archive format.
+VERSION = 1
+
+#: The content type of archives.
+CONTENT_TYPE = 'application/x-tar'
+
+#: The number of entities buffered before they are inserted during import.
+BATCH_SIZE = 64
+
+
+class InvalidArchive(ValueError):
+    """Raised when an archive cannot be imported because it is malformed.
+    """
+    pass
+
+
+class EntityExists(ValueError):
+    """Raised when an archive cannot be imported because an entity it
+    contains already exists.
+    """
+    pass
+
+
+class ProjectExists(EntityExists):
+    """Raised when an archive cannot be imported because the project already
+    exists.
+    """
+    pass
+
+
+def export(
+        database: db.Database,
+        project: ent.ProjectID) -> Optional[Iterator[bytes]]:
+    """Generates an archive of a project.
+
+    The archive is generated as it is consumed. Images are loaded one at a
+    time, and every image is loaded in a separate transaction.
+
+    :param database: The application database.
+
+    :param project: The ID of the project to export.
+
+    :return: an iterator over chunks of the archive, or ``None`` if the project
+        does not exist
+    """
+    with database.transaction() as tx:
+        entity = database.load(tx, project)
+    if entity is None:
+        return None
+    else:
+        return _export(database, entity)
+
+
+def _export(
+        database: db.Database,
+        project: ent.Project) -> Iterator[bytes]:
+    yield _member('project.json', _json({
+        'version': VERSION,
+        'project': project.to_json()}))
+
+    counts = {'prompts': 0, 'images': 0}
+    for prompt in database.prompts(project.id):
+        counts['prompts'] += 1
+        with database.transaction() as tx:
+            cached = database.load(
+                tx,
+                ent.ImageExecutorCacheID.from_prompt_id(prompt.id))
+        yield _member('prompts/{}.json'.format(prompt.id), _json({
+            'prompt': prompt.to_json(),
+            'cache': {
+                'step': cached.step,
+                'steps': cached.steps,
+                'strength': cached.strength,
+                'seed': cached.seed,
+                'latent': cached.latent is not None,
+            } if cached is not None else None}))
+        if cached is not None and cached.latent is not None:
+            yield _member('prompts/{}.latent'.format(prompt.id), cached.latent)
+
+        for image in database.images(prompt.id):
+            with database.transaction() as tx:
+                image = database.load(tx, image.id)
+            if image is None:
+                continue
+            yield _member('images/{}.json'.format(image.id), _json({
+                'image': {
+                    'id': str(image.id),
+                    'timestamp': image.timestamp,
+                    'content_type': image.content_type},
+                'prompt': str(prompt.id)}))
+            yield _member('images/{}.data'.format(image.id), image.data)
+            counts['images'] += 1
+
+    yield _member('end.json', _json(counts))
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+def import_archive(database: db.Database, f: BinaryIO) -> ent.Project:
+    """Imports a project from an archive.
+
+    The archive is read sequentially, and all entities are inserted in a single
+    transaction, in batches of :data:`BATCH_SIZE`. The entities retain their
+    IDs, so none of them may exist. Deleting a project does not delete its
+    prompts, so an archive cannot be imported again after its project was
+    deleted.
+
+    This function blocks for the duration of the import.
+
+    :param database: The application database.
+
+    :param f: The archive.
+
+    :return: the imported project
+
+    :raise InvalidArchive: if the archive is malformed
+
+    :raise ProjectExists: if the project already exists
+
+    :raise EntityExists: if another entity in the archive already exists
+    """
+    try:
+        with tarfile.open(fileobj=f, mode='r|') as archive, \
+                database.transaction() as tx:
+            return _import(database, tx, archive)
+    except (InvalidArchive, EntityExists):
+        raise
+    except (tarfile.TarError, KeyError, TypeError, ValueError) as e:
+        raise InvalidArchive(str(e))
+
+
+def _import(
+        database: db.Database,
+        tx: db.Cur,
+        archive: tarfile.TarFile) -> ent.Project:
+    members = iter(archive)
+
+    def read(member: tarfile.TarInfo) -> bytes:
+        if not member.isfile():
+            raise InvalidArchive('unexpected member {}'.format(member.name))
+        return archive.extractfile(member).read()
+
+    def flush():
+        existing = database.existing(tx, (entity.id for entity in entities))
+        if existing:
+            raise EntityExists(str(existing[0]))
+        database.create_many(tx, entities)
+        database.link_many(tx, links)
+
+    member = next(members, None)
+    if member is None or member.name != 'project.json':
+        raise InvalidArchive('missing project.json')
+    data = json.loads(read(member))
+    if data.get('version') != VERSION:
+        raise InvalidArchive('unsupported version {}'.format(
+            data.get('version')))
+    project = ent.Project.from_json(data['project'])
+    if database.load(tx, project.id) is not None:
+        raise ProjectExists(str(project.id))
+
+    entities: List[ent.Entity] = [project]
+    links = []
+    prompts = {}
+    images = set()
+    pending = None
+    counts = None
+    for member in members:
+        if member.name == 'end.json' and pending is None:
+            counts = json.loads(read(member))
+            break
+
+        (kind, name) = member.name.split('/', 1)
+        (id, suffix) = name.rsplit('.', 1)
+
+        # Members carrying binary data complete the preceding entity
+        if pending is not None:
+            if (kind, id, suffix) == pending[0]:
+                pending[1](read(member))
+                pending = None
+                continue
+            else:
+                raise InvalidArchive('missing {}/{}.{}'.format(*pending[0]))
+
+        if (kind, suffix) == ('prompts', 'json'):
+            data = json.loads(read(member))
+            prompt = ent.Prompt.from_json(data['prompt'])
+            if prompt.project != project.id or str(prompt.id) != id \
+                    or prompt.id in prompts:
+                raise InvalidArchive('invalid prompt {}'.format(id))
+            prompts[prompt.id] = prompt
+            entities.append(prompt)
+
+            cache = data['cache']
+            if cache is not None:
+                cached = ent.ImageExecutorCache(
+                    id=ent.ImageExecutorCacheID.from_prompt_id(prompt.id),
+                    step=cache['step'],
+                    steps=cache['steps'],
+                    strength=cache['strength'],
+                    latent=None,
+                    seed=cache['seed'])
+                entities.append(cached)
+                if cache['latent']:
+                    pending = (
+                        ('prompts', id, 'latent'),
+                        lambda data, cached=cached: setattr(
+                            cached, 'latent', data))
+        elif (kind, suffix) == ('images', 'json'):
+            data = json.loads(read(member))
+            image = ent.Image(
+                id=ent.ImageID.from_string(data['image']['id']),
+                timestamp=0,
+                content_type=data['image']['content_type'],
+                data=None)
+
+            # Timestamps are stored with a higher precision than declared
+            image.timestamp = float(data['image']['timestamp'])
+            prompt = prompts.get(ent.PromptID.from_string(data['prompt']))
+            if prompt is None or str(image.id) != id or image.id in images:
+                raise InvalidArchive('invalid image {}'.format(id))
+            entities.append(image)
+            links.append((prompt, image))
+            images.add(image.id)
+            pending = (
+                ('images', id, 'data'),
+                lambda data, image=image: setattr(image, 'data', data))
+        else:
+            raise InvalidArchive('unexpected member {}'.format(member.name))
+
+        # Flush completed entities; the last one may still await its data
+        if pending is None and len(entities) >= BATCH_SIZE:
+            flush()
+            entities = []
+            links = []
+
+    if counts != {'prompts': len(prompts), 'images': len(images)}:
+        raise InvalidArchive('truncated archive')
+    flush()
+
+    return project
+
+
+def _member(name: str, data: bytes) -> bytes:
+    """Encodes an archive member.
+
+    :param name: The member name.
+
+    :param data: The member data.
+
+    :return: the header, data and padding of the member
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    remainder = info.size % tarfile.BLOCKSIZE
+    return info.tobuf(tarfile.USTAR_FORMAT) + data + (
+        tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b'')
+
+
+def _json(value: dict) -> bytes:
+    """Encodes a JSON archive member.
+
+    :param value: The value to encode.
+
+    :return: encoded JSON
+    """
+    return json.dumps(value).encode('utf-8')
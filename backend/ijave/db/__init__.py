@@ -6,22 +6,147 @@ This module provides a simple helper to access typed data from the database
 handle database migrations.
 """
 
+import functools
+import itertools
 import logging
+import os
+import re
 import sqlite3
+import time
 
 from contextlib import contextmanager
 from datetime import datetime
 from threading import RLock
-from typing import Generator, Optional, Sequence
+from typing import (
+    Callable, Generator, Iterable, Iterator, List, Optional, Sequence, Tuple)
 
-from .. import ent
-from . import migrations
+from .. import ent, metrics
+from . import backup as _backup, migrations
+from .mapping import BATCH_SIZES, ENTITIES, IDS, MAPPINGS, Mapping, chunks
+from .trace import Tracer, call_site
 
 
 Cur = sqlite3.Cursor
 
 LOG = logging.getLogger(__name__)
 
+#: The kinds of entities whose changes are recorded, and their ID types.
+CHANGE_KINDS = {
+    mapping.change_kind: mapping.id
+    for mapping in MAPPINGS
+    if mapping.change_kind is not None}
+
+#: The number of prepared statements cached by the connection; this must
+#: hold all statements generated by the entity mappings, and more.
+STATEMENT_CACHE_SIZE = 512
+
+#: The number of transactions.
+TRANSACTIONS = metrics.counter(
+    'ijave_db_transactions_total',
+    'The number of database transactions.',
+    ('outcome',))
+
+#: The time spent waiting for the database lock.
+LOCK_WAIT_SECONDS = metrics.histogram(
+    'ijave_db_lock_wait_seconds',
+    'The time spent waiting for the database lock.')
+
+#: The time taken to execute statements.
+QUERY_SECONDS = metrics.histogram(
+    'ijave_db_query_seconds',
+    'The time taken to execute database statements, by kind of statement '
+    'and first table.',
+    ('statement',))
+
+#: The statements selecting the latest image of up to a number of prompts,
+#: keyed on the number of prompts.
+_ICONS = {
+    size: '''
+        SELECT Prompt_Image.prompt, Image.id, MAX(Image.timestamp)
+        FROM Prompt_Image
+        JOIN Image
+            ON Image.id = Prompt_Image.image
+        WHERE Prompt_Image.prompt IN ({})
+        GROUP BY Prompt_Image.prompt'''.format(', '.join('?' * size))
+    for size in BATCH_SIZES}
+
+#: Matches the table on which a statement operates.
+_STATEMENT_TABLE = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(\w+)',
+    re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _statement(query: str) -> str:
+    """Generates a short name for a statement, such as ``'SELECT Prompt'``.
+
+    The name consists of the first keyword of the statement and the first
+    table it refers to, so the number of names is bounded by the number of
+    tables.
+
+    :param query: The SQL statement.
+
+    :return: a name
+    """
+    words = query.split(None, 1)
+    if not words:
+        return ''
+    match = _STATEMENT_TABLE.search(query)
+    return '{} {}'.format(words[0].upper(), match.group(1)) \
+        if match else words[0].upper()
+
+
+@functools.lru_cache(maxsize=1024)
+def _modifies(query: str) -> bool:
+    """Determines whether a statement may modify the database.
+
+    :param query: The SQL statement.
+
+    :return: whether the statement is not a query
+    """
+    return not _statement(query).startswith(('SELECT', 'EXPLAIN', 'PRAGMA'))
+
+
+class Cursor(sqlite3.Cursor):
+    """A cursor recording the duration of every statement it executes.
+
+    Only the time taken by ``execute`` is recorded, which includes computing
+    the first row, but not the time taken to fetch following rows.
+    """
+    #: The tracer to which to report statements, if tracing is enabled.
+    tracer: Optional[Tracer] = None
+
+    #: The statements modifying the database executed by this cursor, if
+    #: they are recorded for a standby.
+    statements: Optional[List[_backup.Statement]] = None
+
+    def execute(self, query: str, *args) -> 'Cursor':
+        if self.statements is not None and _modifies(query):
+            self.statements.append((query, args[0] if args else (), False))
+        start_time = time.perf_counter()
+        try:
+            return super().execute(query, *args)
+        finally:
+            duration = time.perf_counter() - start_time
+            QUERY_SECONDS.observe(duration, statement=_statement(query))
+            if self.tracer is not None:
+                self.tracer.statement(
+                    self, query, args[0] if args else (), duration)
+
+    def executemany(self, query: str, *args) -> 'Cursor':
+        if self.statements is not None and _modifies(query):
+            # The parameters may be an iterator
+            args = (list(args[0]),) + args[1:]
+            self.statements.append((query, args[0], True))
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(query, *args)
+        finally:
+            duration = time.perf_counter() - start_time
+            QUERY_SECONDS.observe(duration, statement=_statement(query))
+            if self.tracer is not None:
+                self.tracer.statement(self, query, None, duration)
+
 
 @contextmanager
 def transaction(conn: sqlite3.Connection) -> Generator[
@@ -49,19 +174,88 @@ def transaction(conn: sqlite3.Connection) -> Generator[
         cur.close()
 
 
+def _entity_mapping(entity: ent.Entity) -> Mapping:
+    """Looks up the mapping for an entity.
+
+    :param entity: The entity.
+
+    :return: a mapping
+
+    :raise ValueError: if the entity type is not supported
+    """
+    try:
+        return ENTITIES[type(entity)]
+    except KeyError:
+        raise ValueError(entity)
+
+
+def _id_mapping(id: ent.ID) -> Mapping:
+    """Looks up the mapping for an entity ID.
+
+    :param id: The entity ID.
+
+    :return: a mapping
+
+    :raise ValueError: if the entity ID type is not supported
+    """
+    try:
+        return IDS[type(id)]
+    except KeyError:
+        raise ValueError(id)
+
+
+def _limit(limit: Optional[int]) -> int:
+    """Converts an optional row limit to a value for a ``LIMIT`` clause.
+
+    :param limit: The maximum number of rows, or ``None`` for no limit.
+
+    :return: a limit
+    """
+    return limit if limit is not None else -1
+
+
 class Database:
+    #: The number of rows fetched at a time by listings.
+    BATCH_SIZE = 256
+
     def __init__(self, database):
         """A class providing typed access to the database.
 
         :param data: The database connection string.
         """
         self._lock = RLock()
+        self._tracer = None
+        self._journal = None
         self._conn = sqlite3.connect(
             database,
             isolation_level=None,
-            check_same_thread=False)
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE)
+
+        # This only takes effect for new databases; existing databases are
+        # converted by vacuum
+        self._conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
         migrations.apply(self._conn)
 
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        """The tracer recording transactions and statements, or ``None`` if
+        tracing is disabled.
+        """
+        return self._tracer
+
+    def trace(self, tracer: Optional[Tracer]):
+        """Enables or disables tracing.
+
+        :param tracer: The tracer to which to report transactions and
+            statements, or ``None`` to disable tracing.
+        """
+        with self._lock:
+            self._conn.set_trace_callback(None)
+            if tracer is not None:
+                tracer.install(self._conn)
+            self._tracer = tracer
+
     @contextmanager
     def transaction(self) -> Generator[sqlite3.Cursor, None, None]:
         """Opens a transaction to the database and provides a cursor as a
@@ -69,9 +263,19 @@ class Database:
 
         :return: an active transaction
         """
+        tracer = self._tracer
+        site = call_site() if tracer is not None else None
+        start_time = time.perf_counter()
         with self._lock:
-            cur = self._conn.cursor()
+            acquired = time.perf_counter()
+            LOCK_WAIT_SECONDS.observe(acquired - start_time)
+            cur = self._conn.cursor(Cursor)
+            cur.tracer = tracer
+            journal = self._journal
+            committed = False
             cur.execute('BEGIN TRANSACTION')
+            if journal is not None:
+                cur.statements = []
             try:
                 yield cur
             except Exception as e:
@@ -79,11 +283,27 @@ class Database:
                     'ROLLBACK because of uncaught exception: %s',
                     e)
                 self._conn.rollback()
+                TRANSACTIONS.inc(outcome='rollback')
                 raise
             else:
                 self._conn.commit()
+                TRANSACTIONS.inc(outcome='commit')
+                committed = True
+                if journal is not None:
+                    if journal.closed:
+                        self._journal = None
+                    elif cur.statements:
+                        journal.append(cur.statements)
             finally:
                 cur.close()
+                if tracer is not None:
+                    released = time.perf_counter()
+                    tracer.transaction(
+                        site,
+                        time.time() - (released - start_time),
+                        acquired - start_time,
+                        released - acquired,
+                        committed)
 
     def create(self, tx: sqlite3.Cursor, entity: ent.Entity):
         """Creates an entity in the database.
@@ -96,43 +316,33 @@ class Database:
 
         :raise ValueError: if the entity type is not supported
         """
-        if isinstance(entity, ent.Project):
-            tx.execute('''
-                INSERT INTO Project(id, name, description, image_width,
-                    image_height)
-                VALUES(?, ?, ?, ?, ?)''', (
-                    entity.id,
-                    entity.name,
-                    entity.description,
-                    entity.image_width,
-                    entity.image_height))
-        elif isinstance(entity, ent.Prompt):
-            tx.execute('''
-                INSERT INTO Prompt(id, project, text)
-                VALUES(?, ?, ?)''', (
-                    entity.id,
-                    entity.project,
-                    entity.text))
-        elif isinstance(entity, ent.Image):
-            tx.execute('''
-                INSERT INTO Image(id, timestamp, content_type, data)
-                VALUES(?, ?, ?, ?)''', (
-                    entity.id,
-                    entity.timestamp,
-                    entity.content_type,
-                    entity.data))
-        elif isinstance(entity, ent.ImageExecutorCache):
-            tx.execute('''
-                INSERT INTO ImageExecutorCache(id, step, steps, strength,
-                    latent)
-                VALUES(?, ?, ?, ?, ?)''', (
-                    entity.id,
-                    entity.step,
-                    entity.steps,
-                    entity.strength,
-                    entity.latent))
-        else:
-            raise ValueError(entity)
+        mapping = _entity_mapping(entity)
+        tx.execute(mapping.insert, mapping.values(entity))
+        self._changed(tx, entity.id)
+
+    def create_many(
+            self,
+            tx: sqlite3.Cursor,
+            entities: Iterable[ent.Entity]):
+        """Creates several entities in the database.
+
+        Consecutive entities of the same type are inserted using a single
+        statement.
+
+        :param tx: An ongoing transaction.
+
+        :param entities: The entities to create. None of them may already
+            exist.
+
+        :raise ValueError: if an entity type is not supported
+        """
+        for (_, group) in itertools.groupby(entities, type):
+            group = list(group)
+            mapping = _entity_mapping(group[0])
+            tx.executemany(mapping.insert, (
+                mapping.values(entity)
+                for entity in group))
+            self._changed_many(tx, mapping, [entity.id for entity in group])
 
     def load(self, tx: sqlite3.Cursor, id: ent.ID) -> Optional[ent.Entity]:
         """Loads an entity from the database.
@@ -143,69 +353,72 @@ class Database:
 
         :raise ValueError: if the entity ID type is not supported
         """
-        if isinstance(id, ent.ProjectID):
-            tx.execute(
-                    '''
-                    SELECT name, description, image_width, image_height
-                    FROM Project
-                    WHERE id = ?''', (
-                        id,))
-            r = tx.fetchone()
-            if r is not None:
-                (name, description, image_width, image_height) = r
-                return ent.Project(
-                    id=id,
-                    name=name,
-                    description=description,
-                    image_width=image_width,
-                    image_height=image_height)
-        elif isinstance(id, ent.PromptID):
-            tx.execute(
-                    '''
-                    SELECT project, text
-                    FROM Prompt
-                    WHERE id = ?''', (
-                        id,))
-            r = tx.fetchone()
-            if r is not None:
-                (project, text) = r
-                return ent.Prompt(
-                    id=id,
-                    project=ent.ProjectID.from_uuid(project),
-                    text=text)
-        elif isinstance(id, ent.ImageID):
-            tx.execute(
-                    '''
-                    SELECT timestamp, content_type, data
-                    FROM Image
-                    WHERE id = ?''', (
-                        id,))
-            r = tx.fetchone()
-            if r is not None:
-                (timestamp, content_type, data) = r
-                return ent.Image(
-                    id=id,
-                    timestamp=timestamp,
-                    content_type=content_type,
-                    data=data)
-        elif isinstance(id, ent.ImageExecutorCacheID):
-            tx.execute(
-                    '''
-                    SELECT step, steps, strength, latent
-                    FROM ImageExecutorCache
-                    WHERE id = ?''', (
-                        id,))
-            r = tx.fetchone()
-            if r is not None:
-                (step, steps, strength, latent) = r
-                return ent.ImageExecutorCache(
-                    id=id,
-                    step=step,
-                    steps=steps,
-                    strength=strength,
-                    latent=latent)
-        else:
-            raise ValueError(id)
+        mapping = _id_mapping(id)
+        r = tx.execute(mapping.select, (id,)).fetchone()
+        if r is not None:
+            return mapping.row(id, r)
+
+    def load_many(
+            self,
+            tx: sqlite3.Cursor,
+            ids: Iterable[ent.ID]) -> List[Optional[ent.Entity]]:
+        """Loads several entities from the database.
+
+        Entities of the same type are loaded using a single statement for
+        every :data:`ijave.db.mapping.MAX_BATCH_SIZE` IDs.
+
+        :param tx: An ongoing transaction.
+
+        :param ids: The IDs of the entities to load. They may be of different
+            types.
+
+        :return: the entities, in the same order as ``ids``, with ``None``
+            for entities that do not exist
+
+        :raise ValueError: if an entity ID type is not supported
+        """
+        ids = list(ids)
+        groups = {}
+        for id in ids:
+            groups.setdefault(_id_mapping(id), []).append(id)
+
+        loaded = {}
+        for (m, group) in groups.items():
+            for (size, chunk) in chunks(group):
+                for r in tx.execute(m.select_many(size), chunk):
+                    loaded[(m, r[0])] = m.entity.from_row(r)
+
+        return [loaded.get((_id_mapping(id), id.bytes)) for id in ids]
+
+    def existing(
+            self,
+            tx: sqlite3.Cursor,
+            ids: Iterable[ent.ID]) -> List[ent.ID]:
+        """Determines which of several entities exist.
+
+        Entities of the same type are looked up using a single statement for
+        every :data:`ijave.db.mapping.MAX_BATCH_SIZE` IDs, without loading
+        them.
+
+        :param tx: An ongoing transaction.
+
+        :param ids: The IDs to look up. They may be of different types.
+
+        :return: the IDs of the entities that exist, grouped by type
+
+        :raise ValueError: if an entity ID type is not supported
+        """
+        groups = {}
+        for id in ids:
+            groups.setdefault(_id_mapping(id), {})[id] = None
+
+        result = []
+        for (m, group) in groups.items():
+            for (size, chunk) in chunks(list(group)):
+                result.extend(
+                    m.id.trusted(id)
+                    for (id,) in tx.execute(m.existing(size), chunk))
+        return result
 
     def update(self, tx: sqlite3.Cursor, entity: ent.Entity) -> bool:
         """Updates an entity in the database.
@@ -218,48 +431,13 @@ class Database:
 
         :raise ValueError: if the entity type is not supported
         """
-        if isinstance(entity, ent.Project):
-            tx.execute('''
-                UPDATE Project
-                SET name = ?, description = ?, image_width = ?,
-                    image_height = ?
-                WHERE id = ?''', (
-                    entity.name,
-                    entity.description,
-                    entity.image_width,
-                    entity.image_height,
-                    entity.id))
-        elif isinstance(entity, ent.Prompt):
-            tx.execute('''
-                UPDATE Prompt
-                SET project = ?, text = ?
-                WHERE id = ?''', (
-                    entity.project,
-                    entity.text,
-                    entity.id))
-        elif isinstance(entity, ent.Image):
-            tx.execute('''
-                UPDATE Image
-                SET timestamp = ?, content_type = ?, data = ?
-                WHERE id = ?''', (
-                    entity.timestamp,
-                    entity.content_type,
-                    entity.data,
-                    entity.id))
-        elif isinstance(entity, ent.ImageExecutorCache):
-            tx.execute('''
-                UPDATE ImageExecutorCache
-                SET step = ?, steps = ?, strength = ?, latent = ?
-                WHERE id = ?''', (
-                    entity.step,
-                    entity.steps,
-                    entity.strength,
-                    entity.latent,
-                    entity.id))
-        else:
-            raise ValueError(entity)
+        mapping = _entity_mapping(entity)
+        tx.execute(mapping.update, mapping.update_values(entity))
 
-        return tx.rowcount > 0
+        updated = tx.rowcount > 0
+        if updated:
+            self._changed(tx, entity.id)
+        return updated
 
     def delete(self, tx: sqlite3.Cursor, id: ent.ID) -> bool:
         """Deletes an entiity from the database.
@@ -272,30 +450,46 @@ class Database:
 
         :raise ValueError: if the entity type is not supported
         """
-        if isinstance(id, ent.ProjectID):
-            tx.execute('''
-                DELETE FROM Project
-                WHERE id = ?''', (
-                    id,))
-        elif isinstance(id, ent.PromptID):
-            tx.execute('''
-                DELETE FROM Prompt
-                WHERE id = ?''', (
-                    id,))
-        elif isinstance(id, ent.ImageID):
-            tx.execute('''
-                DELETE FROM Image
-                WHERE id = ?''', (
-                    id,))
-        elif isinstance(id, ent.ImageExecutorCacheID):
-            tx.execute('''
-                DELETE FROM ImageExecutorCache
-                WHERE id = ?''', (
-                    id,))
-        else:
-            raise ValueError(id)
+        for query in _id_mapping(id).delete(1):
+            tx.execute(query, (id,))
+
+        deleted = tx.rowcount > 0
+        if deleted:
+            self._changed(tx, id, True)
+        return deleted
+
+    def delete_many(self, tx: sqlite3.Cursor, ids: Iterable[ent.ID]) -> int:
+        """Deletes several entities from the database.
 
-        return tx.rowcount > 0
+        Entities of the same type are deleted using a single statement for
+        every :data:`ijave.db.mapping.MAX_BATCH_SIZE` IDs.
+
+        :param tx: An ongoing transaction.
+
+        :param ids: The IDs of the entities to delete. They may be of
+            different types.
+
+        :return: the number of entities actually deleted
+
+        :raise ValueError: if an entity ID type is not supported
+        """
+        groups = {}
+        for id in ids:
+            groups.setdefault(_id_mapping(id), {})[id] = None
+
+        result = 0
+        for (m, group) in groups.items():
+            for (size, chunk) in chunks(list(group)):
+                if m.change_kind is not None:
+                    existing = [
+                        m.id.trusted(id)
+                        for (id,) in tx.execute(m.existing(size), chunk)]
+                for query in m.delete(size):
+                    tx.execute(query, chunk)
+                result += tx.rowcount
+                if m.change_kind is not None:
+                    self._changed_many(tx, m, existing, True)
+        return result
 
     def link(self, tx: sqlite3.Cursor, parent: ent.Entity, child: ent.Entity):
         """Links two entitites.
@@ -320,6 +514,31 @@ class Database:
         else:
             raise ValueError((parent, child))
 
+    def link_many(
+            self,
+            tx: sqlite3.Cursor,
+            pairs: Iterable[Tuple[ent.Entity, ent.Entity]]):
+        """Links several pairs of entities using a single statement.
+
+        See :meth:`link` for the supported pairs.
+
+        :param tx: An ongoing transaction.
+
+        :param pairs: Tuples ``(parent, child)``.
+        """
+        def values():
+            for (parent, child) in pairs:
+                if isinstance(parent, ent.Prompt) \
+                        and isinstance(child, ent.Image):
+                    yield (parent.id, child.id)
+                else:
+                    raise ValueError((parent, child))
+
+        tx.executemany('''
+            INSERT INTO Prompt_Image(prompt, image)
+            VALUES(?, ?)
+            ''', values())
+
     def icon(self, tx: sqlite3.Cursor, id: ent.ID) -> Optional[ent.ImageID]:
         """Loads the icon ID associated with an entity.
 
@@ -368,7 +587,30 @@ class Database:
 
         if r is not None:
             (id,) = r
-            return ent.ImageID.from_uuid(id)
+            return ent.ImageID.trusted(id)
+
+    def icons(
+            self,
+            tx: sqlite3.Cursor,
+            ids: Iterable[ent.PromptID]) -> List[Optional[ent.ImageID]]:
+        """Loads the icon IDs of several prompts.
+
+        The icon of a prompt is its latest image, as for :meth:`icon`.
+
+        :param tx: An ongoing transaction.
+
+        :param ids: The prompt IDs.
+
+        :return: the image IDs, in the same order as ``ids``, with ``None``
+            for prompts without images
+        """
+        ids = list(ids)
+        loaded = {}
+        if ids:
+            for (size, chunk) in chunks(ids):
+                for (prompt, image, _) in tx.execute(_ICONS[size], chunk):
+                    loaded[prompt] = ent.ImageID.trusted(image)
+        return [loaded.get(id.bytes) for id in ids]
 
     def projects(
             self) -> Sequence[ent.Project]:
@@ -377,17 +619,38 @@ class Database:
         :return: a listing of all projects
         """
         return (
-            ent.Project(
-                id=ent.ProjectID.from_uuid(id),
-                name=name,
-                description=description,
-                image_width=image_width,
-                image_height=image_height)
-            for (id, name, description, image_width, image_height) in
-            self._conn.execute(
-                '''
-                SELECT id, name, description, image_width, image_height
-                FROM Project'''))
+            ent.Project.from_row(row)
+            for batch in self.project_rows()
+            for row in batch)
+
+    def project_rows(
+            self,
+            after: Optional[ent.ProjectID] = None,
+            limit: Optional[int] = None) -> Iterator[List[tuple]]:
+        """Lists projects as raw database rows ordered by ID.
+
+        The rows contain the values of the fields of :class:`ent.Project` in
+        declaration order.
+
+        :param after: If specified, only projects with an ID greater than this
+            are listed.
+
+        :param limit: The maximum number of rows to list.
+
+        :return: an iterator over batches of rows
+        """
+        return self._batches(
+            '''
+            SELECT id, name, description, image_width, image_height
+            FROM Project
+            WHERE {}
+            ORDER BY id ASC
+            LIMIT ?''',
+            'id > ?',
+            lambda row: (row[0],),
+            (),
+            (after,) if after is not None else None,
+            limit)
 
     def prompts(
             self,
@@ -399,41 +662,508 @@ class Database:
         :return: all prompts associated with the project
         """
         return (
-            ent.Prompt(
-                id=ent.PromptID.from_uuid(id),
-                project=ent.ProjectID.from_uuid(project),
-                text=text)
-            for (id, project, text) in self._conn.execute(
-                '''
-                SELECT id, project, text
-                FROM Prompt
-                WHERE project = ?''', (
-                    project,)))
+            ent.Prompt.from_row(row)
+            for batch in self.prompt_rows(project)
+            for row in batch)
+
+    def prompt_rows(
+            self,
+            project: ent.ProjectID,
+            after: Optional[ent.PromptID] = None,
+            limit: Optional[int] = None) -> Iterator[List[tuple]]:
+        """Loads prompts belonging to a project as raw database rows ordered by
+        ID.
+
+        The rows contain the values of the fields of :class:`ent.Prompt` in
+        declaration order.
+
+        :param project: The project ID.
+
+        :param after: If specified, only prompts with an ID greater than this
+            are listed.
+
+        :param limit: The maximum number of rows to list.
+
+        :return: an iterator over batches of rows
+        """
+        return self._batches(
+            '''
+            SELECT id, project, text
+            FROM Prompt
+            WHERE project = ? AND {}
+            ORDER BY id ASC
+            LIMIT ?''',
+            'id > ?',
+            lambda row: (row[0],),
+            (project,),
+            (after,) if after is not None else None,
+            limit)
 
     def images(
             self,
             prompt: ent.PromptID) -> Sequence[ent.Image]:
         """Loads all images belonging to a prompt.
 
+        The image data is not loaded.
+
         :param prompt: The prompt ID.
 
         :return: all images associated with the prompt
         """
         return (
-            ent.Image(
-                id=ent.ImageID.from_uuid(id),
-                timestamp=timestamp,
-                content_type=content_type,
-                data=None)
-            for (id, content_type, timestamp) in self._conn.execute(
-                    '''
-                    SELECT Image.id, Image.content_type, Image.timestamp
-                    FROM Image
-                    LEFT JOIN Prompt_Image
-                        ON Prompt_Image.image = Image.id
-                    WHERE Prompt_Image.prompt = ?
-                    ORDER BY Image.timestamp ASC''', (
-                        prompt,)))
+            ent.Image.from_row(row)
+            for batch in self.image_rows(prompt)
+            for row in batch)
+
+    def image_rows(
+            self,
+            prompt: ent.PromptID,
+            after: Optional[Tuple[float, ent.ImageID]] = None,
+            limit: Optional[int] = None) -> Iterator[List[tuple]]:
+        """Loads images belonging to a prompt as raw database rows ordered by
+        timestamp and ID.
+
+        The rows contain the values of the fields of :class:`ent.Image` in
+        declaration order. The image data is not loaded.
+
+        :param prompt: The prompt ID.
+
+        :param after: If specified, only images whose tuple ``(timestamp,
+            id)`` is greater than this are listed.
+
+        :param limit: The maximum number of rows to list.
+
+        :return: an iterator over batches of rows
+        """
+        return self._batches(
+            '''
+            SELECT Image.id, Image.timestamp, Image.content_type, NULL
+            FROM Image
+            LEFT JOIN Prompt_Image
+                ON Prompt_Image.image = Image.id
+            WHERE Prompt_Image.prompt = ? AND {}
+            ORDER BY Image.timestamp ASC, Image.id ASC
+            LIMIT ?''',
+            '(Image.timestamp, Image.id) > (?, ?)',
+            lambda row: (row[1], row[0]),
+            (prompt,),
+            after,
+            limit)
+
+    def image_executor_tasks(
+            self,
+            tx: sqlite3.Cursor) -> Sequence[ent.ImageExecutorTask]:
+        """Lists all queued image executor tasks.
+
+        The tasks are ordered by the time they were queued.
+
+        :param tx: An ongoing transaction.
+
+        :return: all image executor tasks
+        """
+        return [
+            ent.ImageExecutorTask.trusted(
+                ent.ImageExecutorTaskID.trusted(id),
+                priority,
+                timestamp,
+                lease,
+                attempts,
+                generation)
+            for (id, priority, timestamp, lease, attempts, generation)
+            in tx.execute(
+                '''
+                SELECT id, priority, timestamp, lease, attempts, generation
+                FROM ImageExecutorTask
+                ORDER BY timestamp ASC''')]
+
+    def compactable_prompts(
+            self,
+            tx: sqlite3.Cursor) -> Sequence[ent.PromptID]:
+        """Lists prompts with images not yet compacted.
+
+        :param tx: An ongoing transaction.
+
+        :return: the IDs of all prompts with images newer than the last one
+            compacted
+        """
+        return [
+            ent.PromptID.trusted(id)
+            for (id,) in tx.execute(
+                '''
+                SELECT DISTINCT Prompt_Image.prompt
+                FROM Prompt_Image
+                LEFT JOIN Image
+                    ON Image.id = Prompt_Image.image
+                LEFT JOIN RetentionState
+                    ON RetentionState.id = Prompt_Image.prompt
+                WHERE RetentionState.timestamp IS NULL
+                    OR (Image.timestamp, Image.id) > (
+                        RetentionState.timestamp, RetentionState.image)''')]
+
+    def superseded_images(
+            self,
+            tx: sqlite3.Cursor,
+            prompt: ent.PromptID,
+            after: Optional[Tuple[float, ent.ImageID]],
+            before: float,
+            limit: int) -> Sequence[ent.Image]:
+        """Lists images of a prompt that have been superseded by a later image
+        ordered by timestamp and ID.
+
+        The latest image of the prompt is never listed. The image data is not
+        loaded.
+
+        :param tx: An ongoing transaction.
+
+        :param prompt: The prompt ID.
+
+        :param after: If specified, only images whose tuple ``(timestamp,
+            id)`` is greater than this are listed.
+
+        :param before: Only images older than this timestamp are listed.
+
+        :param limit: The maximum number of images to list.
+
+        :return: a list of images
+        """
+        return [
+            ent.Image.trusted(
+                ent.ImageID.trusted(id), timestamp, content_type, None)
+            for (id, timestamp, content_type) in tx.execute(
+                '''
+                SELECT Image.id, Image.timestamp, Image.content_type
+                FROM Image
+                LEFT JOIN Prompt_Image
+                    ON Prompt_Image.image = Image.id
+                WHERE Prompt_Image.prompt = ?
+                    AND Image.timestamp < ? {}
+                    AND Image.timestamp < (
+                        SELECT MAX(Latest.timestamp)
+                        FROM Image AS Latest
+                        LEFT JOIN Prompt_Image AS Latest_Link
+                            ON Latest_Link.image = Latest.id
+                        WHERE Latest_Link.prompt = ?)
+                ORDER BY Image.timestamp ASC, Image.id ASC
+                LIMIT ?'''.format(
+                    'AND (Image.timestamp, Image.id) > (?, ?)'
+                    if after is not None else ''),
+                (prompt, before) + (after or ()) + (prompt, limit))]
+
+    def evict_results(self, tx: sqlite3.Cursor, size: int) -> int:
+        """Evicts the least recently used cached results until the total size
+        of the cache does not exceed a limit.
+
+        :param tx: An ongoing transaction.
+
+        :param size: The maximum total size, in bytes, of the latents and
+            image data of the cached results.
+
+        :return: the number of results evicted
+        """
+        tx.execute(
+            '''
+            DELETE FROM ResultCache
+            WHERE id IN (
+                SELECT id
+                FROM (
+                    SELECT id, SUM(
+                        LENGTH(latent) + IFNULL(LENGTH(data), 0)) OVER (
+                            ORDER BY timestamp DESC, id ASC) AS total
+                    FROM ResultCache)
+                WHERE total > ?)''', (
+                size,))
+        return tx.rowcount
+
+    def changes(
+            self,
+            tx: sqlite3.Cursor,
+            since: int,
+            limit: Optional[int] = None) -> List[
+                Tuple[int, str, ent.ID, Optional[ent.Entity]]]:
+        """Lists the changes to projects and prompts made after a specific
+        change.
+
+        Only the latest change to every entity is retained, so the changes
+        since ``0`` is a listing of all entities.
+
+        :param tx: An ongoing transaction.
+
+        :param since: The sequence number of the last known change.
+
+        :param limit: The maximum number of changes to list.
+
+        :return: a list of tuples ``(sequence, kind, id, entity)`` ordered by
+            sequence number, where ``kind`` is a key in :data:`CHANGE_KINDS`
+            and ``entity`` is ``None`` if the entity has been deleted
+        """
+        rows = tx.execute(
+            '''
+            SELECT sequence, kind, id, deleted
+            FROM Change
+            WHERE sequence > ?
+            ORDER BY sequence ASC
+            LIMIT ?''', (
+                since,
+                _limit(limit))).fetchall()
+        ids = [CHANGE_KINDS[kind].trusted(id) for (_, kind, id, _) in rows]
+        entities = iter(self.load_many(tx, (
+            id
+            for (id, (_, _, _, deleted)) in zip(ids, rows)
+            if not deleted)))
+        return [
+            (sequence, kind, id, next(entities) if not deleted else None)
+            for (id, (sequence, kind, _, deleted)) in zip(ids, rows)]
+
+    def search(
+            self,
+            tx: sqlite3.Cursor,
+            query: str,
+            offset: int = 0,
+            limit: Optional[int] = None) -> List[
+                Tuple[str, ent.Entity]]:
+        """Searches the text of projects and prompts.
+
+        Every word of ``query`` must occur in a matching project or prompt;
+        words are matched after stemming, and the last word also matches as a
+        prefix. Matches in project names rank higher than matches in project
+        descriptions and prompt texts.
+
+        Prompts created before search was added are indexed in the
+        background, so they may be missing for a while after upgrading.
+
+        :param tx: An ongoing transaction.
+
+        :param query: The words to search for.
+
+        :param offset: The number of matches to skip. Documents whose entity
+            no longer exists are not counted.
+
+        :param limit: The maximum number of matches to list.
+
+        :return: a list of tuples ``(kind, entity)`` ordered by relevance,
+            where ``kind`` is a key in :data:`CHANGE_KINDS`
+        """
+        words = query.split()
+        if not words:
+            return []
+        rows = tx.execute(
+            '''
+            SELECT SearchDocument.kind, SearchDocument.id
+            FROM Search
+            JOIN SearchDocument
+                ON SearchDocument.document = Search.rowid
+            LEFT JOIN Project
+                ON Project.id = SearchDocument.id
+            LEFT JOIN Prompt
+                ON Prompt.id = SearchDocument.id
+            WHERE Search MATCH ?
+                AND (Project.id IS NOT NULL OR Prompt.id IS NOT NULL)
+            ORDER BY Search.rank
+            LIMIT ?
+            OFFSET ?''', (
+                ' '.join(
+                    '"{}"'.format(word.replace('"', '""'))
+                    for word in words) + '*',
+                _limit(limit),
+                offset)).fetchall()
+        entities = self.load_many(tx, (
+            CHANGE_KINDS[kind].trusted(id)
+            for (kind, id) in rows))
+        return [
+            (kind, entity)
+            for ((kind, _), entity) in zip(rows, entities)]
+
+    def _changed(
+            self,
+            tx: sqlite3.Cursor,
+            id: ent.ID,
+            deleted: bool = False):
+        """Records a change to an entity.
+
+        Changes are recorded only for the kinds of entities listed in
+        :data:`CHANGE_KINDS`; for other entities this method does nothing.
+
+        :param tx: An ongoing transaction.
+
+        :param id: The ID of the changed entity.
+
+        :param deleted: Whether the entity was deleted.
+        """
+        mapping = IDS.get(type(id))
+        if mapping is not None:
+            self._changed_many(tx, mapping, (id,), deleted)
+
+    def _changed_many(
+            self,
+            tx: sqlite3.Cursor,
+            mapping: Mapping,
+            ids: Sequence[ent.ID],
+            deleted: bool = False):
+        """Records changes to several entities of the same type.
+
+        :param tx: An ongoing transaction.
+
+        :param mapping: The mapping of the entities.
+
+        :param ids: The IDs of the changed entities.
+
+        :param deleted: Whether the entities were deleted.
+        """
+        if mapping.change_kind is not None and ids:
+            tx.executemany('''
+                INSERT OR REPLACE INTO Change(kind, id, deleted)
+                VALUES(?, ?, ?)''', (
+                    (mapping.change_kind, id, deleted)
+                    for id in ids))
+
+    def _batches(
+            self,
+            query: str,
+            keyset: str,
+            key: Callable[[tuple], tuple],
+            parameters: tuple = (),
+            after: Optional[tuple] = None,
+            limit: Optional[int] = None) -> Iterator[List[tuple]]:
+        """Executes a keyset paginated query and yields its rows in batches.
+
+        Every batch is fetched by a separate query in its own transaction,
+        resuming after the key of the last row of the previous batch, so no
+        cursor is kept open while the batches are consumed and other
+        transactions may run in between.
+
+        :param query: The query. Its placeholder ``{}`` is replaced by
+            ``keyset``, or by a condition that always holds for the first
+            batch if ``after`` is not specified, and its last parameter must
+            be the ``LIMIT``.
+
+        :param keyset: The condition selecting rows after a key, such as
+            ``id > ?``. It must match the order of the query.
+
+        :param key: A function returning the key of a row, bound to
+            ``keyset``.
+
+        :param parameters: The query parameters preceding the key.
+
+        :param after: If specified, only rows after this key are listed.
+
+        :param limit: The maximum number of rows to list.
+
+        :return: an iterator over batches of rows
+        """
+        remaining = _limit(limit)
+        while remaining != 0:
+            size = self.BATCH_SIZE if remaining < 0 \
+                else min(self.BATCH_SIZE, remaining)
+            with self.transaction() as tx:
+                batch = tx.execute(
+                    query.format(keyset if after is not None else '1'),
+                    parameters + (after or ()) + (size,)).fetchall()
+            if batch:
+                yield batch
+            if len(batch) < size:
+                break
+            after = key(batch[-1])
+            if remaining > 0:
+                remaining -= len(batch)
+
+    def background_migrations(self) -> List[migrations.Status]:
+        """Lists the background steps of applied migrations.
+
+        :return: the status of every background step, in order of version
+        """
+        with self.transaction() as tx:
+            return migrations.status(tx)
+
+    def backup(
+            self,
+            target: str,
+            pages: int = _backup.PAGES,
+            pause: float = _backup.PAUSE,
+            progress: Optional[Callable[[int, int], bool]] = None,
+            journal: Optional[_backup.Journal] = None) -> bool:
+        """Copies the database to a file while it is in use.
+
+        The database lock is held only while ``pages`` pages are copied. The
+        copy is written to a temporary file next to ``target``, which replaces
+        it once complete, so an existing backup is never left incomplete.
+
+        :param target: The path of the backup.
+
+        :param pages: The number of pages copied at a time.
+
+        :param pause: The number of seconds to wait between steps, without
+            holding the database lock.
+
+        :param progress: A function called after every step with the number
+            of pages remaining and the total number of pages. If it returns
+            true, the backup is abandoned.
+
+        :param journal: If specified, every transaction committed after the
+            backup completes is recorded to this journal, until it is closed.
+
+        :return: whether the backup completed
+        """
+        class Abandoned(Exception):
+            pass
+
+        def step(status: int, remaining: int, total: int):
+            if progress is not None and progress(remaining, total):
+                raise Abandoned()
+            if remaining > 0:
+                self._lock.release()
+                try:
+                    time.sleep(pause)
+                finally:
+                    self._lock.acquire()
+
+        temporary = target + '.tmp'
+        conn = sqlite3.connect(temporary)
+        try:
+            with self._lock:
+                self._conn.backup(conn, pages=pages, progress=step)
+                if journal is not None:
+                    self._journal = journal
+        except Abandoned:
+            conn.close()
+            os.remove(temporary)
+            return False
+        except Exception:
+            conn.close()
+            os.remove(temporary)
+            raise
+        else:
+            conn.close()
+            os.replace(temporary, target)
+            return True
+
+    def vacuum(self):
+        """Rebuilds the database file.
+
+        This reclaims all free space and enables incremental vacuum for
+        databases created before it was enabled by default. The database is
+        locked for the duration, which may be long for large databases.
+        """
+        with self._lock:
+            self._conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self._conn.execute('VACUUM')
+
+    def reclaim(self, pages: int) -> int:
+        """Reclaims free space using incremental vacuum.
+
+        This has no effect unless incremental vacuum is enabled; see
+        :meth:`vacuum`.
+
+        :param pages: The maximum number of pages to reclaim.
+
+        :return: the number of free pages remaining
+        """
+        with self._lock:
+            self._conn.execute(
+                'PRAGMA incremental_vacuum({})'.format(int(pages))).fetchall()
+            (mode,) = self._conn.execute('PRAGMA auto_vacuum').fetchone()
+            (free,) = self._conn.execute('PRAGMA freelist_count').fetchone()
+            # The mode 2 is INCREMENTAL
+            return free if mode == 2 else 0
 
     def now(self) -> int:
         """The current timestamp.
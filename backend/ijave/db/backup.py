@@ -0,0 +1,270 @@
+"""
+Online backup
+-------------
+
+Backups of the live database, and a continuously updated standby copy.
+
+Backups use the SQLite backup API on the connection of the application, a few
+pages at a time. The database lock is released between steps, so other
+transactions only wait for a single step, and pages modified by them are
+copied again by the backup.
+
+A standby is seeded by a backup, after which every statement modifying the
+database is recorded when its transaction commits and replayed on the standby
+in commit order.
+"""
+
+import logging
+import sqlite3
+import time
+
+from collections import deque
+from threading import Condition, Event, Thread
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from . import Database
+
+
+LOG = logging.getLogger(__name__)
+
+#: The default number of pages copied while holding the database lock.
+PAGES = 64
+
+#: The default number of seconds to wait between steps, without holding the
+#: database lock.
+PAUSE = 0.01
+
+#: The default number of seconds between scheduled backups.
+INTERVAL = 24 * 60 * 60
+
+#: The maximum number of committed transactions waiting to be replayed on a
+#: standby. If it falls further behind, it is seeded again.
+JOURNAL_SIZE = 10000
+
+#: A recorded statement; the tuple ``(query, parameters, many)``, where
+#: ``many`` is true if the statement was executed for every set of parameters
+#: in ``parameters``.
+Statement = Tuple[str, Any, bool]
+
+
+class Journal:
+    def __init__(self, size: int = JOURNAL_SIZE):
+        """The statements of committed transactions, waiting to be replayed.
+
+        :param size: The maximum number of transactions kept. If exceeded, the
+            journal is closed and marked as overflowed.
+        """
+        self.size = size
+        self.closed = False
+        self.overflowed = False
+        self._transactions = deque()
+        self._condition = Condition()
+
+    def append(self, statements: List[Statement]):
+        """Records a committed transaction.
+
+        This is called by the database while holding its lock, so
+        transactions are recorded in commit order.
+
+        :param statements: The statements modifying the database.
+        """
+        with self._condition:
+            if self.closed:
+                return
+            elif len(self._transactions) >= self.size:
+                self.closed = True
+                self.overflowed = True
+                self._transactions.clear()
+            else:
+                self._transactions.append(statements)
+            self._condition.notify()
+
+    def take(self, timeout: float) -> List[List[Statement]]:
+        """Removes all recorded transactions.
+
+        :param timeout: The maximum number of seconds to wait for a
+            transaction to be recorded.
+
+        :return: the recorded transactions, in commit order
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._transactions or self.closed,
+                timeout)
+            result = list(self._transactions)
+            self._transactions.clear()
+            return result
+
+    def close(self):
+        """Stops recording transactions.
+
+        The database stops using the journal when the next transaction
+        commits.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class Backup(Thread):
+    def __init__(
+            self,
+            database: 'Database',
+            target: str,
+            interval: float = INTERVAL,
+            pages: int = PAGES,
+            pause: float = PAUSE):
+        """A background thread periodically backing up the database.
+
+        A backup is made when the thread starts, and then every ``interval``
+        seconds.
+
+        :param database: The application database.
+
+        :param target: The path of the backup. This is passed through
+            :func:`time.strftime`, so that ``'backup-%Y%m%d.db'`` keeps a
+            backup per day.
+
+        :param interval: The number of seconds between backups.
+
+        :param pages: The number of pages copied at a time.
+
+        :param pause: The number of seconds to wait between steps.
+        """
+        super().__init__(daemon=True)
+        self._database = database
+        self._target = target
+        self._interval = interval
+        self._pages = pages
+        self._pause = pause
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            target = time.strftime(self._target)
+            start_time = time.monotonic()
+            try:
+                self._database.backup(
+                    target,
+                    pages=self._pages,
+                    pause=self._pause,
+                    progress=lambda remaining, total: self._stopped.is_set())
+            except Exception:
+                LOG.exception('Failed to back up database to %s', target)
+            else:
+                if not self._stopped.is_set():
+                    LOG.info(
+                        'Backed up database to %s in %.1f s',
+                        target,
+                        time.monotonic() - start_time)
+            self._stopped.wait(self._interval)
+
+    def stop(self):
+        """Stops the backup thread.
+
+        An ongoing backup is abandoned after its current step.
+        """
+        self._stopped.set()
+        self.join()
+
+
+class Standby(Thread):
+    def __init__(
+            self,
+            database: 'Database',
+            target: str,
+            pages: int = PAGES,
+            pause: float = PAUSE,
+            size: int = JOURNAL_SIZE):
+        """A background thread maintaining a standby copy of the database.
+
+        The standby is seeded by a backup, after which committed transactions
+        are replayed on it as they are recorded. If replaying fails, or the
+        standby falls too far behind, it is seeded again.
+
+        The standby must not be modified by anything else.
+
+        :param database: The application database.
+
+        :param target: The path of the standby.
+
+        :param pages: The number of pages copied at a time while seeding.
+
+        :param pause: The number of seconds to wait between steps while
+            seeding.
+
+        :param size: The maximum number of transactions waiting to be
+            replayed.
+        """
+        super().__init__(daemon=True)
+        self._database = database
+        self._target = target
+        self._pages = pages
+        self._pause = pause
+        self._size = size
+        self._stopped = Event()
+        self._journal: Optional[Journal] = None
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._journal = Journal(self._size)
+            try:
+                self._database.backup(
+                    self._target,
+                    pages=self._pages,
+                    pause=self._pause,
+                    progress=lambda remaining, total: self._stopped.is_set(),
+                    journal=self._journal)
+                if self._stopped.is_set():
+                    break
+                LOG.info('Seeded standby %s', self._target)
+                self._replay(self._journal)
+            except Exception:
+                LOG.exception('Failed to update standby %s', self._target)
+                self._stopped.wait(1.0)
+            finally:
+                self._journal.close()
+
+    def stop(self):
+        """Stops updating the standby.
+
+        Transactions recorded but not yet replayed are lost; the standby is
+        seeded again when a new thread starts.
+        """
+        self._stopped.set()
+        if self._journal is not None:
+            self._journal.close()
+        self.join()
+
+    def _replay(self, journal: Journal):
+        """Replays recorded transactions on the standby until the journal is
+        closed.
+
+        :param journal: The journal.
+        """
+        conn = sqlite3.connect(self._target, isolation_level=None)
+        try:
+            while not journal.closed:
+                for statements in journal.take(1.0):
+                    cur = conn.cursor()
+                    cur.execute('BEGIN TRANSACTION')
+                    try:
+                        for (query, parameters, many) in statements:
+                            if many:
+                                cur.executemany(query, parameters)
+                            else:
+                                cur.execute(query, parameters)
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    else:
+                        conn.commit()
+                    finally:
+                        cur.close()
+            if journal.overflowed:
+                LOG.warning(
+                    'Standby %s fell behind and is seeded again',
+                    self._target)
+        finally:
+            conn.close()
@@ -0,0 +1,208 @@
+"""
+Entity mappings
+---------------
+
+Declarative mappings from entity classes to database tables.
+
+Every entity class is mapped to a table whose columns are named after the
+fields of the class, with the ID as primary key. All SQL is generated once,
+when this module is imported, so every call sends the same statement text and
+is served from the statement cache of the connection.
+"""
+
+from dataclasses import fields
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Type
+
+from .. import ent
+
+
+#: The largest number of IDs bound to a single ``IN (...)`` clause. Batches
+#: are split into chunks of this size.
+MAX_BATCH_SIZE = 64
+
+#: The sizes of ``IN (...)`` clauses generated; a chunk of IDs is padded to
+#: the next size, so that only this many statements exist per mapping.
+BATCH_SIZES = tuple(
+    1 << n
+    for n in range(MAX_BATCH_SIZE.bit_length())
+    if 1 << n <= MAX_BATCH_SIZE)
+
+
+class Mapping:
+    def __init__(
+            self,
+            entity: Type[ent.Entity],
+            table: str,
+            change_kind: Optional[str] = None,
+            cascade: Sequence[str] = ()):
+        """A mapping from an entity class to a table.
+
+        :param entity: The entity class. The first field must be the ID.
+
+        :param table: The table name.
+
+        :param change_kind: The kind under which changes to entities are
+            recorded, if they are recorded.
+
+        :param cascade: Statements executed before entities are deleted. The
+            placeholder ``{ids}`` is replaced by the bound IDs, as in ``WHERE
+            project IN ({ids})``.
+        """
+        self.entity = entity
+        self.id = fields(entity)[0].type
+        self.table = table
+        self.change_kind = change_kind
+        self.columns = entity._names
+        self._readers = entity._readers[1:]
+
+        (key, *values) = self.columns
+
+        #: Inserts a single entity.
+        self.insert = 'INSERT INTO {}({}) VALUES({})'.format(
+            table,
+            ', '.join(self.columns),
+            ', '.join('?' for _ in self.columns))
+
+        #: Loads the fields of a single entity, except the ID.
+        self.select = 'SELECT {} FROM {} WHERE {} = ?'.format(
+            ', '.join(values),
+            table,
+            key)
+
+        #: Updates all fields of a single entity.
+        self.update = 'UPDATE {} SET {} WHERE {} = ?'.format(
+            table,
+            ', '.join('{} = ?'.format(column) for column in values),
+            key)
+
+        delete = tuple(cascade) + (
+            'DELETE FROM {} WHERE {} IN ({{ids}})'.format(table, key),)
+        existing = 'SELECT {0} FROM {1} WHERE {0} IN ({{ids}})'.format(
+            key, table)
+        select_many = 'SELECT {} FROM {} WHERE {} IN ({{ids}})'.format(
+            ', '.join(self.columns),
+            table,
+            key)
+        self._statements = {
+            size: (
+                tuple(
+                    query.format(ids=', '.join('?' * size))
+                    for query in delete),
+                existing.format(ids=', '.join('?' * size)),
+                select_many.format(ids=', '.join('?' * size)))
+            for size in BATCH_SIZES}
+
+    def values(self, entity: ent.Entity) -> tuple:
+        """Lists the values bound to :attr:`insert`.
+
+        :param entity: The entity.
+
+        :return: a tuple of values
+        """
+        return tuple(getattr(entity, name) for name in self.columns)
+
+    def update_values(self, entity: ent.Entity) -> tuple:
+        """Lists the values bound to :attr:`update`.
+
+        :param entity: The entity.
+
+        :return: a tuple of values
+        """
+        return tuple(getattr(entity, name) for name in self.columns[1:]) \
+            + (entity.id,)
+
+    def row(self, id: ent.ID, row: tuple) -> ent.Entity:
+        """Constructs an entity from a row returned by :attr:`select`.
+
+        :param id: The ID of the entity.
+
+        :param row: The row.
+
+        :return: an entity
+        """
+        return self.entity.trusted(id, *(
+            reader(value)
+            for (reader, value) in zip(self._readers, row)))
+
+    def delete(self, size: int) -> Tuple[str, ...]:
+        """The statements deleting up to ``size`` entities.
+
+        :param size: The number of IDs bound; one of :data:`BATCH_SIZES`.
+
+        :return: statements binding the same IDs, to be executed in order
+        """
+        return self._statements[size][0]
+
+    def existing(self, size: int) -> str:
+        """The statement selecting the IDs of existing entities.
+
+        :param size: The number of IDs bound; one of :data:`BATCH_SIZES`.
+
+        :return: a statement
+        """
+        return self._statements[size][1]
+
+    def select_many(self, size: int) -> str:
+        """The statement selecting all columns of entities, including the
+        ID, in declaration order.
+
+        :param size: The number of IDs bound; one of :data:`BATCH_SIZES`.
+
+        :return: a statement
+        """
+        return self._statements[size][2]
+
+
+def chunks(ids: Sequence[Any]) -> Iterable[Tuple[int, tuple]]:
+    """Splits IDs into chunks bound to ``IN (...)`` clauses.
+
+    Every chunk is padded by repeating its last ID, up to the next size in
+    :data:`BATCH_SIZES`.
+
+    :param ids: The IDs. This must not be empty.
+
+    :return: an iterator over tuples ``(size, values)``
+    """
+    for offset in range(0, len(ids), MAX_BATCH_SIZE):
+        chunk = tuple(ids[offset:offset + MAX_BATCH_SIZE])
+        size = next(size for size in BATCH_SIZES if size >= len(chunk))
+        yield (size, chunk + chunk[-1:] * (size - len(chunk)))
+
+
+#: All mappings.
+MAPPINGS = (
+    Mapping(
+        ent.Project,
+        'Project',
+        change_kind='project',
+        cascade=('''
+            INSERT OR REPLACE INTO Change(kind, id, deleted)
+            SELECT 'prompt', id, 1
+            FROM Prompt
+            WHERE project IN ({ids})''',)),
+    Mapping(
+        ent.Prompt,
+        'Prompt',
+        change_kind='prompt'),
+    Mapping(
+        ent.Image,
+        'Image',
+        cascade=('''
+            DELETE FROM Prompt_Image
+            WHERE image IN ({ids})''',)),
+    Mapping(ent.ImageExecutorCache, 'ImageExecutorCache'),
+    Mapping(ent.ImageExecutorTask, 'ImageExecutorTask'),
+    Mapping(ent.RetentionPolicy, 'RetentionPolicy'),
+    Mapping(ent.RetentionState, 'RetentionState'),
+    Mapping(ent.ResultCache, 'ResultCache'),
+)
+
+#: The mappings keyed on entity class.
+ENTITIES: Dict[Type[ent.Entity], Mapping] = {
+    mapping.entity: mapping
+    for mapping in MAPPINGS}
+
+#: The mappings keyed on ID class.
+IDS: Dict[Type[ent.ID], Mapping] = {
+    mapping.id: mapping
+    for mapping in MAPPINGS}
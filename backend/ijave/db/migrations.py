@@ -15,15 +15,143 @@ description, with ``'-'`` replaced by ``'_'``, and with the suffix ``'_pre'``,
 exists in this module, it is executed before the SQL commands are executed, and
 if a similarly named function, with suffix ``'_post'`` exists, it will be
 executed after.
+
+Migrations are applied when the database is opened, before the server starts,
+so they must be quick. Data-moving steps, such as rewriting every row of a
+large table, are instead declared as a :class:`Background` instance named after
+the migration description with the suffix ``'_background'``. Its batches are
+run by a :class:`Migrator` while the server is running, each in its own
+transaction, and progress is stored in the table ``BackgroundMigration`` so
+that an interrupted migration resumes where it stopped.
+
+The cost of pending migrations may be estimated without applying them using
+:func:`estimate`.
 """
 import logging
 import os
+import re
 import sqlite3
 
-from typing import List
+from dataclasses import dataclass
+from threading import Event, Thread
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from . import Database
 
 LOG = logging.getLogger(__name__)
 
+#: The default number of rows migrated in a single background transaction.
+BATCH_SIZE = 256
+
+#: The default number of seconds to wait between background batches, giving
+#: other transactions a chance to acquire the database lock.
+PAUSE = 0.05
+
+#: Matches the tables referred to by a statement.
+_TABLES = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(\w+)',
+    re.IGNORECASE)
+
+
+class Background:
+    def __init__(
+            self,
+            table: str,
+            batch: Callable[[sqlite3.Cursor, int, int], None],
+            batch_size: int = BATCH_SIZE):
+        """A data-moving step of a migration, run in batches in the
+        background.
+
+        The rows of ``table`` are visited in order of ``rowid``. Rows inserted
+        while the step runs are visited as well, but the application must
+        already write rows in their migrated form, and ``batch`` must tolerate
+        rows that are already migrated.
+
+        :param table: The table whose rows are migrated.
+
+        :param batch: A function migrating the rows whose ``rowid`` is in the
+            range ``[first, last]``, called as ``batch(tx, first, last)``.
+
+        :param batch_size: The maximum number of rows in a batch.
+        """
+        self.table = table
+        self.batch = batch
+        self.batch_size = batch_size
+
+
+@dataclass
+class Status:
+    #: The version of the migration.
+    version: int
+
+    #: The name of the migration file.
+    name: str
+
+    #: The ``rowid`` of the last row migrated, or ``None`` if no rows have
+    #: been migrated.
+    position: Optional[int]
+
+    #: The largest ``rowid`` currently in the table, or ``None`` if the table
+    #: is empty.
+    end: Optional[int]
+
+    #: Whether all rows have been migrated.
+    completed: bool
+
+    def to_json(self) -> dict:
+        return {
+            'version': self.version,
+            'name': self.name,
+            'position': self.position,
+            'end': self.end,
+            'completed': self.completed}
+
+
+@dataclass
+class TableSize:
+    #: The number of rows.
+    rows: int
+
+    #: The number of bytes used by the table, excluding its indexes, or
+    #: ``None`` if unknown.
+    size: Optional[int]
+
+    def to_json(self) -> dict:
+        return {
+            'rows': self.rows,
+            'size': self.size}
+
+
+@dataclass
+class Estimate:
+    #: The version of the migration.
+    version: int
+
+    #: The name of the migration file.
+    name: str
+
+    #: Whether the migration is applied when the database is opened, as
+    #: opposed to only having a pending background step.
+    blocking: bool
+
+    #: The sizes of the existing tables referred to by the migration.
+    tables: Dict[str, TableSize]
+
+    #: The number of background batches remaining, or ``None`` if the
+    #: migration has no background step.
+    batches: Optional[int]
+
+    def to_json(self) -> dict:
+        return {
+            'version': self.version,
+            'name': self.name,
+            'blocking': self.blocking,
+            'tables': {
+                table: size.to_json()
+                for (table, size) in self.tables.items()},
+            'batches': self.batches}
+
 
 def apply(conn: sqlite3.Connection):
     """Applies migrations to a database.
@@ -39,7 +167,7 @@ def apply(conn: sqlite3.Connection):
         version = i + 1
         name = migrations[i]
         migration = os.path.join(migrations_dir, name)
-        identifier = '_'.join(name.split('-')[1:])
+        identifier = _identifier(name)
         assert int(name.split('-', 1)[0], 10) == version
 
         try:
@@ -48,12 +176,281 @@ def apply(conn: sqlite3.Connection):
                 with open(migration, encoding='utf-8') as f:
                     tx.executescript(f.read())
                 globals().get('{}_post'.format(identifier), lambda _: None)(tx)
+                if _background(name) is not None:
+                    tx.execute(
+                        'INSERT INTO BackgroundMigration(version) VALUES(?)',
+                        (version, ))
                 conn.execute('INSERT INTO Migrations VALUES(?)', (version, ))
         except Exception as e:
-            LOG.error('Failed to apply migration %s', name, exc=e)
+            LOG.error('Failed to apply migration %s', name, exc_info=e)
             raise
 
 
+def status(tx: sqlite3.Cursor) -> List[Status]:
+    """Lists the background steps of all applied migrations.
+
+    :param tx: An ongoing transaction.
+
+    :return: the status of every background step, in order of version
+    """
+    migrations = _migrations(_migrations_dir())
+    result = []
+    for (version, position, completed) in _pending(tx, True):
+        name = migrations[version - 1]
+        (end,) = tx.execute(
+            'SELECT MAX(rowid) FROM {}'.format(_background(name).table)) \
+            .fetchone()
+        result.append(Status(
+            version=version,
+            name=name,
+            position=position,
+            end=end,
+            completed=bool(completed)))
+    return result
+
+
+def step(tx: sqlite3.Cursor) -> bool:
+    """Migrates a single batch of the first incomplete background step.
+
+    :param tx: An ongoing transaction.
+
+    :return: whether any background step remains incomplete
+    """
+    pending = _pending(tx, False)
+    if not pending:
+        return False
+
+    (version, position, _) = pending[0]
+    name = _migrations(_migrations_dir())[version - 1]
+    background = _background(name)
+    if position is None:
+        rowids = tx.execute(
+            'SELECT rowid FROM {} ORDER BY rowid LIMIT ?'.format(
+                background.table),
+            (background.batch_size, )).fetchall()
+    else:
+        rowids = tx.execute(
+            'SELECT rowid FROM {} WHERE rowid > ? ORDER BY rowid LIMIT ?'
+            .format(background.table),
+            (position, background.batch_size)).fetchall()
+
+    if rowids:
+        background.batch(tx, rowids[0][0], rowids[-1][0])
+        tx.execute(
+            'UPDATE BackgroundMigration SET position = ? WHERE version = ?',
+            (rowids[-1][0], version))
+    if len(rowids) < background.batch_size:
+        LOG.info('Completed background migration %s', name)
+        tx.execute(
+            'UPDATE BackgroundMigration SET completed = 1 WHERE version = ?',
+            (version, ))
+        return len(pending) > 1
+    else:
+        return True
+
+
+def estimate(conn: sqlite3.Connection) -> List[Estimate]:
+    """Estimates the cost of pending migrations from the sizes of the tables
+    they refer to.
+
+    Nothing is modified.
+
+    :param conn: The database connection.
+
+    :return: an estimate for every migration not yet applied, and for every
+        applied migration whose background step is incomplete
+    """
+    migrations_dir = _migrations_dir()
+    migrations = _migrations(migrations_dir)
+    current = _current(conn)
+    sizes = {}
+
+    def size(table: str) -> TableSize:
+        if table not in sizes:
+            (rows,) = conn.execute(
+                'SELECT COUNT(*) FROM {}'.format(table)).fetchone()
+            try:
+                (pages,) = conn.execute(
+                    'SELECT SUM(pgsize) FROM dbstat WHERE name = ?',
+                    (table, )).fetchone()
+            except sqlite3.OperationalError:
+                pages = None
+            sizes[table] = TableSize(rows=rows, size=pages)
+        return sizes[table]
+
+    def batches(background: Background, rows: int) -> int:
+        return -(-rows // background.batch_size)
+
+    existing = {
+        name.lower(): name
+        for (name,) in conn.execute(
+            'SELECT name FROM sqlite_master WHERE type = \'table\'')}
+
+    result = []
+    if current > 0 and 'backgroundmigration' in existing:
+        cur = conn.cursor()
+        try:
+            pending = _pending(cur, False)
+        finally:
+            cur.close()
+        for (version, position, _) in pending:
+            name = migrations[version - 1]
+            background = _background(name)
+            if position is None:
+                rows = size(background.table).rows
+            else:
+                (rows,) = conn.execute(
+                    'SELECT COUNT(*) FROM {} WHERE rowid > ?'.format(
+                        background.table),
+                    (position, )).fetchone()
+            result.append(Estimate(
+                version=version,
+                name=name,
+                blocking=False,
+                tables={background.table: size(background.table)},
+                batches=batches(background, rows)))
+
+    for i in range(current, len(migrations)):
+        name = migrations[i]
+        with open(os.path.join(migrations_dir, name), encoding='utf-8') as f:
+            tables = {
+                existing[table.lower()]
+                for table in _TABLES.findall(f.read())
+                if table.lower() in existing}
+        background = _background(name)
+        if background is None:
+            remaining = None
+        elif background.table.lower() in existing:
+            table = existing[background.table.lower()]
+            tables.add(table)
+            remaining = batches(background, size(table).rows)
+        else:
+            # The table is created by the migration
+            remaining = 0
+        result.append(Estimate(
+            version=i + 1,
+            name=name,
+            blocking=True,
+            tables={
+                table: size(table)
+                for table in sorted(tables)},
+            batches=remaining))
+
+    return result
+
+
+class Migrator(Thread):
+    def __init__(self, database: 'Database', pause: float = PAUSE):
+        """A background thread running the background steps of migrations
+        until they complete.
+
+        :param database: The application database.
+
+        :param pause: The number of seconds to wait between batches.
+        """
+        super().__init__(daemon=True)
+        self._database = database
+        self._pause = pause
+        self._stopped = Event()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                with self._database.transaction() as tx:
+                    if not step(tx):
+                        break
+                self._stopped.wait(self._pause)
+        except Exception:
+            LOG.exception('Failed to run background migration')
+
+    def stop(self):
+        """Stops the migrator.
+
+        This call is blocking until an ongoing batch completes. The migration
+        is resumed by the next migrator started.
+        """
+        self._stopped.set()
+        self.join()
+
+
+def _search_batch(tx: sqlite3.Cursor, first: int, last: int):
+    """Indexes the prompts that existed before full-text search was added.
+
+    Prompts of deleted projects are not indexed.
+
+    :param tx: An ongoing transaction.
+
+    :param first: The first rowid of Prompt to index.
+
+    :param last: The last rowid of Prompt to index.
+    """
+    (before,) = tx.execute(
+        'SELECT COALESCE(MAX(document), 0) FROM SearchDocument').fetchone()
+    tx.execute(
+        '''
+        INSERT INTO SearchDocument(kind, id)
+            SELECT 'prompt', Prompt.id
+            FROM Prompt
+            WHERE Prompt.rowid BETWEEN ? AND ?
+                AND Prompt.project IN (SELECT id FROM Project)
+                AND Prompt.id NOT IN (SELECT id FROM SearchDocument)''',
+        (first, last))
+    tx.execute(
+        '''
+        INSERT INTO Search(rowid, title, body)
+            SELECT SearchDocument.document, '', Prompt.text
+            FROM SearchDocument
+            JOIN Prompt
+                ON Prompt.id = SearchDocument.id
+            WHERE SearchDocument.document > ?''',
+        (before, ))
+
+
+search_background = Background('Prompt', _search_batch)
+
+
+def _background(name: str) -> Optional[Background]:
+    """Looks up the background step of a migration.
+
+    :param name: The name of the migration file.
+
+    :return: the background step, or ``None`` if the migration has none
+    """
+    return globals().get('{}_background'.format(_identifier(name)))
+
+
+def _identifier(name: str) -> str:
+    """Converts the name of a migration file to the prefix of the names of
+    its functions.
+
+    :param name: The name of the migration file.
+
+    :return: the description with ``'-'`` replaced by ``'_'``
+    """
+    return '_'.join(name[:-len('.sql')].split('-')[1:])
+
+
+def _pending(tx: sqlite3.Cursor, completed: bool) -> List[tuple]:
+    """Lists background steps.
+
+    :param tx: An ongoing transaction.
+
+    :param completed: Whether to include completed steps.
+
+    :return: a list of tuples ``(version, position, completed)``
+    """
+    try:
+        return tx.execute(
+            '''
+            SELECT version, position, completed
+            FROM BackgroundMigration
+            WHERE completed = 0 OR ?
+            ORDER BY version''',
+            (completed, )).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
 def _migrations_dir() -> str:
     """The directory containing migrations.
 
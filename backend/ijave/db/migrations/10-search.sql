@@ -0,0 +1,118 @@
+/**
+ * The documents indexed for full-text search.
+ *
+ * The rowids of Project and Prompt may change when the database is vacuumed,
+ * so documents are numbered separately.
+ */
+CREATE TABLE SearchDocument (
+    /**
+     * The rowid of the document in Search.
+     */
+    document INTEGER
+        PRIMARY KEY,
+
+    /**
+     * The kind of entity; either 'project' or 'prompt'.
+     */
+    kind TEXT
+        NOT NULL,
+
+    /**
+     * The ID of the entity.
+     */
+    id BLOB
+        NOT NULL
+        UNIQUE
+);
+
+
+/**
+ * The full-text index of projects and prompts.
+ *
+ * The title of a project is its name, and its body is its description. The
+ * title of a prompt is empty, and its body is its text.
+ */
+CREATE VIRTUAL TABLE Search USING fts5(
+    title,
+    body,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+INSERT INTO Search(Search, rank)
+    VALUES('rank', 'bm25(2.0, 1.0)');
+
+
+CREATE TRIGGER Project_search_insert
+AFTER INSERT ON Project
+BEGIN
+    INSERT INTO SearchDocument(kind, id)
+        VALUES('project', new.id);
+    INSERT INTO Search(rowid, title, body)
+        VALUES(last_insert_rowid(), new.name, new.description);
+END;
+
+CREATE TRIGGER Project_search_update
+AFTER UPDATE OF name, description ON Project
+BEGIN
+    UPDATE Search
+        SET title = new.name, body = new.description
+        WHERE rowid = (
+            SELECT document FROM SearchDocument WHERE id = new.id);
+END;
+
+/**
+ * Prompts are not deleted with their project, so their documents are removed
+ * here.
+ */
+CREATE TRIGGER Project_search_delete
+AFTER DELETE ON Project
+BEGIN
+    DELETE FROM Search
+        WHERE rowid IN (
+            SELECT document
+            FROM SearchDocument
+            WHERE id = old.id
+                OR id IN (SELECT id FROM Prompt WHERE project = old.id));
+    DELETE FROM SearchDocument
+        WHERE id = old.id
+            OR id IN (SELECT id FROM Prompt WHERE project = old.id);
+END;
+
+
+CREATE TRIGGER Prompt_search_insert
+AFTER INSERT ON Prompt
+BEGIN
+    INSERT INTO SearchDocument(kind, id)
+        VALUES('prompt', new.id);
+    INSERT INTO Search(rowid, title, body)
+        VALUES(last_insert_rowid(), '', new.text);
+END;
+
+CREATE TRIGGER Prompt_search_update
+AFTER UPDATE OF text ON Prompt
+BEGIN
+    UPDATE Search
+        SET body = new.text
+        WHERE rowid = (
+            SELECT document FROM SearchDocument WHERE id = new.id);
+END;
+
+CREATE TRIGGER Prompt_search_delete
+AFTER DELETE ON Prompt
+BEGIN
+    DELETE FROM Search
+        WHERE rowid = (
+            SELECT document FROM SearchDocument WHERE id = old.id);
+    DELETE FROM SearchDocument
+        WHERE id = old.id;
+END;
+
+
+INSERT INTO SearchDocument(kind, id)
+    SELECT 'project', id FROM Project;
+
+INSERT INTO Search(rowid, title, body)
+    SELECT SearchDocument.document, Project.name, Project.description
+    FROM SearchDocument
+    JOIN Project
+        ON Project.id = SearchDocument.id;
@@ -0,0 +1,11 @@
+/**
+ * Record the ID of the last image compacted.
+ *
+ * Image timestamps are whole seconds, so compaction resumes after the tuple
+ * (timestamp, image). Existing states resume after all images sharing their
+ * timestamp, as before.
+ */
+ALTER TABLE RetentionState
+    ADD COLUMN image BLOB
+    DEFAULT X'FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF'
+    NOT NULL;
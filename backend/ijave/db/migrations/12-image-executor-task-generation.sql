@@ -0,0 +1,10 @@
+/**
+ * Count how many times each image executor task has been queued.
+ *
+ * A prompt may be queued again while it is being executed. Its row is then
+ * kept when the running execution completes.
+ */
+ALTER TABLE ImageExecutorTask
+    ADD COLUMN generation INT
+    DEFAULT 0
+    NOT NULL;
@@ -0,0 +1,42 @@
+/**
+ * Add the random seed used to generate the first image.
+ */
+ALTER TABLE ImageExecutorCache
+    ADD COLUMN seed INT;
+
+
+/**
+ * A task queued on the image executor.
+ */
+CREATE TABLE ImageExecutorTask (
+    /**
+     * The prompt for which to generate an image.
+     */
+    id BLOB
+        PRIMARY KEY
+        REFERENCES Prompt
+        ON DELETE CASCADE,
+
+    /**
+     * The priority class of this task.
+     */
+    priority INT,
+
+    /**
+     * The UNIX timestamp when this task was queued.
+     */
+    timestamp FLOAT,
+
+    /**
+     * The UNIX timestamp when the lease of the worker executing this task
+     * expires, or NULL if the task is not being executed.
+     */
+    lease FLOAT,
+
+    /**
+     * The number of times execution of this task has been started.
+     */
+    attempts INT
+        DEFAULT 0
+        NOT NULL
+);
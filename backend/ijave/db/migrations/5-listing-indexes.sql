@@ -0,0 +1,14 @@
+/**
+ * Indexes used for keyset pagination of listings.
+ *
+ * Projects are paginated on their primary key, prompts on their project and
+ * ID, and images on their timestamp and ID.
+ */
+CREATE INDEX Prompt_project_id
+    ON Prompt(project, id);
+
+CREATE INDEX Prompt_Image_prompt
+    ON Prompt_Image(prompt, image);
+
+CREATE INDEX Image_timestamp_id
+    ON Image(timestamp, id);
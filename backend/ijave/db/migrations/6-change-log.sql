@@ -0,0 +1,48 @@
+/**
+ * The latest change to every project and prompt.
+ *
+ * Every create, update and delete replaces the row for the entity, so the
+ * sequence number of a row is that of the last change, and the table never
+ * contains more than one row per entity.
+ */
+CREATE TABLE Change (
+    /**
+     * The sequence number of this change.
+     *
+     * This increases monotonically, also across deletes.
+     */
+    sequence INTEGER
+        PRIMARY KEY
+        AUTOINCREMENT,
+
+    /**
+     * The kind of entity that was changed; "project" or "prompt".
+     */
+    kind TEXT
+        NOT NULL,
+
+    /**
+     * The ID of the entity that was changed.
+     */
+    id BLOB
+        NOT NULL
+        UNIQUE,
+
+    /**
+     * Whether the entity was deleted.
+     */
+    deleted INT
+        DEFAULT 0
+        NOT NULL
+);
+
+
+/**
+ * Record all existing entities, so that a full listing is available.
+ */
+INSERT INTO Change(kind, id)
+    SELECT 'project', id FROM Project;
+
+INSERT INTO Change(kind, id)
+    SELECT 'prompt', id FROM Prompt
+    WHERE project IN (SELECT id FROM Project);
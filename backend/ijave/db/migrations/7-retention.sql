@@ -0,0 +1,54 @@
+/**
+ * A policy for which superseded images of a prompt to retain.
+ */
+CREATE TABLE RetentionPolicy (
+    /**
+     * The project to which this policy applies, or the nil UUID for the
+     * global policy.
+     */
+    id BLOB
+        PRIMARY KEY,
+
+    /**
+     * If not NULL, only every Nth image is retained.
+     */
+    keep_every INT,
+
+    /**
+     * If not NULL, retained images are downsampled to fit within this size.
+     */
+    thumbnail_size INT,
+
+    /**
+     * The number of seconds an image must have been superseded before it is
+     * compacted.
+     */
+    min_age FLOAT
+        NOT NULL
+);
+
+
+/**
+ * The progress of compaction of the images of a prompt.
+ */
+CREATE TABLE RetentionState (
+    /**
+     * The prompt whose images are compacted.
+     */
+    id BLOB
+        PRIMARY KEY
+        REFERENCES Prompt
+        ON DELETE CASCADE,
+
+    /**
+     * The timestamp of the last image compacted.
+     */
+    timestamp FLOAT
+        NOT NULL,
+
+    /**
+     * The number of images compacted, including those deleted.
+     */
+    position INT
+        NOT NULL
+);
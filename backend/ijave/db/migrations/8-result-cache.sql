@@ -0,0 +1,37 @@
+/**
+ * Results of deterministic image generation steps, keyed on a digest of the
+ * parameters that determine them.
+ */
+CREATE TABLE ResultCache (
+    /**
+     * The digest of the generation parameters.
+     */
+    id BLOB
+        PRIMARY KEY,
+
+    /**
+     * The UNIX timestamp when this result was last used.
+     */
+    timestamp FLOAT
+        NOT NULL,
+
+    /**
+     * The encoded image data after the step.
+     */
+    latent BLOB
+        NOT NULL,
+
+    /**
+     * The content type of the image.
+     */
+    content_type TEXT
+        NOT NULL,
+
+    /**
+     * The image data, or NULL if the image is the latent itself.
+     */
+    data BLOB
+);
+
+CREATE INDEX ResultCache_timestamp
+    ON ResultCache(timestamp);
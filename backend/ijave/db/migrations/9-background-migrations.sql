@@ -0,0 +1,23 @@
+/**
+ * The progress of the background steps of migrations.
+ */
+CREATE TABLE BackgroundMigration (
+    /**
+     * The version of the migration.
+     */
+    version INT
+        PRIMARY KEY,
+
+    /**
+     * The rowid of the last row migrated, or NULL if no rows have been
+     * migrated.
+     */
+    position INTEGER,
+
+    /**
+     * Whether all rows have been migrated.
+     */
+    completed INT
+        DEFAULT 0
+        NOT NULL
+);
@@ -0,0 +1,294 @@
+"""
+Database tracing
+----------------
+
+Opt-in instrumentation of database transactions and statements, used to find
+contention on the database lock and slow statements.
+
+Traces are kept in bounded ring buffers, so a tracer may be left enabled for
+a long time.
+"""
+
+import contextlib
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+
+LOG = logging.getLogger(__name__)
+
+#: The default number of entries kept in every ring buffer.
+SIZE = 1000
+
+#: The default duration, in seconds, above which a statement is slow.
+SLOW_STATEMENT = 0.1
+
+#: The statements for which query plans are explained.
+EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+#: Frames in these files are skipped when determining the call site.
+_SKIPPED = (
+    os.path.dirname(__file__) + os.sep,
+    contextlib.__file__)
+
+
+@dataclass
+class TransactionTrace:
+    #: The time the transaction was requested, as a UNIX timestamp.
+    timestamp: float
+
+    #: The code that opened the transaction.
+    site: str
+
+    #: The number of seconds spent waiting for the database lock.
+    lock_wait: float
+
+    #: The number of seconds the database lock was held.
+    hold: float
+
+    #: Whether the transaction was committed.
+    committed: bool
+
+    def to_json(self) -> dict:
+        return {
+            'timestamp': self.timestamp,
+            'site': self.site,
+            'lock_wait': self.lock_wait,
+            'hold': self.hold,
+            'committed': self.committed}
+
+
+@dataclass
+class StatementTrace:
+    #: The time the statement was executed, as a UNIX timestamp.
+    timestamp: float
+
+    #: The code that executed the statement.
+    site: str
+
+    #: The statement.
+    query: str
+
+    #: The number of seconds taken to execute the statement, or ``None`` for
+    #: sampled statements.
+    duration: Optional[float]
+
+    #: The lines of the query plan, if explained.
+    plan: Optional[List[str]]
+
+    def to_json(self) -> dict:
+        return {
+            'timestamp': self.timestamp,
+            'site': self.site,
+            'query': self.query,
+            'duration': self.duration,
+            'plan': self.plan}
+
+
+@dataclass
+class SiteSummary:
+    #: The number of transactions opened.
+    transactions: int = 0
+
+    #: The total number of seconds spent waiting for the database lock.
+    lock_wait: float = 0.0
+
+    #: The longest time spent waiting for the database lock.
+    max_lock_wait: float = 0.0
+
+    #: The total number of seconds the database lock was held.
+    hold: float = 0.0
+
+    #: The longest time the database lock was held.
+    max_hold: float = 0.0
+
+    def to_json(self) -> dict:
+        return {
+            'transactions': self.transactions,
+            'lock_wait': self.lock_wait,
+            'max_lock_wait': self.max_lock_wait,
+            'hold': self.hold,
+            'max_hold': self.max_hold}
+
+
+class Tracer:
+    def __init__(
+            self,
+            size: int = SIZE,
+            slow_statement: float = SLOW_STATEMENT,
+            sample_rate: float = 0.0):
+        """Records database transactions and statements.
+
+        Every transaction is recorded with its lock wait and hold times, and
+        the site that opened it. Statements slower than ``slow_statement`` are
+        recorded and logged with their query plans. A fraction
+        ``sample_rate`` of all statements, including those executed by
+        triggers, are recorded as expanded by SQLite.
+
+        :param size: The maximum number of entries kept of every kind.
+
+        :param slow_statement: The duration, in seconds, above which a
+            statement is slow.
+
+        :param sample_rate: The fraction of statements to sample.
+        """
+        self.size = size
+        self.slow_statement = slow_statement
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._transactions = deque(maxlen=size)
+        self._slow = deque(maxlen=size)
+        self._samples = deque(maxlen=size)
+        self._sites = {}
+
+    def install(self, conn: sqlite3.Connection):
+        """Installs the sampling trace callback on a connection.
+
+        :param conn: The connection.
+        """
+        if self.sample_rate > 0:
+            conn.set_trace_callback(self._sample)
+
+    def transaction(
+            self, site: str, started: float, lock_wait: float, hold: float,
+            committed: bool):
+        """Records a transaction.
+
+        :param site: The code that opened the transaction.
+
+        :param started: The time the transaction was requested, as a UNIX
+            timestamp.
+
+        :param lock_wait: The number of seconds spent waiting for the lock.
+
+        :param hold: The number of seconds the lock was held.
+
+        :param committed: Whether the transaction was committed.
+        """
+        trace = TransactionTrace(
+            timestamp=started,
+            site=site,
+            lock_wait=lock_wait,
+            hold=hold,
+            committed=committed)
+        with self._lock:
+            self._transactions.append(trace)
+            summary = self._sites.setdefault(site, SiteSummary())
+            summary.transactions += 1
+            summary.lock_wait += lock_wait
+            summary.max_lock_wait = max(summary.max_lock_wait, lock_wait)
+            summary.hold += hold
+            summary.max_hold = max(summary.max_hold, hold)
+
+    def statement(
+            self, cur: sqlite3.Cursor, query: str, parameters: Any,
+            duration: float):
+        """Records a statement if it is slow.
+
+        The query plan of a slow statement is explained on the connection of
+        ``cur``, so the caller must hold the database lock.
+
+        :param cur: The cursor that executed the statement.
+
+        :param query: The statement.
+
+        :param parameters: The statement parameters, or ``None`` if the
+            statement was executed for many sets of parameters.
+
+        :param duration: The number of seconds taken by the statement.
+        """
+        if duration < self.slow_statement:
+            return
+
+        plan = None
+        if parameters is not None \
+                and query.lstrip().upper().startswith(EXPLAINED):
+            try:
+                plan = [
+                    row[-1]
+                    for row in cur.connection.execute(
+                        'EXPLAIN QUERY PLAN ' + query,
+                        parameters)]
+            except sqlite3.Error as e:
+                LOG.debug('Failed to explain %s: %s', query, e)
+
+        trace = StatementTrace(
+            timestamp=time.time() - duration,
+            site=call_site(),
+            query=' '.join(query.split()),
+            duration=duration,
+            plan=plan)
+        LOG.warning(
+            'Slow statement at %s took %.3f s: %s; plan: %s',
+            trace.site, duration, trace.query,
+            '; '.join(plan) if plan is not None else 'unavailable')
+        with self._lock:
+            self._slow.append(trace)
+
+    def clear(self):
+        """Removes all recorded entries.
+        """
+        with self._lock:
+            self._transactions.clear()
+            self._slow.clear()
+            self._samples.clear()
+            self._sites.clear()
+
+    def to_json(self) -> dict:
+        with self._lock:
+            transactions = list(self._transactions)
+            slow = list(self._slow)
+            samples = list(self._samples)
+            sites = dict(self._sites)
+        return {
+            'size': self.size,
+            'slow_statement': self.slow_statement,
+            'sample_rate': self.sample_rate,
+            'sites': {
+                site: summary.to_json()
+                for (site, summary) in sorted(
+                    sites.items(),
+                    key=lambda i: i[1].hold,
+                    reverse=True)},
+            'transactions': [t.to_json() for t in transactions],
+            'slow': [t.to_json() for t in slow],
+            'samples': [t.to_json() for t in samples]}
+
+    def _sample(self, query: str):
+        """The SQLite trace callback.
+
+        :param query: The expanded statement.
+        """
+        if random.random() < self.sample_rate:
+            trace = StatementTrace(
+                timestamp=time.time(),
+                site=call_site(),
+                query=query,
+                duration=None,
+                plan=None)
+            with self._lock:
+                self._samples.append(trace)
+
+
+def call_site() -> str:
+    """Determines the code outside of the database module that is running.
+
+    :return: a string on the form ``'module:line function'``
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_SKIPPED):
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    return '{}:{} {}'.format(
+        frame.f_globals.get('__name__', '?'),
+        frame.f_lineno,
+        frame.f_code.co_name)
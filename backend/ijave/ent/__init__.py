@@ -4,17 +4,84 @@ Database entities
 
 The classes in this module correspond to entities in the database.
 """
+import hashlib
+import json
 import sqlite3
 import uuid
 
 from dataclasses import dataclass, field, fields, Field
-from typing import Any, Optional, Union, get_args, get_origin
-from uuid import UUID
+from typing import (
+    Any, Callable, Optional, Tuple, Type, Union, get_args, get_origin)
+from uuid import UUID, SafeUUID
+
+
+def slotted(cls: Type) -> Type:
+    """Recreates a dataclass with ``__slots__`` for its fields.
+
+    For subclasses of :class:`Entity`, the field validators and serialisers
+    are also precomputed.
+
+    This decorator must be applied after ``dataclass``.
+
+    :param cls: The dataclass.
+
+    :return: a new class
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {
+        k: v
+        for (k, v) in cls.__dict__.items()
+        if k not in names and k not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    namespace['__getstate__'] = _getstate
+    namespace['__setstate__'] = _setstate
+    result = type(cls)(cls.__name__, cls.__bases__, namespace)
+    result.__qualname__ = cls.__qualname__
+
+    result._names = names
+    result._setters = tuple(
+        result.__dict__[name].__set__
+        for name in names)
+    if issubclass(result, Entity):
+        result._readers = tuple(
+            f.type.trusted
+            if isinstance(f.type, type) and issubclass(f.type, ID) else
+            _identity
+            for f in fields(result))
+        result._validators = tuple(
+            Entity._validator(f)
+            for f in fields(result))
+        result._serializers = tuple(
+            (f.name, Entity._serializer(f))
+            for f in fields(result))
+
+    return result
+
+
+#: Shortcuts used to construct trusted values.
+_new = object.__new__
+_from_bytes = int.from_bytes
+_uuid_set_int = UUID.__dict__['int'].__set__
+_uuid_set_is_safe = UUID.__dict__['is_safe'].__set__
+
+
+def _getstate(self) -> tuple:
+    return tuple(getattr(self, name) for name in self._names)
+
+
+def _setstate(self, state: tuple):
+    for (name, value) in zip(self._names, state):
+        object.__setattr__(self, name, value)
 
 
 class ID:
     """A simple base class wrapping a UUID.
     """
+    __slots__ = ()
+
+    #: The slot setters for all fields.
+    _setters: Tuple[Callable[[Any, Any], None], ...] = ()
+
     @classmethod
     def new(cls) -> Any:
         """Constructs a new random value.
@@ -37,6 +104,23 @@ class ID:
         """
         return cls(UUID(hex=s))
 
+    @classmethod
+    def trusted(cls, uuid: bytes) -> Any:
+        """Constructs a value from its binary representation without
+        validation.
+
+        This must only be used for values known to be valid, such as those
+        read from the database.
+
+        :param uuid: The binary encoding of the UUID.
+        """
+        value = _new(UUID)
+        _uuid_set_int(value, _from_bytes(uuid, 'big'))
+        _uuid_set_is_safe(value, SafeUUID.unknown)
+        result = _new(cls)
+        cls._setters[0](result, value)
+        return result
+
     @property
     def bytes(self):
         """The binary representation of this value.
@@ -55,15 +139,63 @@ class Entity:
     """A simple base class providing JSON serialisation.
 
     This class also provides simple type-checking.
+
+    Subclasses must be decorated with :func:`slotted`.
     """
+    __slots__ = ()
+
+    #: The field names.
+    _names: Tuple[str, ...] = ()
+
+    #: The slot setters for all fields.
+    _setters: Tuple[Callable[[Any, Any], None], ...] = ()
+
+    #: The functions converting database values to field values.
+    _readers: Tuple[Callable[[Any], Any], ...] = ()
+
+    #: The tuples ``(name, types, convert)`` used to validate fields.
+    _validators: Tuple[Tuple[str, Any, bool], ...] = ()
+
+    #: The tuples ``(name, serializer)`` used to serialise fields.
+    _serializers: Tuple[Tuple[str, Callable[[Any], Any]], ...] = ()
+
+    @classmethod
+    def trusted(cls, *values) -> Any:
+        """Constructs an entity without validating its fields.
+
+        This must only be used for values known to be valid, such as rows read
+        from the database.
+
+        :param values: The field values, in declaration order.
+
+        :return: an entity
+        """
+        result = _new(cls)
+        for (setter, value) in zip(cls._setters, values):
+            setter(result, value)
+        return result
+
+    @classmethod
+    def from_row(cls, row: tuple) -> Any:
+        """Constructs an entity from a database row without validation.
+
+        :param row: The values of all fields in declaration order, with IDs in
+            their binary representation.
+
+        :return: an entity
+        """
+        return cls.trusted(*(
+            reader(value)
+            for (reader, value) in zip(cls._readers, row)))
+
     def to_json(self):
         """Converts this entity to JSON.
 
         :return: a dict
         """
         return {
-            field.name: self._json_serialize_field(field)
-            for field in fields(self)}
+            name: serializer(getattr(self, name))
+            for (name, serializer) in self._serializers}
 
     @classmethod
     def from_json(cls, data: dict) -> Any:
@@ -84,26 +216,60 @@ class Entity:
 
         :return: this object
         """
-        for field in fields(self):
-            origin = get_origin(field.type)
-            value = getattr(self, field.name)
-            if origin is Union:
-                if not any(
-                        isinstance(value, arg)
-                        for arg in get_args(field.type)):
-                    raise ValueError(field.name)
-            elif origin is None and not isinstance(value, field.type):
-                setattr(self, field.name, field.type(value))
+        for (name, types, convert) in self._validators:
+            value = getattr(self, name)
+            if not isinstance(value, types):
+                if convert:
+                    setattr(self, name, types(value))
+                else:
+                    raise ValueError(name)
         return self
 
-    def _json_serialize_field(self, field: Field) -> Any:
-        """Extracts the JSON value of a field.
+    @staticmethod
+    def _validator(field: Field) -> Tuple[str, Any, bool]:
+        """Generates the validator for a field.
+
+        :param field: The field to validate.
+
+        :return: the tuple ``(name, types, convert)``, where ``types`` is
+            passed to ``isinstance`` and ``convert`` is whether invalid values
+            are converted by calling ``types``, rather than rejected
+        """
+        origin = get_origin(field.type)
+        if origin is Union:
+            return (field.name, get_args(field.type), False)
+        elif origin is None:
+            return (field.name, field.type, True)
+        else:
+            return (field.name, object, False)
+
+    @staticmethod
+    def _serializer(field: Field) -> Callable[[Any], Any]:
+        """Generates the JSON serialiser for a field.
+
+        :param field: The field to serialise.
+
+        :return: a function converting a field value to a JSON serialisable
+            value
+        """
+        if isinstance(field.type, type):
+            if issubclass(field.type, Entity):
+                return field.type.to_json
+            elif issubclass(field.type, ID):
+                return str
+            else:
+                return _identity
+        else:
+            return Entity._json_serialize_value
+
+    @staticmethod
+    def _json_serialize_value(value: Any) -> Any:
+        """Extracts the JSON value of a field value.
 
-        :param field: The field whose value to extract.
+        :param value: The value to convert.
 
         :return: a JSON serialisable value
         """
-        value = getattr(self, field.name)
         if isinstance(value, Entity):
             return value.to_json()
         elif isinstance(value, ID):
@@ -135,6 +301,11 @@ class Entity:
         self.validate_fields()
 
 
+def _identity(value: Any) -> Any:
+    return value
+
+
+@slotted
 @dataclass(frozen=True, eq=True)
 class ProjectID(ID):
     """A typed ID.
@@ -142,6 +313,7 @@ class ProjectID(ID):
     id: UUID
 
 
+@slotted
 @dataclass
 class Project(Entity):
     """A project.
@@ -164,6 +336,7 @@ class Project(Entity):
     image_height: int
 
 
+@slotted
 @dataclass(frozen=True, eq=True)
 class PromptID(ID):
     """A typed ID.
@@ -171,6 +344,7 @@ class PromptID(ID):
     id: UUID
 
 
+@slotted
 @dataclass
 class Prompt(Entity):
     """A given prompt.
@@ -185,6 +359,7 @@ class Prompt(Entity):
     text: str
 
 
+@slotted
 @dataclass(frozen=True, eq=True)
 class ImageID(ID):
     """A typed ID.
@@ -192,6 +367,7 @@ class ImageID(ID):
     id: UUID
 
 
+@slotted
 @dataclass
 class Image(Entity):
     """A stored image.
@@ -226,6 +402,7 @@ class Image(Entity):
             data=None)
 
 
+@slotted
 @dataclass(frozen=True, eq=True)
 class ImageExecutorCacheID(ID):
     """A typed ID.
@@ -242,9 +419,10 @@ class ImageExecutorCacheID(ID):
     def prompt(self) -> PromptID:
         """This ID as a prompt ID.
         """
-        return PromptID.from_uuid(self.id)
+        return PromptID(self.id)
 
 
+@slotted
 @dataclass
 class ImageExecutorCache(Entity):
     """Cached data for an image executor.
@@ -263,3 +441,209 @@ class ImageExecutorCache(Entity):
 
     #: The encoded image data.
     latent: Optional[bytes] = field(repr=False)
+
+    #: The random seed used to generate the first image.
+    seed: Optional[int]
+
+
+@slotted
+@dataclass(frozen=True, eq=True)
+class ImageExecutorTaskID(ID):
+    """A typed ID.
+    """
+    id: UUID
+
+    @classmethod
+    def from_prompt_id(cls, source: PromptID) -> Any:
+        """Converts a prompt ID to an image executor task ID.
+        """
+        return cls(source.id)
+
+    @property
+    def prompt(self) -> PromptID:
+        """This ID as a prompt ID.
+        """
+        return PromptID(self.id)
+
+
+@slotted
+@dataclass
+class ImageExecutorTask(Entity):
+    """A task queued on the image executor.
+    """
+    #: The database ID.
+    id: ImageExecutorTaskID
+
+    #: The value of the priority class of this task.
+    priority: int
+
+    #: The timestamp, expressed as a UNIX timestamp, when this task was queued.
+    timestamp: float
+
+    #: The timestamp when the lease of the worker executing this task expires.
+    lease: Optional[float]
+
+    #: The number of times execution of this task has been started.
+    attempts: int
+
+    #: Incremented whenever the task is queued again, so that completing an
+    #: earlier execution does not remove it.
+    generation: int
+
+
+@slotted
+@dataclass(frozen=True, eq=True)
+class RetentionPolicyID(ID):
+    """A typed ID.
+
+    The ID of the policy of a project is the project ID, and the global policy
+    has the nil UUID.
+    """
+    id: UUID
+
+    @classmethod
+    def default(cls) -> Any:
+        """The ID of the global policy.
+        """
+        return cls(UUID(int=0))
+
+    @classmethod
+    def from_project_id(cls, source: ProjectID) -> Any:
+        """Converts a project ID to a retention policy ID.
+        """
+        return cls(source.id)
+
+    @property
+    def project(self) -> ProjectID:
+        """This ID as a project ID.
+        """
+        return ProjectID(self.id)
+
+
+@slotted
+@dataclass
+class RetentionPolicy(Entity):
+    """A policy for which superseded images of a prompt to retain.
+
+    The latest image of a prompt is always retained.
+    """
+    #: The database ID.
+    id: RetentionPolicyID
+
+    #: If set, only every Nth image is retained.
+    keep_every: Optional[int]
+
+    #: If set, retained images larger than this are downsampled so that
+    #: neither dimension exceeds it.
+    thumbnail_size: Optional[int]
+
+    #: The number of seconds an image must have been superseded before it is
+    #: compacted.
+    min_age: float
+
+
+@slotted
+@dataclass(frozen=True, eq=True)
+class RetentionStateID(ID):
+    """A typed ID.
+    """
+    id: UUID
+
+    @classmethod
+    def from_prompt_id(cls, source: PromptID) -> Any:
+        """Converts a prompt ID to a retention state ID.
+        """
+        return cls(source.id)
+
+    @property
+    def prompt(self) -> PromptID:
+        """This ID as a prompt ID.
+        """
+        return PromptID(self.id)
+
+
+@slotted
+@dataclass
+class RetentionState(Entity):
+    """The progress of compaction of the images of a prompt.
+    """
+    #: The database ID.
+    id: RetentionStateID
+
+    #: The timestamp of the last image compacted.
+    timestamp: float
+
+    #: The ID of the last image compacted. Images are compacted in order of
+    #: ``(timestamp, image)``.
+    image: ImageID
+
+    #: The number of images compacted, including those deleted.
+    position: int
+
+
+@slotted
+@dataclass(frozen=True, eq=True)
+class ResultCacheID(ID):
+    """A typed ID.
+
+    The ID is a digest of the generator and the parameters determining a
+    generation step.
+    """
+    id: UUID
+
+    @classmethod
+    def from_parameters(
+            cls, generator: str, text: str, seed: int, width: int,
+            height: int, steps: int, strength: float, step: int,
+            latent: Optional[bytes]) -> Any:
+        """Derives the ID of the result of a generation step.
+
+        :param generator: The identity of the generator, including its
+            backend, models and precision.
+
+        :param text: The prompt text.
+
+        :param seed: The random seed used to generate the first image.
+
+        :param width: The image width.
+
+        :param height: The image height.
+
+        :param steps: The total number of steps.
+
+        :param strength: The strength of the transformation.
+
+        :param step: The index of the step.
+
+        :param latent: The encoded image data before the step, if any.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps(
+            [
+                generator, text, seed, width, height, steps, float(strength),
+                step, latent is not None],
+            ensure_ascii=False).encode('utf-8'))
+        if latent is not None:
+            digest.update(latent)
+        return cls(UUID(bytes=digest.digest()))
+
+
+@slotted
+@dataclass
+class ResultCache(Entity):
+    """The cached result of a generation step.
+    """
+    #: The database ID.
+    id: ResultCacheID
+
+    #: The timestamp when this result was last used.
+    timestamp: float
+
+    #: The encoded image data after the step.
+    latent: bytes = field(repr=False)
+
+    #: The content type of the image.
+    content_type: str
+
+    #: The image data, or ``None`` if the image is the latent itself.
+    data: Optional[bytes] = field(repr=False)
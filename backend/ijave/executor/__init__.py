@@ -1,12 +1,18 @@
 import asyncio
 import functools
 import time
+import weakref
 
+from collections import OrderedDict, deque
 from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
-from queue import Queue
-from threading import Thread
-from typing import TypeVar, Callable, Optional
+from threading import Condition, Thread
+from typing import (
+    Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple,
+    TypeVar)
+
+from .. import metrics
 
 
 class State(Enum):
@@ -23,6 +29,44 @@ class State(Enum):
     STOPPED = 3
 
 
+class Priority(Enum):
+    #: Tasks requested by a user waiting for the result.
+    INTERACTIVE = 0
+
+    #: Background tasks.
+    BULK = 1
+
+
+#: All live schedulers, whose queues are reported by :data:`QUEUE_DEPTH`.
+_SCHEDULERS = weakref.WeakSet()
+
+
+def _queue_depths() -> Iterator[Tuple[Dict[str, str], float]]:
+    for scheduler in list(_SCHEDULERS):
+        for (priority, depth) in scheduler.depth().items():
+            yield ({'priority': priority.name.lower()}, depth)
+
+
+#: The number of queued tasks.
+QUEUE_DEPTH = metrics.gauge(
+    'ijave_executor_queue_depth',
+    'The number of tasks queued for execution.',
+    ('priority',),
+    _queue_depths)
+
+#: The time tasks spend queued.
+WAIT_SECONDS = metrics.histogram(
+    'ijave_executor_wait_seconds',
+    'The time tasks spend queued before being executed.',
+    ('priority',))
+
+#: The time taken to execute tasks.
+EXECUTION_SECONDS = metrics.histogram(
+    'ijave_executor_execution_seconds',
+    'The time taken to execute tasks, including completion handling.',
+    ('priority', 'outcome'))
+
+
 class ToJSON:
     """An interface for types that can be converted to JSON.
     """
@@ -30,6 +74,250 @@ class ToJSON:
         raise NotImplementedError()
 
 
+@dataclass
+class Entry:
+    """A queued task.
+    """
+    #: The queued task.
+    task: ToJSON
+
+    #: The priority class of the task.
+    priority: Priority
+
+    #: The group to which the task belongs.
+    group: Hashable
+
+    #: The number of tasks that will be executed before this one.
+    position: int
+
+    #: The expected number of seconds until the task is started, or ``None``
+    #: if no task has yet been executed.
+    expected_wait: Optional[float]
+
+    def to_json(self) -> dict:
+        return {
+            'task': self.task.to_json(),
+            'priority': self.priority.name.lower(),
+            'position': self.position,
+            'expected_wait': self.expected_wait}
+
+
+class Scheduler:
+    def __init__(self):
+        """A task queue with priority classes.
+
+        Tasks of a higher priority class are always dequeued before tasks of a
+        lower priority. Within a priority class, tasks are dequeued round-robin
+        across groups, so that a group with many queued tasks does not starve
+        the others.
+
+        Tasks may be given a key; at most one task per key is queued at any
+        time.
+        """
+        self._condition = Condition()
+        self._queues = {
+            priority: OrderedDict()
+            for priority in Priority}
+        self._keys = {}
+        self._closed = False
+        _SCHEDULERS.add(self)
+
+    def put(
+            self,
+            task: Any,
+            priority: Priority,
+            group: Hashable,
+            key: Hashable = None) -> bool:
+        """Adds a task to the queue.
+
+        If ``key`` is not ``None`` and a task with the same key is already
+        queued, the new task is dropped. If the new task has a higher
+        priority, the queued task is moved to the higher priority class.
+
+        :param task: The task to add.
+
+        :param priority: The priority class of the task.
+
+        :param group: The group to which the task belongs.
+
+        :param key: A key used to identify duplicate tasks.
+
+        :return: whether the task was added or promoted
+        """
+        return self.put_many([(task, priority, group, key)])[0]
+
+    def put_many(
+            self,
+            entries: Iterable[Tuple[Any, Priority, Hashable, Hashable]],
+            on_put: Optional[Callable[[List[Tuple[Any, Priority]]], None]]
+            = None) -> List[bool]:
+        """Adds several tasks to the queue at once.
+
+        See :meth:`put` for a description of the values.
+
+        :param entries: Tuples ``(task, priority, group, key)``.
+
+        :param on_put: If specified, this is called with a list of tuples
+            ``(task, priority)`` for the tasks added or promoted, before any
+            of them can be removed from the queue. For a promoted task, this
+            is the task already queued.
+
+        :return: whether each task was added or promoted
+        """
+        with self._condition:
+            queued = [
+                (self._put(task, priority, group, key), priority)
+                for (task, priority, group, key) in entries]
+            result = [task is not None for (task, _) in queued]
+            if any(result):
+                if on_put is not None:
+                    on_put([
+                        (task, priority)
+                        for (task, priority) in queued
+                        if task is not None])
+                self._condition.notify()
+            return result
+
+    def get(self) -> Optional[Tuple[Any, Priority, Hashable]]:
+        """Removes the next task from the queue.
+
+        This call is blocking until a task is available or the queue is closed.
+
+        :return: the tuple ``(task, priority, group)``, or ``None`` if the
+            queue has been closed
+        """
+        with self._condition:
+            while not self._closed:
+                for priority in Priority:
+                    groups = self._queues[priority]
+                    if groups:
+                        (group, tasks) = next(iter(groups.items()))
+                        (task, key, queued) = tasks.popleft()
+                        if tasks:
+                            groups.move_to_end(group)
+                        else:
+                            del groups[group]
+                        self._keys.pop(key, None)
+                        WAIT_SECONDS.observe(
+                            time.monotonic() - queued,
+                            priority=priority.name.lower())
+                        return (task, priority, group)
+                self._condition.wait()
+
+    def cancel(
+            self,
+            key: Hashable = None,
+            group: Hashable = None,
+            on_cancel: Optional[Callable[[List[Any]], None]] = None
+            ) -> List[Any]:
+        """Removes queued tasks.
+
+        :param key: If specified, the task with this key is removed.
+
+        :param group: If specified, all tasks in this group are removed.
+
+        :param on_cancel: If specified, this is called with the removed
+            tasks before any task with the same key can be added again.
+
+        :return: the removed tasks
+        """
+        with self._condition:
+            result = []
+            if key is not None and key in self._keys:
+                (task, _, _) = self._remove(key)
+                result.append(task)
+            if group is not None:
+                for priority in Priority:
+                    for (task, key, _) in self._queues[priority].pop(
+                            group, ()):
+                        self._keys.pop(key, None)
+                        result.append(task)
+            if result and on_cancel is not None:
+                on_cancel(result)
+            return result
+
+    def close(self):
+        """Closes the queue.
+
+        Any callers blocking in :meth:`get` will receive ``None``.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def snapshot(self) -> List[Tuple[Any, Priority, Hashable]]:
+        """Lists all queued tasks in the order they will be dequeued.
+
+        :return: a list of tuples ``(task, priority, group)``
+        """
+        with self._condition:
+            result = []
+            for priority in Priority:
+                groups = list(self._queues[priority].items())
+                for i in range(max((len(t) for (_, t) in groups), default=0)):
+                    result.extend(
+                        (tasks[i][0], priority, group)
+                        for (group, tasks) in groups
+                        if i < len(tasks))
+            return result
+
+    def depth(self) -> Dict[Priority, int]:
+        """Counts the queued tasks of every priority class.
+
+        :return: a mapping from priority class to number of queued tasks
+        """
+        with self._condition:
+            return {
+                priority: sum(len(tasks) for tasks in groups.values())
+                for (priority, groups) in self._queues.items()}
+
+    def _put(
+            self,
+            task: Any,
+            priority: Priority,
+            group: Hashable,
+            key: Hashable) -> Optional[Any]:
+        """Adds a task to the queue.
+
+        The caller must hold the lock.
+
+        :return: the task added or, if a queued task was promoted, that task,
+            or ``None`` if the task was dropped
+        """
+        queued = time.monotonic()
+        if key is not None and key in self._keys:
+            (queued_priority, queued_group) = self._keys[key]
+            if priority.value < queued_priority.value:
+                (task, _, queued) = self._remove(key)
+                group = queued_group
+            else:
+                return None
+
+        self._queues[priority].setdefault(group, deque()).append(
+            (task, key, queued))
+        if key is not None:
+            self._keys[key] = (priority, group)
+        return task
+
+    def _remove(self, key: Hashable) -> Tuple[Any, Hashable, float]:
+        """Removes a queued task by key.
+
+        The caller must hold the lock.
+
+        :param key: The key of the task to remove.
+
+        :return: the tuple ``(task, key, queued)``, where ``queued`` is the
+            monotonic time at which the task was first queued
+        """
+        (priority, group) = self._keys.pop(key)
+        tasks = self._queues[priority][group]
+        item = next(item for item in tasks if item[1] == key)
+        tasks.remove(item)
+        if not tasks:
+            del self._queues[priority][group]
+        return item
+
+
 class Executor(Thread):
     #: The type of task handled by this executor.
     Task = TypeVar('Task')
@@ -37,11 +325,17 @@ class Executor(Thread):
     #: The result of an executed task.
     Result = TypeVar('T', bound=ToJSON)
 
+    #: The weight of the most recent task duration in the running average.
+    DURATION_WEIGHT = 0.2
+
     def __init__(
             self,
             executor: Callable[[Task], Result],
             on_complete: Callable[[Task, Result], None],
-            on_error: Callable[[Task, Exception], None]):
+            on_error: Callable[[Task, Exception], None],
+            on_schedule: Optional[
+                Callable[[List[Tuple[Task, Priority]]], None]] = None,
+            on_cancel: Optional[Callable[[List[Task]], None]] = None):
         """A background executor.
 
         By calling :meth:`schedule`, a task is submitted and performed in a
@@ -49,21 +343,41 @@ class Executor(Thread):
         with the task and the result. If an error occurs, ``on_error`` is
         called with the task and the uncaught exception.
 
+        If ``on_schedule`` is specified, it is called with a list of tuples
+        ``(task, priority)`` whenever tasks are queued or promoted, and if
+        ``on_cancel`` is specified, it is called with a list of tasks removed
+        from the queue by :meth:`cancel`. These may be used to persist the
+        queue. Both are called while the queue is locked, so a task cannot be
+        executed before it has been persisted.
+
         :param executor: The task executor.
 
         :param on_complete: The completion function.
 
         :param on_error: The error function.
+
+        :param on_schedule: The scheduling function.
+
+        :param on_cancel: The cancellation function.
         """
         super().__init__(daemon=True)
-        self._queue = Queue()
+        self._queue = Scheduler()
         self._executor = executor
         self._on_complete = on_complete
         self._on_error = on_error
+        self._on_schedule = on_schedule
+        self._on_cancel = on_cancel
         self._state = State.IDLE
         self._task = None
+        self._task_started = None
+        self._duration = None
 
-    def schedule(self, task: Task):
+    def schedule(
+            self,
+            task: Task,
+            priority: Priority = Priority.BULK,
+            group: Hashable = None,
+            key: Hashable = None) -> bool:
         """Schedules a task to be executed.
 
         When the task has been completed, the callable passed as
@@ -71,22 +385,73 @@ class Executor(Thread):
         its argument.
 
         :param task: The task to schedule.
+
+        :param priority: The priority class of the task.
+
+        :param group: The group to which the task belongs. Tasks with the same
+            priority are executed round-robin across groups.
+
+        :param key: A key identifying the task. If a task with the same key is
+            already queued, this task is dropped.
+
+        :return: whether the task was queued
+        """
+        return self.schedule_many([(task, priority, group, key)])[0]
+
+    def schedule_many(
+            self,
+            entries: Iterable[Tuple[Task, Priority, Hashable, Hashable]]
+            ) -> List[bool]:
+        """Schedules several tasks at once.
+
+        See :meth:`schedule` for a description of the values.
+
+        :param entries: Tuples ``(task, priority, group, key)``.
+
+        :return: whether each task was queued
+        """
+        return self._queue.put_many(entries, self._on_schedule)
+
+    def cancel(
+            self,
+            key: Hashable = None,
+            group: Hashable = None) -> List[Task]:
+        """Removes queued tasks.
+
+        A task that is currently executing is not affected.
+
+        :param key: If specified, the task with this key is removed.
+
+        :param group: If specified, all tasks in this group are removed.
+
+        :return: the removed tasks
         """
-        self._queue.put(task)
+        return self._queue.cancel(key, group, self._on_cancel)
 
     def run(self):
         self._state = State.RUNNING
         while self._state == State.RUNNING:
-            task = self._queue.get()
-            if task is not None:
+            item = self._queue.get()
+            if item is not None:
+                (task, priority, _) = item
                 self._task = task
+                self._task_started = time.time()
+                outcome = 'error'
                 try:
                     result = self._executor(task)
                     self._on_complete(task, result)
+                    outcome = 'complete'
                 except Exception as e:
                     self._on_error(task, e)
                 finally:
+                    duration = time.time() - self._task_started
+                    EXECUTION_SECONDS.observe(
+                        duration,
+                        priority=priority.name.lower(),
+                        outcome=outcome)
+                    self._update_duration(duration)
                     self._task = None
+                    self._task_started = None
         self._state = State.STOPPED
 
     def stop(self):
@@ -95,7 +460,7 @@ class Executor(Thread):
         This call is blocking until the currently executing task completes.
         """
         self._state = State.STOPPING
-        self._queue.put(None)
+        self._queue.close()
         self.join()
 
     @property
@@ -110,6 +475,41 @@ class Executor(Thread):
         """
         return self._task
 
+    @property
+    def queue(self) -> List[Entry]:
+        """All queued tasks in the order they will be executed.
+        """
+        duration = self._duration
+        started = self._task_started
+        if duration is None:
+            remaining = None
+        elif started is not None:
+            remaining = max(0.0, duration - (time.time() - started))
+        else:
+            remaining = 0.0
+
+        return [
+            Entry(
+                task=task,
+                priority=priority,
+                group=group,
+                position=position,
+                expected_wait=remaining + position * duration
+                if remaining is not None else None)
+            for (position, (task, priority, group)) in enumerate(
+                self._queue.snapshot())]
+
+    def _update_duration(self, duration: float):
+        """Updates the running average of task durations.
+
+        :param duration: The duration of the most recent task.
+        """
+        if self._duration is None:
+            self._duration = duration
+        else:
+            self._duration += self.DURATION_WEIGHT * (
+                duration - self._duration)
+
 
 def sync(f):
     """Turns an asynchronous function into a synchronous one.
@@ -125,6 +525,25 @@ def sync(f):
     return inner
 
 
+class Timings(dict):
+    """Accumulated durations, in seconds, of named phases.
+    """
+    @contextmanager
+    def phase(self, name: str):
+        """Times a phase as a context manager.
+
+        The duration is added to any previous duration of the same phase.
+
+        :param name: The name of the phase.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = self.get(name, 0.0) \
+                + time.perf_counter() - start_time
+
+
 @contextmanager
 def timer() -> Callable[[], Optional[time.time]]:
     """Constructs a simple timer as a context manager.
@@ -1,10 +1,20 @@
+import importlib
 import logging
 import multiprocessing as mp
+import os
+import sqlite3
+import time
 
-from dataclasses import dataclass
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import Enum
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
 from ... import db, ent, message
-from .. import Executor, sync
+from ... import metrics
+from .. import Executor, Priority, Timings, timer
 
 
 LOG = logging.getLogger(__name__)
@@ -15,6 +25,320 @@ KIND = 'project'
 #: The granularity of image dimensions.
 GRANULARITY = 128
 
+#: The number of seconds a worker may spend on a task before it is considered
+#: lost.
+LEASE_DURATION = 15 * 60
+
+#: The maximum number of times execution of a task is started.
+MAX_ATTEMPTS = 3
+
+#: The content type of images stored as latents, which are decoded on demand.
+LATENT_CONTENT_TYPE = 'application/x-ijave-latent'
+
+#: The durations of generator phases.
+PHASE_SECONDS = metrics.histogram(
+    'ijave_generator_phase_seconds',
+    'The duration of phases of generator calls.',
+    ('phase',))
+
+#: The lookups in the model cache of the generator.
+MODEL_CACHE_LOOKUPS = metrics.counter(
+    'ijave_generator_model_cache_lookups_total',
+    'The number of lookups in the generator model cache; misses require the '
+    'models to be compiled.',
+    ('result',))
+
+#: The supported generator precisions. ``'bfloat16'`` runs the models with
+#: mixed precision, and ``'auto'`` selects it only if the CPU supports
+#: bfloat16 natively.
+PRECISIONS = ('float32', 'bfloat16', 'auto')
+
+#: The available generator backends, mapped to the modules implementing them.
+BACKENDS = {
+    'tensorflow': 'remote',
+    'synthetic': 'synthetic'}
+
+#: The identities of the models used by each backend. Cached generation
+#: results are keyed by them, so an identity must change whenever the weights
+#: or the algorithm of its backend change.
+MODELS = {
+    'tensorflow': 'keras-sd2.1',
+    'synthetic': 'synthetic-1'}
+
+#: The default maximum total size, in bytes, of cached generation results.
+RESULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+@dataclass
+class GeneratorConfig:
+    """The configuration of the generator process.
+
+    Since several generator processes may share a host, the threads and CPUs
+    used by each can be restricted.
+    """
+    #: The generator backend; one of the keys of :data:`BACKENDS`.
+    backend: str = 'tensorflow'
+
+    #: The number of seconds each call to the synthetic backend takes.
+    synthetic_latency: float = 0.0
+
+    #: The directory to which profiler traces are written, or ``None`` to
+    #: disable profiling.
+    profile_directory: Optional[str] = None
+
+    #: The numeric precision of the models; one of :data:`PRECISIONS`.
+    precision: str = 'float32'
+
+    #: Whether to JIT compile the models.
+    jit_compile: bool = True
+
+    #: The number of threads used within an operation, or ``None`` to use the
+    #: TensorFlow default.
+    intra_op_threads: Optional[int] = None
+
+    #: The number of operations executed in parallel, or ``None`` to use the
+    #: TensorFlow default.
+    inter_op_threads: Optional[int] = None
+
+    #: The CPUs to which the generator process is pinned, or ``None`` to not
+    #: pin it.
+    cpu_affinity: Optional[List[int]] = None
+
+    def __post_init__(self):
+        if self.backend not in BACKENDS:
+            raise ValueError('unknown backend: {}'.format(self.backend))
+        if self.precision not in PRECISIONS:
+            raise ValueError('unknown precision: {}'.format(self.precision))
+        if self.synthetic_latency < 0:
+            raise ValueError('negative latency: {}'.format(
+                self.synthetic_latency))
+
+    @classmethod
+    def from_env(cls, env: dict = os.environ) -> 'GeneratorConfig':
+        """Reads a configuration from environment variables.
+
+        The variables read are ``IJAVE_BACKEND``,
+        ``IJAVE_SYNTHETIC_LATENCY``, ``IJAVE_PROFILE_DIR``,
+        ``IJAVE_PRECISION``,
+        ``IJAVE_JIT_COMPILE``, ``IJAVE_INTRA_OP_THREADS``,
+        ``IJAVE_INTER_OP_THREADS`` and ``IJAVE_CPU_AFFINITY``. Unset variables
+        keep their defaults.
+
+        :param env: The environment.
+
+        :return: a configuration
+
+        :raise ValueError: if a value is invalid
+        """
+        def integer(name: str) -> Optional[int]:
+            value = env.get(name)
+            return int(value) if value else None
+
+        return cls(
+            backend=env.get('IJAVE_BACKEND') or cls.backend,
+            synthetic_latency=float(
+                env.get('IJAVE_SYNTHETIC_LATENCY') or cls.synthetic_latency),
+            profile_directory=env.get('IJAVE_PROFILE_DIR') or None,
+            precision=env.get('IJAVE_PRECISION') or cls.precision,
+            jit_compile=env.get('IJAVE_JIT_COMPILE', '1').lower() not in (
+                '0', 'false', 'no'),
+            intra_op_threads=integer('IJAVE_INTRA_OP_THREADS'),
+            inter_op_threads=integer('IJAVE_INTER_OP_THREADS'),
+            cpu_affinity=parse_cpus(env['IJAVE_CPU_AFFINITY'])
+            if env.get('IJAVE_CPU_AFFINITY') else None)
+
+    @property
+    def policy(self) -> str:
+        """The name of the Keras dtype policy for this configuration.
+        """
+        if self.precision == 'bfloat16' or (
+                self.precision == 'auto' and bfloat16_supported()):
+            return 'mixed_bfloat16'
+        else:
+            return 'float32'
+
+    @property
+    def identity(self) -> str:
+        """The identity of the generator, which includes everything in this
+        configuration that affects generated images.
+
+        Reading this may inspect the CPU, so it should not be read repeatedly.
+        """
+        return '{}:{}:{}:{}'.format(
+            self.backend,
+            MODELS[self.backend],
+            self.policy,
+            'jit' if self.jit_compile else 'eager')
+
+    def apply(self):
+        """Applies the process wide parts of this configuration to the current
+        process.
+
+        This must be called before TensorFlow is initialised, since its thread
+        pools are created when the first operation runs.
+        """
+        if self.cpu_affinity is not None:
+            os.sched_setaffinity(0, self.cpu_affinity)
+        if self.intra_op_threads is not None:
+            os.environ['TF_NUM_INTRAOP_THREADS'] = str(self.intra_op_threads)
+            os.environ['OMP_NUM_THREADS'] = str(self.intra_op_threads)
+        if self.inter_op_threads is not None:
+            os.environ['TF_NUM_INTEROP_THREADS'] = str(self.inter_op_threads)
+
+    def to_json(self) -> dict:
+        return {
+            'backend': self.backend,
+            'synthetic_latency': self.synthetic_latency,
+            'profile_directory': self.profile_directory,
+            'precision': self.precision,
+            'jit_compile': self.jit_compile,
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+            'cpu_affinity': self.cpu_affinity}
+
+
+class Backend:
+    """A generator backend.
+
+    Backends are constructed in the generator process from a
+    :class:`GeneratorConfig`.
+    """
+    def generate(self, input: 'Input') -> 'Output':
+        """Generates the next image for a task.
+
+        :param input: The input.
+
+        :return: the output
+        """
+        return self.generate_batch([input])[0]
+
+    def generate_batch(self, inputs: List['Input']) -> List['Output']:
+        """Generates the next image for several tasks at once.
+
+        :param inputs: The inputs. All tasks must have the same image
+            dimensions.
+
+        :return: the outputs, in the same order as ``inputs``
+        """
+        raise NotImplementedError()
+
+    def decode(self, input: 'Decode') -> 'Decoded':
+        """Decodes a latent returned in a previous output.
+
+        :param input: The latent to decode.
+
+        :return: the decoded image
+        """
+        raise NotImplementedError()
+
+    def profile(self, input: 'Profile') -> bool:
+        """Captures a profiler trace of the following calls to
+        :meth:`generate_batch`.
+
+        :param input: The profiling request.
+
+        :return: whether the backend is being profiled; backends that cannot
+            be profiled return ``False``
+        """
+        return False
+
+
+class GeneratorState(Enum):
+    #: The generator process has been started.
+    STARTING = 0
+
+    #: The backend is loading its models.
+    LOADING = 1
+
+    #: The backend is ready to generate images.
+    READY = 2
+
+    #: The backend failed to load; it is loaded again when the next task is
+    #: executed.
+    FAILED = 3
+
+
+class GeneratorStatus:
+    def __init__(self, config: GeneratorConfig):
+        """The status of the generator process.
+
+        The status is shared between the server process, which reads it, and
+        the generator process, which updates it while loading the backend.
+
+        :param config: The generator configuration.
+        """
+        self.config = config
+        self.restarts = 0
+        self._state = mp.Value('i', GeneratorState.STARTING.value)
+        self._load_duration = mp.Value('d', -1.0)
+        self._initialized = mp.Event()
+        self._started = None
+
+    @property
+    def state(self) -> GeneratorState:
+        """The current state.
+        """
+        return GeneratorState(self._state.value)
+
+    @property
+    def load_duration(self) -> Optional[float]:
+        """The number of seconds taken to load the backend, or ``None`` if it
+        is not loaded.
+        """
+        value = self._load_duration.value
+        return value if value >= 0 else None
+
+    def start(self):
+        """Marks the generator process as started.
+
+        This is called in the server process.
+        """
+        if self._started is not None:
+            self.restarts += 1
+        self._started = time.time()
+        self._initialized.clear()
+        self._load_duration.value = -1.0
+        self._state.value = GeneratorState.STARTING.value
+
+    def update(
+            self, state: GeneratorState,
+            load_duration: Optional[float] = None):
+        """Updates the state.
+
+        This is called in the generator process.
+
+        :param state: The new state.
+
+        :param load_duration: The number of seconds taken to load the
+            backend, if it is ready.
+        """
+        if load_duration is not None:
+            self._load_duration.value = load_duration
+        self._state.value = state.value
+        if state in (GeneratorState.READY, GeneratorState.FAILED):
+            self._initialized.set()
+
+    def wait(self, process: mp.Process) -> bool:
+        """Waits until the backend has loaded.
+
+        :param process: The generator process.
+
+        :return: whether the backend is ready; if not, it failed to load or
+            the process exited
+        """
+        while not self._initialized.wait(1.0):
+            if not process.is_alive():
+                return False
+        return self.state == GeneratorState.READY
+
+    def to_json(self) -> dict:
+        return {
+            'state': self.state.name.lower(),
+            'backend': self.config.backend,
+            'load_duration': self.load_duration,
+            'started': self._started,
+            'restarts': self.restarts}
+
 
 @dataclass
 class Task:
@@ -32,6 +356,10 @@ class Task:
     #: The random seed used to generate the first image.
     seed: int
 
+    #: The generation of the persisted task when this task was queued; set by
+    #: the executor.
+    generation: Optional[int] = field(default=None, compare=False)
+
     def to_json(self) -> dict:
         return {
             'prompt': self.prompt.to_json(),
@@ -40,6 +368,71 @@ class Task:
             'seed': self.seed}
 
 
+@dataclass
+class SweepTask:
+    """A task generating images for several variants of a prompt at once.
+
+    Every variant is a prompt of its own. The variants are transformed
+    together, one step at a time, until all of them have completed.
+    """
+    #: The variants to generate. All variants must belong to the same project.
+    tasks: List[Task]
+
+    #: The priority with which the sweep is rescheduled after every step.
+    priority: Priority
+
+    #: A unique identifier for this sweep, used as its queue key.
+    id: UUID = field(default_factory=uuid4)
+
+    #: The number of consecutive failed attempts.
+    attempts: int = 0
+
+    @property
+    def project(self) -> ent.ProjectID:
+        """The project to which the variants belong.
+        """
+        return self.tasks[0].prompt.project
+
+    def to_json(self) -> dict:
+        return {
+            'id': str(self.id),
+            'tasks': [task.to_json() for task in self.tasks]}
+
+
+@dataclass
+class DecodeTask:
+    """A task decoding an image stored as a latent.
+    """
+    #: The image to decode.
+    image: ent.ImageID
+
+    #: The future completed when the image has been decoded.
+    future: Future = field(default_factory=Future, repr=False)
+
+    def to_json(self) -> dict:
+        return {
+            'image': str(self.image)}
+
+
+@dataclass
+class ProfileTask:
+    """A task capturing a profiler trace of the following generation steps.
+    """
+    #: The number of steps to trace.
+    steps: int
+
+    #: The future completed when tracing has started.
+    future: Future = field(default_factory=Future, repr=False)
+
+    def to_json(self) -> dict:
+        return {
+            'profile': self.steps}
+
+
+#: The tasks executed by the image executor.
+AnyTask = Union[Task, SweepTask, DecodeTask, ProfileTask]
+
+
 @dataclass
 class Result:
     """The results broadcast.
@@ -53,11 +446,17 @@ class Result:
     #: The progress.
     progress: float
 
+    #: The durations, in seconds, of the phases of the generation step. For
+    #: steps executed in a batch, these are the durations for the entire
+    #: batch. This is empty for cached results.
+    timings: Dict[str, float] = field(default_factory=dict)
+
     def to_json(self) -> dict:
         return {
             'prompt': self.prompt.to_json(),
             'image': str(self.image),
-            'progress': self.progress}
+            'progress': self.progress,
+            'timings': self.timings}
 
 
 @dataclass
@@ -68,6 +467,32 @@ class Input:
     #: The cached data.
     cached: ent.ImageExecutorCache
 
+    #: Whether to decode the generated image. If this is not set, the latent
+    #: is returned instead.
+    decode: bool = True
+
+
+@dataclass
+class Batch:
+    #: The inputs to execute together. All tasks must have the same image
+    #: dimensions.
+    inputs: List[Input]
+
+
+@dataclass
+class Decode:
+    #: A latent serialised by the generator.
+    latent: bytes
+
+
+@dataclass
+class Profile:
+    #: The directory to which to write the trace.
+    directory: str
+
+    #: The number of calls to trace.
+    steps: int
+
 
 @dataclass
 class Output:
@@ -83,6 +508,74 @@ class Output:
     #: An encoded image.
     image_data: bytes
 
+    #: The durations of the phases of the call that generated this output.
+    timings: Timings = field(default_factory=Timings)
+
+
+@dataclass
+class Decoded:
+    #: The image content type.
+    content_type: str
+
+    #: An encoded image.
+    image_data: bytes
+
+    #: The durations of the phases of decoding.
+    timings: Timings = field(default_factory=Timings)
+
+
+def parse_cpus(s: str) -> List[int]:
+    """Parses a list of CPUs.
+
+    The list is a comma separated list of CPU indices and inclusive ranges,
+    such as ``0-3,8``.
+
+    :param s: The string to parse.
+
+    :return: a sorted list of CPU indices
+
+    :raise ValueError: if the string is invalid
+    """
+    result = set()
+    for part in s.split(','):
+        (first, _, last) = part.strip().partition('-')
+        result.update(range(int(first), int(last or first) + 1))
+    if not result:
+        raise ValueError('no CPUs in {}'.format(s))
+    return sorted(result)
+
+
+def bfloat16_supported() -> bool:
+    """Determines whether the CPU supports bfloat16 arithmetic natively.
+
+    :return: whether any CPU advertises the ``avx512_bf16`` or ``amx_bf16``
+        flags
+    """
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            return any(
+                'avx512_bf16' in line.split() or 'amx_bf16' in line.split()
+                for line in f
+                if line.startswith('flags'))
+    except OSError:
+        return False
+
+
+def backend(config: GeneratorConfig) -> Backend:
+    """Constructs the generator backend selected by a configuration.
+
+    The module implementing the backend is imported only when this function
+    is called.
+
+    :param config: The configuration.
+
+    :return: a backend
+    """
+    module = importlib.import_module(
+        '.' + BACKENDS[config.backend],
+        __name__)
+    return module.Generator(config)
+
 
 def normalize(i: int) -> int:
     """Normalises a dimension value to the granularity.
@@ -95,80 +588,555 @@ def normalize(i: int) -> int:
 
 def executor(
         database: db.Database,
-        broker: message.Broker) -> Executor:
+        broker: message.Broker,
+        latent_previews: bool = False,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        config: Optional[GeneratorConfig] = None) -> Executor:
     """Generates an executor for images.
 
     When an image has been generated, it is sent on the topic
     ``(KIND, project_id)``.
 
+    The queue is persisted in the database, and tasks that were queued or
+    executing when the previous process stopped are requeued.
+
     :param database: The application database.
 
     :param broker: A message broker.
+
+    :param latent_previews: Whether to store intermediate images as latents
+        with the content type :data:`LATENT_CONTENT_TYPE` instead of decoding
+        them. They are decoded when requested using :func:`decode`.
+
+    :param result_cache_size: The maximum total size, in bytes, of cached
+        generation results. Generation is deterministic, so a step whose
+        parameters and input latent match a result cached by the same
+        generator, as identified by :attr:`GeneratorConfig.identity`, is not
+        recomputed.
+        Set this to ``0`` to disable the cache.
+
+    :param config: The configuration of the generator process. If not
+        specified, it is read from the environment.
+
+    :return: an executor; its attribute ``generator`` is the
+        :class:`GeneratorStatus` of the generator process, which loads in the
+        background
     """
+    if config is None:
+        config = GeneratorConfig.from_env()
+    status = GeneratorStatus(config)
+    generator_identity = config.identity
+
     def remote_executor(pipe):
-        from . import remote
+        config.apply()
 
-        generator = remote.Generator()
+        status.update(GeneratorState.LOADING)
+        try:
+            with timer() as duration:
+                generator = backend(config)
+        except Exception:
+            LOG.exception('Failed to load the %s backend', config.backend)
+            status.update(GeneratorState.FAILED)
+            return
+        LOG.info('Loaded the %s backend in %s s', config.backend, duration())
+        status.update(GeneratorState.READY, duration())
 
         while True:
             try:
                 command = pipe.recv()
-                result = generator.generate(command)
+                if isinstance(command, Decode):
+                    result = generator.decode(command)
+                elif isinstance(command, Batch):
+                    result = generator.generate_batch(command.inputs)
+                elif isinstance(command, Profile):
+                    result = generator.profile(command)
+                else:
+                    result = generator.generate(command)
                 pipe.send(result)
             except EOFError:
                 LOG.info('Remote executor shutting down')
                 return
 
-    (local_pipe, remote_pipe) = mp.Pipe()
-    process = mp.Process(target=remote_executor, args=(remote_pipe,))
-    process.start()
+    def remote_start() -> Connection:
+        nonlocal process
+        (local_pipe, remote_pipe) = mp.Pipe()
+        process = mp.Process(
+            target=remote_executor,
+            args=(remote_pipe,),
+            daemon=True)
+        status.start()
+        process.start()
+        remote_pipe.close()
+        return local_pipe
+
+    process = None
+    local_pipe = remote_start()
+
+    def remote(
+            command: Union[Input, Batch, Decode, Profile],
+            ) -> Union[Output, List[Output], Decoded, bool]:
+        nonlocal local_pipe
 
-    def execute(task: Task) -> Result:
+        # Loading the backend may take longer than a lease
+        if not status.wait(process):
+            process.join()
+            local_pipe = remote_start()
+            raise RuntimeError('generator backend failed to load')
+
+        try:
+            local_pipe.send(command)
+            if not local_pipe.poll(LEASE_DURATION):
+                raise TimeoutError('remote executor did not respond')
+            return local_pipe.recv()
+        except (EOFError, OSError):
+            LOG.error('Remote executor lost; restarting')
+            process.terminate()
+            local_pipe = remote_start()
+            raise
+
+    def execute_profile(task: ProfileTask):
+        if config.profile_directory is None:
+            raise ValueError('profiling is disabled')
+        if not remote(Profile(
+                directory=config.profile_directory,
+                steps=task.steps)):
+            raise ValueError('profiling is not supported by the {} '
+                             'backend'.format(config.backend))
+
+    def observe(timings: Timings):
+        for (phase, duration) in timings.items():
+            PHASE_SECONDS.observe(duration, phase=phase)
+        if 'model' in timings:
+            MODEL_CACHE_LOOKUPS.inc(
+                result='miss' if 'compile' in timings else 'hit')
+
+    def execute_decode(task: DecodeTask):
         with database.transaction() as tx:
-            cached = database.load(
-                tx,
-                ent.ImageExecutorCacheID.from_prompt_id(task.prompt.id))
-        if cached.step >= cached.steps:
+            entity = database.load(tx, task.image)
+        if entity is None or entity.content_type != LATENT_CONTENT_TYPE:
+            # The image was deleted or decoded by an earlier request
+            return
+
+        r = remote(Decode(latent=entity.data))
+        observe(r.timings)
+
+        with database.transaction() as tx:
+            entity.content_type = r.content_type
+            entity.data = r.image_data
+            database.update(tx, entity)
+
+    def lease(tx: sqlite3.Cursor, task: Task) -> Optional[Input]:
+        task_id = ent.ImageExecutorTaskID.from_prompt_id(task.prompt.id)
+        cached = database.load(
+            tx,
+            ent.ImageExecutorCacheID.from_prompt_id(task.prompt.id))
+        queued = database.load(tx, task_id)
+        if cached is None or cached.step >= cached.steps:
+            if queued is not None:
+                database.delete(tx, task_id)
+        elif queued is not None:
+            queued.lease = database.now() + LEASE_DURATION
+            queued.attempts += 1
+            database.update(tx, queued)
+        if cached is None:
+            LOG.info(
+                'Received request to execute task %s, but it was deleted',
+                task)
+            return None
+        elif cached.step >= cached.steps:
             LOG.info(
                 'Received request to execute task %s, but it has completed',
                 task)
+            return None
+        else:
+            return Input(
+                task=task,
+                cached=cached,
+                decode=not latent_previews
+                or cached.step + 1 >= cached.steps)
+
+    def result_id(input: Input) -> ent.ResultCacheID:
+        return ent.ResultCacheID.from_parameters(
+            generator_identity,
+            input.task.prompt.text,
+            input.task.seed,
+            normalize(input.task.width),
+            normalize(input.task.height),
+            input.cached.steps,
+            input.cached.strength,
+            input.cached.step,
+            input.cached.latent)
+
+    def lookup(
+            tx: sqlite3.Cursor,
+            id: ent.ResultCacheID,
+            input: Input) -> Optional[Output]:
+        entry = database.load(tx, id)
+        if entry is None or (input.decode and entry.data is None):
+            return None
+
+        entry.timestamp = database.now()
+        database.update(tx, entry)
+
+        LOG.info('Using cached result for %s', input.task)
+        cached = input.cached
+        cached.step += 1
+        cached.latent = entry.latent
+        return Output(
+            task=input.task,
+            cached=cached,
+            content_type=entry.content_type,
+            image_data=entry.data if entry.data is not None else entry.latent)
+
+    def remember(tx: sqlite3.Cursor, id: ent.ResultCacheID, r: Output):
+        entry = ent.ResultCache(
+            id=id,
+            timestamp=database.now(),
+            latent=r.cached.latent,
+            content_type=r.content_type,
+            data=r.image_data if r.content_type != LATENT_CONTENT_TYPE
+            else None)
+        if not database.update(tx, entry):
+            database.create(tx, entry)
+
+    def generate(inputs: List[Input]) -> List[Output]:
+        if not result_cache_size:
+            outputs = remote(Batch(inputs=inputs))
+            observe(outputs[0].timings)
+            return outputs
+
+        ids = [result_id(input) for input in inputs]
+        with database.transaction() as tx:
+            outputs = [
+                lookup(tx, id, input)
+                for (id, input) in zip(ids, inputs)]
+        misses = [n for (n, output) in enumerate(outputs) if output is None]
+        if not misses:
+            return outputs
+
+        generated = remote(Batch(inputs=[inputs[n] for n in misses]))
+        observe(generated[0].timings)
+
+        with database.transaction() as tx:
+            for (n, r) in zip(misses, generated):
+                outputs[n] = r
+                remember(tx, ids[n], r)
+            database.evict_results(tx, result_cache_size)
+
+        return outputs
+
+    def store(tx: sqlite3.Cursor, r: Output, queued: bool) -> Result:
+        # Update the state
+        database.update(tx, r.cached)
+
+        # Store the image and link it to the prompt
+        entity = ent.Image(
+            id=ent.ImageID.new(),
+            timestamp=database.now(),
+            content_type=r.content_type,
+            data=r.image_data)
+        database.create(tx, entity)
+        database.link(tx, r.task.prompt, entity)
+
+        task_id = ent.ImageExecutorTaskID.from_prompt_id(r.task.prompt.id)
+        row = database.load(tx, task_id)
+        if row is None:
+            pass
+        elif r.cached.step < r.cached.steps and (
+                queued or row.generation != r.task.generation):
+            # The task remains queued, or was queued again while it was
+            # executing; release the lease
+            row.lease = None
+            row.attempts = 0
+            database.update(tx, row)
+        else:
+            # The task is no longer queued
+            database.delete(tx, task_id)
+
+        return Result(
+            prompt=r.task.prompt,
+            image=entity.id,
+            progress=(r.cached.step + 1) / r.cached.steps,
+            timings=dict(r.timings))
+
+    def execute_sweep(task: SweepTask) -> List[Result]:
+        with database.transaction() as tx:
+            inputs = [
+                input
+                for input in (lease(tx, t) for t in task.tasks)
+                if input is not None]
+        if not inputs:
+            return []
+
+        outputs = generate(inputs)
+
+        with database.transaction() as tx:
+            return [store(tx, r, True) for r in outputs]
+
+    def execute(task: AnyTask) -> Union[Optional[Result], List[Result]]:
+        if isinstance(task, DecodeTask):
+            return execute_decode(task)
+        elif isinstance(task, ProfileTask):
+            return execute_profile(task)
+        elif isinstance(task, SweepTask):
+            return execute_sweep(task)
+
+        with database.transaction() as tx:
+            input = lease(tx, task)
+        if input is None:
             return
 
-        local_pipe.send(Input(
-            task=task,
-            cached=cached))
-        r = local_pipe.recv()
+        (r,) = generate([input])
 
         with database.transaction() as tx:
-            # Update the state
-            database.update(tx, r.cached)
-
-            # Store the image and link it to the prompt
-            entity = ent.Image(
-                id=ent.ImageID.new(),
-                timestamp=database.now(),
-                content_type=r.content_type,
-                data=r.image_data)
-            database.create(tx, entity)
-            database.link(tx, r.task.prompt, entity)
-
-            return Result(
-                prompt=r.task.prompt,
-                image=entity.id,
-                progress=(r.cached.step + 1) / r.cached.steps)
-
-    @sync
-    async def on_complete(task: Task, result: Result):
+            return store(tx, r, False)
+
+    def on_complete(
+            task: AnyTask,
+            result: Union[Optional[Result], List[Result]]):
+        if isinstance(task, DecodeTask):
+            task.future.set_result(task.image)
+        elif isinstance(task, ProfileTask):
+            task.future.set_result(None)
+        elif isinstance(task, SweepTask):
+            broadcast(task.project, result)
+            sweep_continue(task, 0)
+        elif result is not None:
+            broadcast(task.prompt.project, [result])
+
+    def broadcast(project: ent.ProjectID, results: List[Result]):
         topic = message.Topic(
             kind=KIND,
-            name=task.prompt.project)
-        broadcaster = await broker.broadcaster(topic)
-        await broadcaster.send(result)
+            name=project)
+        for result in results:
+            broker.publish(topic, result)
+
+    def sweep_continue(task: SweepTask, attempts: int):
+        with database.transaction() as tx:
+            remaining = [
+                t
+                for t in task.tasks
+                if database.load(
+                    tx,
+                    ent.ImageExecutorTaskID.from_prompt_id(t.prompt.id),
+                ) is not None]
+        if remaining:
+            task.tasks = remaining
+            task.attempts = attempts
+            result.schedule(task, task.priority, task.project, task.id)
+
+    def on_error(task: AnyTask, error: Exception):
+        if isinstance(task, DecodeTask):
+            LOG.error('Failed to decode %s: %s', task.image, error)
+            task.future.set_exception(error)
+            return
+        elif isinstance(task, ProfileTask):
+            LOG.error('Failed to start profiling: %s', error)
+            task.future.set_exception(error)
+            return
+        elif isinstance(task, SweepTask):
+            LOG.exception('Failed to generate images for {}'.format(task))
+            if task.attempts + 1 >= MAX_ATTEMPTS:
+                LOG.error(
+                    'Giving up on %s after %d attempts',
+                    task, task.attempts + 1)
+                on_cancel([task])
+            else:
+                with database.transaction() as tx:
+                    for queued in database.load_many(tx, (
+                            ent.ImageExecutorTaskID.from_prompt_id(
+                                t.prompt.id)
+                            for t in task.tasks)):
+                        if queued is not None:
+                            queued.lease = None
+                            database.update(tx, queued)
+                sweep_continue(task, task.attempts + 1)
+            return
 
-    def on_error(task: Task, error: Exception):
         LOG.exception('Failed to generate an image for {}'.format(task))
 
-    return Executor(
+        task_id = ent.ImageExecutorTaskID.from_prompt_id(task.prompt.id)
+        with database.transaction() as tx:
+            queued = database.load(tx, task_id)
+            if queued is None:
+                return
+            elif queued.attempts >= MAX_ATTEMPTS:
+                LOG.error(
+                    'Giving up on %s after %d attempts',
+                    task, queued.attempts)
+                database.delete(tx, task_id)
+                return
+            else:
+                queued.lease = None
+                database.update(tx, queued)
+
+        result.schedule(
+            task,
+            Priority(queued.priority),
+            task.prompt.project,
+            task.prompt.id)
+
+    def variants(task: AnyTask) -> List[Task]:
+        if isinstance(task, (DecodeTask, ProfileTask)):
+            return []
+        elif isinstance(task, SweepTask):
+            return task.tasks
+        else:
+            return [task]
+
+    def on_schedule(
+            entries: List[Tuple[AnyTask, Priority]]):
+        # A task whose generation matches its row is already queued and was
+        # promoted; any other task is queued anew
+        tasks = {
+            ent.ImageExecutorTaskID.from_prompt_id(t.prompt.id): (t, p)
+            for (entry, p) in entries
+            for t in variants(entry)}
+        with database.transaction() as tx:
+            created = []
+            for ((task_id, (task, priority)), queued) in zip(
+                    tasks.items(),
+                    database.load_many(tx, tasks)):
+                if queued is None:
+                    task.generation = 0
+                    created.append(ent.ImageExecutorTask(
+                        id=task_id,
+                        priority=priority.value,
+                        timestamp=database.now(),
+                        lease=None,
+                        attempts=0,
+                        generation=task.generation))
+                elif queued.generation != task.generation \
+                        or queued.priority != priority.value:
+                    if queued.generation != task.generation:
+                        queued.generation += 1
+                        task.generation = queued.generation
+                    queued.priority = priority.value
+                    database.update(tx, queued)
+            database.create_many(tx, created)
+
+    def on_cancel(tasks: List[AnyTask]):
+        for task in tasks:
+            if isinstance(task, (DecodeTask, ProfileTask)):
+                task.future.cancel()
+        with database.transaction() as tx:
+            database.delete_many(tx, (
+                ent.ImageExecutorTaskID.from_prompt_id(t.prompt.id)
+                for task in tasks
+                for t in variants(task)))
+
+    result = Executor(
         execute,
         on_complete,
-        on_error)
+        on_error,
+        on_schedule,
+        on_cancel)
+
+    result.generator = status
+
+    result.schedule_many(
+        (task, priority, task.prompt.project, task.prompt.id)
+        for (task, priority) in recover(database))
+
+    return result
+
+
+def decode(executor: Executor, image: ent.ImageID) -> Future:
+    """Schedules decoding of an image stored as a latent.
+
+    When the returned future has completed, the image has been replaced by its
+    decoded version in the database.
+
+    :param executor: An executor returned by :func:`executor`.
+
+    :param image: The ID of the image to decode.
+
+    :return: a future
+    """
+    task = DecodeTask(image=image)
+    executor.schedule(task, Priority.INTERACTIVE)
+    return task.future
+
+
+def sweep(
+        executor: Executor,
+        tasks: List[Task],
+        priority: Priority) -> SweepTask:
+    """Schedules a sweep over several variants of a prompt.
+
+    The variants are generated together until all of them have completed, and
+    a :class:`Result` is broadcast for every generated image.
+
+    :param executor: An executor returned by :func:`executor`.
+
+    :param tasks: The variants. They must all belong to the same project.
+
+    :param priority: The priority of the sweep.
+
+    :return: the scheduled task
+    """
+    task = SweepTask(tasks=tasks, priority=priority)
+    executor.schedule(task, priority, task.project, task.id)
+    return task
+
+
+def profile(executor: Executor, steps: int) -> Future:
+    """Schedules capturing a profiler trace of the following generation
+    steps.
+
+    The trace is written to the profile directory of the generator
+    configuration.
+
+    :param executor: An executor returned by :func:`executor`.
+
+    :param steps: The number of generator calls to trace.
+
+    :return: a future completed when tracing has started, or failed with
+        :class:`ValueError` if profiling is disabled or not supported by the
+        backend
+    """
+    task = ProfileTask(steps=steps)
+    executor.schedule(task, Priority.INTERACTIVE)
+    return task.future
+
+
+def recover(database: db.Database) -> List[Tuple[Task, Priority]]:
+    """Loads the tasks persisted in the database.
+
+    Tasks whose prompts have been deleted or completed are removed, as are
+    tasks that have been attempted too many times. Since the worker is owned
+    by this process, any task holding a lease was being executed when the
+    previous process stopped, and is retried.
+
+    :param database: The application database.
+
+    :return: a list of tuples ``(task, priority)``
+    """
+    result = []
+    with database.transaction() as tx:
+        for queued in database.image_executor_tasks(tx):
+            prompt = database.load(tx, queued.id.prompt)
+            project = database.load(tx, prompt.project) \
+                if prompt is not None else None
+            cached = database.load(
+                tx,
+                ent.ImageExecutorCacheID.from_prompt_id(queued.id.prompt))
+            if project is None or cached is None \
+                    or cached.step >= cached.steps \
+                    or queued.attempts >= MAX_ATTEMPTS:
+                database.delete(tx, queued.id)
+                continue
+            elif queued.lease is not None:
+                LOG.info('Retrying lost task for %s', prompt)
+                queued.lease = None
+                database.update(tx, queued)
+
+            result.append((
+                Task(
+                    prompt=prompt,
+                    width=project.image_width,
+                    height=project.image_height,
+                    seed=cached.seed),
+                Priority(queued.priority)))
+
+    return result
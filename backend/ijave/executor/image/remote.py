@@ -3,7 +3,8 @@ import logging
 import os
 import threading
 
-from math import log, sqrt
+from math import log
+from typing import List, Optional
 
 import numpy as np
 import PIL.Image as im
@@ -23,19 +24,18 @@ from keras_cv.models.stable_diffusion.text_encoder import (
     TextEncoderV2 as TextEncoder)
 from tensorflow import keras
 
-from .. import timer
-from . import normalize, Input, Output, Task
+from .. import Timings, timer
+from . import (
+    normalize, Backend, Decode, Decoded, GeneratorConfig, Input, Output,
+    Profile, Task, LATENT_CONTENT_TYPE)
 
 LOG = logging.getLogger(__name__)
 
 #: The maximum prompt length.
 MAX_PROMPT_LENGTH = 77
 
-#: Whether to JIT compile the models for better runtime performance.
-#:
-#: Enabling this will yield a performance increase around 15%, but compile time
-#: increases.
-JIT_COMPILE = True
+#: The maximum number of latents transformed or decoded at once.
+MAX_BATCH_SIZE = 4
 
 #: The Huggingface base URL.
 def huggingface(name, repo, path):
@@ -72,20 +72,19 @@ DECODER_WEIGHTS = {
                  '29b4231c2469a1093869a345f55b1962'}
 
 
-#: Positions used to generate a context vector.
-POSITION_IDS = tf.convert_to_tensor(
-    [list(range(MAX_PROMPT_LENGTH))],
-    dtype=tf.int32)
+class Generator(Backend):
+    def __init__(self, config: Optional[GeneratorConfig] = None):
+        if config is None:
+            config = GeneratorConfig()
 
-#: Our unconditional tokens.
-UNCONDITIONAL_TOKENS = tf.convert_to_tensor(
-    [_UNCONDITIONAL_TOKENS],
-    dtype=tf.int32)
+        # The policy must be set before any model is constructed
+        LOG.info('Using generator configuration %s', config)
+        keras.mixed_precision.set_global_policy(config.policy)
 
+        self._model_cache = ModelCache(config.jit_compile)
 
-class Generator:
-    def __init__(self):
-        self._model_cache = ModelCache()
+        # The number of calls to generate_batch remaining to be traced
+        self._profile_steps = 0
 
         # Unless this path is provided, SimpleTokenizer will download it every
         # time
@@ -95,6 +94,13 @@ class Generator:
             bpe_path = None
         self._tokenizer = SimpleTokenizer(bpe_path)
 
+        # Positions used to generate a context vector; this is created here
+        # rather than on import, so that importing this module does not
+        # initialise the TensorFlow runtime
+        self._position_ids = tf.convert_to_tensor(
+            [list(range(MAX_PROMPT_LENGTH))],
+            dtype=tf.int32)
+
         self._text_encoder = TextEncoder(MAX_PROMPT_LENGTH)
 
         # Load weights
@@ -104,47 +110,145 @@ class Generator:
 
         # Encode unconditional tokens and positions
         self._unconditional_ctx = self._text_encoder.predict_on_batch([
-            UNCONDITIONAL_TOKENS,
-            POSITION_IDS])
+            tf.convert_to_tensor([_UNCONDITIONAL_TOKENS], dtype=tf.int32),
+            self._position_ids])
+
+    def generate_batch(self, inputs: List[Input]) -> List[Output]:
+        """Generates the next image for several tasks at once.
+
+        The latents of all tasks are transformed together in batches of at
+        most :data:`MAX_BATCH_SIZE`, and the text encoding of every distinct
+        prompt text is computed only once.
+
+        :param inputs: The inputs. All tasks must have the same image
+            dimensions.
 
-    def generate(self, input: Input) -> Output:
-        (task, cached) = (input.task, input.cached)
+        :return: the outputs, in the same order as ``inputs``
+
+        :raise ValueError: if the image dimensions differ
+        """
+        dimensions = {(i.task.width, i.task.height) for i in inputs}
+        if len(dimensions) != 1:
+            raise ValueError('image dimensions differ: {}'.format(dimensions))
+        (width, height) = dimensions.pop()
 
         LOG.info(
-            'Starting image transformation for %s, %d / %d',
-            task, cached.step + 1, cached.steps)
+            'Starting image transformation for %s',
+            ', '.join(
+                '{}, {} / {}'.format(i.task, i.cached.step + 1, i.cached.steps)
+                for i in inputs))
 
+        timings = Timings()
         with timer() as duration:
-            # If we have no previous encoded data, start with a random sample
-            if cached.latent is not None:
-                latent_prev = self._deserialize(cached.latent)
-            else:
-                latent_prev = tf.random.stateless_normal(
-                    (1, task.height // 8, task.width // 8, 4),
-                    seed=[task.seed, 1])
-
             # Acquire models and decoders; this will require a compilation step
             # for previously unhandled resolutions
-            (model, decoder) = self._model_cache[(task.width, task.height)]
+            with timings.phase('model'):
+                (model, decoder) = self._model_cache.get(
+                    (width, height), timings)
+
+            # Encode every distinct prompt text once
+            contexts = {}
+            for i in inputs:
+                text = i.task.prompt.text
+                if text not in contexts:
+                    with timings.phase('tokenize'):
+                        tokens = self._tokenize(i.task)
+                    with timings.phase('encode'):
+                        contexts[text] = self._text_encoder.predict_on_batch([
+                            tokens,
+                            self._position_ids])
+
+            latents = []
+            for offset in range(0, len(inputs), MAX_BATCH_SIZE):
+                batch = inputs[offset:offset + MAX_BATCH_SIZE]
+
+                # If we have no previous encoded data, start with a random
+                # sample
+                with timings.phase('deserialize'):
+                    latent_prev = tf.concat([
+                        self._deserialize(i.cached.latent)
+                        if i.cached.latent is not None
+                        else tf.random.stateless_normal(
+                            (1, height // 8, width // 8, 4),
+                            seed=[i.task.seed, 1])
+                        for i in batch], 0)
+
+                # Transform the encoded data
+                latents.append(self._transform(
+                    model,
+                    [i.cached.step for i in batch],
+                    [i.cached.steps for i in batch],
+                    [i.cached.strength for i in batch],
+                    latent_prev,
+                    tf.concat([
+                        contexts[i.task.prompt.text]
+                        for i in batch], 0),
+                    timings))
+            latent = tf.concat(latents, 0)
+
+            # Generate images for all tasks that requested it
+            decode = [n for (n, i) in enumerate(inputs) if i.decode]
+            images = dict(zip(decode, self._decode_batch(
+                decoder,
+                tf.gather(latent, decode),
+                timings))) if decode else {}
+
+            result = []
+            for (n, i) in enumerate(inputs):
+                cached = i.cached
+                cached.step += 1
+                with timings.phase('serialize'):
+                    cached.latent = self._serialize(latent[n:n + 1].numpy())
+                result.append(Output(
+                    task=i.task,
+                    cached=cached,
+                    content_type='image/png'
+                    if i.decode else LATENT_CONTENT_TYPE,
+                    image_data=images[n]
+                    if i.decode else cached.latent,
+                    timings=timings))
+
+        LOG.info(
+            'Completed image generation for %d tasks in %s s: %s',
+            len(inputs), duration(), ', '.join(
+                '{} {:.3f} s'.format(phase, seconds)
+                for (phase, seconds) in timings.items()))
+
+        if self._profile_steps > 0:
+            self._profile_steps -= 1
+            if self._profile_steps == 0:
+                tf.profiler.experimental.stop()
+                LOG.info('Stopped profiling')
 
-            # Transform the encoded data and generate an image
-            tokens = self._tokenize(task)
-            ctx = self._text_encoder.predict_on_batch([tokens, POSITION_IDS])
-            latent = self._transform(
-                model, cached.step, cached.steps, cached.strength, latent_prev,
-                ctx)
-            image_data = self._decode(decoder, latent)
+        return result
 
-        cached.step += 1
-        cached.latent = self._serialize(latent)
+    def decode(self, input: Decode) -> Decoded:
+        latent = self._deserialize(input.latent)
+        (_, height, width, _) = latent.shape
+
+        timings = Timings()
+        with timer() as duration:
+            with timings.phase('model'):
+                (_, decoder) = self._model_cache.get(
+                    (width * 8, height * 8), timings)
+            image_data = self._decode(decoder, latent, timings)
 
-        LOG.info('Completed image generation for %s in %s s', task, duration())
+        LOG.info('Decoded latent image in %s s', duration())
 
-        return Output(
-            task=task,
-            cached=cached,
+        return Decoded(
             content_type='image/png',
-            image_data=image_data)
+            image_data=image_data,
+            timings=timings)
+
+    def profile(self, input: Profile) -> bool:
+        if self._profile_steps > 0:
+            LOG.info('Already profiling')
+            return True
+        LOG.info(
+            'Profiling %d steps to %s', input.steps, input.directory)
+        tf.profiler.experimental.start(input.directory)
+        self._profile_steps = input.steps
+        return True
 
     def _tokenize(self, task: Task) -> tf.Tensor:
         """Tokenises the prompt text.
@@ -165,53 +269,104 @@ class Generator:
                 dtype=tf.int32)
 
     def _transform(
-            self, model: DiffusionModel, step: int, steps: int,
-            strength: float, latent: tf.Tensor, ctx: tf.Tensor) -> tf.Tensor:
-        """Generates the next image.
+            self, model: DiffusionModel, step: List[int], steps: List[int],
+            strength: List[float], latent: tf.Tensor,
+            ctx: tf.Tensor, timings: Timings) -> tf.Tensor:
+        """Generates the next image for a batch of latents.
+
+        All arguments are given per latent in the batch.
 
         :param model: The diffusion model to use.
 
-        :param step: The current step.
+        :param step: The current steps.
+
+        :param steps: The total numbers of steps.
 
-        :param steps: The total number of steps.
+        :param strength: The strengths of the transformation.
 
-        :param strength: The strength of the transformation.
+        :param latent: The current encoded images.
 
-        :param latent: The current encoded image.
+        :param ctx: The encoded prompts.
 
-        :param ctx: The encoded prompt.
+        :param timings: The timings to which to add the durations of the
+            model invocations.
 
         :return: a tensor
         """
-        timestep = self._timestep(step, steps)
-        timestep_prev = self._timestep(step + 1, steps)
-        alpha = self._alpha(timestep)
-        alpha_prev = self._alpha(timestep_prev)
+        def column(values: List[float]) -> tf.Tensor:
+            return tf.reshape(
+                tf.convert_to_tensor(values, dtype=tf.float32),
+                [-1, 1, 1, 1])
+
+        timestep = [self._timestep(*s) for s in zip(step, steps)]
+        timestep_prev = [self._timestep(s + 1, n) for (s, n) in zip(
+            step, steps)]
+        alpha = column([self._alpha(t) for t in timestep])
+        alpha_prev = column([self._alpha(t) for t in timestep_prev])
+
+        e = tf.concat([self._embedding(t) for t in timestep], 0)
+        unconditional_ctx = tf.repeat(
+            self._unconditional_ctx,
+            len(timestep),
+            axis=0)
+
+        with timings.phase('unet_unconditional'):
+            a = tf.cast(
+                model.predict_on_batch([latent, e, unconditional_ctx]),
+                tf.float32)
+        with timings.phase('unet_conditional'):
+            b = tf.cast(
+                model.predict_on_batch([latent, e, ctx]),
+                tf.float32)
+        c = a + column(strength) * (b - a)
+        d = (latent - tf.sqrt(1 - alpha) * c) / tf.sqrt(alpha)
+
+        return c * tf.sqrt(1 - alpha_prev) + tf.sqrt(alpha_prev) * d
+
+    def _decode(
+            self, decoder: DiffusionModel, latent: tf.Tensor,
+            timings: Timings) -> bytes:
+        """Converts encoded data to an image.
 
-        e = self._embedding(timestep)
+        :param decoder: The decoder model.
 
-        a = model.predict_on_batch([latent, e, self._unconditional_ctx])
-        b = model.predict_on_batch([latent, e, ctx])
-        c = a + strength * (b - a)
-        d = (latent - sqrt(1 - alpha) * c) / sqrt(alpha)
+        :param latent: The data to convert.
 
-        return c * sqrt(1 - alpha_prev) + sqrt(alpha_prev) * d
+        :param timings: The timings to which to add the durations of
+            decoding.
 
-    def _decode(self, decoder: DiffusionModel, latent: tf.Tensor) -> bytes:
-        """Converts encoded data to an image.
+        :return: encoded image data
+        """
+        return self._decode_batch(decoder, latent, timings)[0]
+
+    def _decode_batch(
+            self, decoder: DiffusionModel, latent: tf.Tensor,
+            timings: Timings) -> List[bytes]:
+        """Converts a batch of encoded data to images.
 
         :param decoder: The decoder model.
 
         :param latent: The data to convert.
 
-        :return: encoded image data
+        :param timings: The timings to which to add the durations of
+            decoding.
+
+        :return: encoded image data for every item in the batch
         """
-        decoded = ((decoder.predict_on_batch(latent) + 1) / 2) * 255
-        data = np.clip(decoded, 0, 255).astype('uint8').squeeze()
-        image = im.fromarray(data, mode='RGB')
-        with io.BytesIO() as out:
-            image.save(out, format='PNG')
-            return out.getvalue()
+        result = []
+        for offset in range(0, latent.shape[0], MAX_BATCH_SIZE):
+            with timings.phase('decode'):
+                decoded = ((tf.cast(
+                    decoder.predict_on_batch(
+                        latent[offset:offset + MAX_BATCH_SIZE]),
+                    tf.float32).numpy() + 1) / 2) * 255
+            with timings.phase('png'):
+                for data in np.clip(decoded, 0, 255).astype('uint8'):
+                    image = im.fromarray(data, mode='RGB')
+                    with io.BytesIO() as out:
+                        image.save(out, format='PNG')
+                        result.append(out.getvalue())
+        return result
 
     def _deserialize(self, data: bytes) -> np.array:
         """Deserialises data into a numpy array.
@@ -281,14 +436,37 @@ class ModelCache:
     """A simple synchonised cache for models and decoders keyed on normalised
     image dimensions.
     """
-    def __init__(self):
+    def __init__(self, jit_compile: bool = True):
+        """A model cache.
+
+        :param jit_compile: Whether to JIT compile the models for better
+            runtime performance. Enabling this will yield a performance
+            increase around 15%, but compile time increases.
+        """
         self._cache = {}
         self._lock = threading.RLock()
+        self._jit_compile = jit_compile
 
         self._model_weights_path = keras.utils.get_file(**MODEL_WEIGHTS)
         self._decoder_weights_path = keras.utils.get_file(**DECODER_WEIGHTS)
 
     def __getitem__(self, key: (int, int)) -> (DiffusionModel, Decoder):
+        return self.get(key, Timings())
+
+    def get(
+            self, key: (int, int),
+            timings: Timings) -> (DiffusionModel, Decoder):
+        """Looks up the model and decoder for image dimensions, compiling them
+        if necessary.
+
+        :param key: The image dimensions.
+
+        :param timings: The timings to which to add the duration of the
+            ``'compile'`` phase if the models are compiled; the absence of
+            that phase indicates a cache hit.
+
+        :return: the tuple ``(model, decoder)``
+        """
         key = (normalize(key[0]), normalize(key[1]))
         with self._lock:
             if key not in self._cache:
@@ -296,13 +474,14 @@ class ModelCache:
 
                 (width, height) = key
 
-                model = DiffusionModel(height, width, MAX_PROMPT_LENGTH)
-                model.compile(jit_compile=JIT_COMPILE)
-                model.load_weights(self._model_weights_path)
+                with timings.phase('compile'):
+                    model = DiffusionModel(height, width, MAX_PROMPT_LENGTH)
+                    model.compile(jit_compile=self._jit_compile)
+                    model.load_weights(self._model_weights_path)
 
-                decoder = Decoder(height, width)
-                decoder.compile(jit_compile=JIT_COMPILE)
-                decoder.load_weights(self._decoder_weights_path)
+                    decoder = Decoder(height, width)
+                    decoder.compile(jit_compile=self._jit_compile)
+                    decoder.load_weights(self._decoder_weights_path)
 
                 self._cache[key] = (model, decoder)
 
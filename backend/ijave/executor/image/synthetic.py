@@ -0,0 +1,151 @@
+import io
+import logging
+import time
+import zlib
+
+from typing import List, Optional
+
+import numpy as np
+import PIL.Image as im
+
+from .. import Timings, timer
+from . import (
+    normalize, Backend, Decode, Decoded, GeneratorConfig, Input, Output,
+    LATENT_CONTENT_TYPE)
+
+
+LOG = logging.getLogger(__name__)
+
+#: The mask applied to seeds before they are used as entropy, since NumPy
+#: rejects negative values.
+SEED_MASK = 0xFFFFFFFF
+
+
+class Generator(Backend):
+    """A synthetic generator backend.
+
+    Latents and images have the same shapes and formats as those of the
+    TensorFlow backend, and are derived deterministically from the prompt
+    text, seed, strength and step, but no models are involved. This allows
+    exercising everything but the models on machines without them.
+    """
+    def __init__(self, config: Optional[GeneratorConfig] = None):
+        if config is None:
+            config = GeneratorConfig(backend='synthetic')
+        LOG.info('Using synthetic generator configuration %s', config)
+        self._latency = config.synthetic_latency
+
+    def generate_batch(self, inputs: List[Input]) -> List[Output]:
+        dimensions = {(i.task.width, i.task.height) for i in inputs}
+        if len(dimensions) != 1:
+            raise ValueError('image dimensions differ: {}'.format(dimensions))
+        (width, height) = (normalize(d) for d in dimensions.pop())
+
+        timings = Timings()
+        with timer() as duration:
+            result = []
+            for i in inputs:
+                with timings.phase('transform'):
+                    latent = self._transform(i, width, height)
+                cached = i.cached
+                cached.step += 1
+                with timings.phase('serialize'):
+                    cached.latent = self._serialize(latent)
+                if i.decode:
+                    with timings.phase('png'):
+                        image_data = self._decode(latent)
+                else:
+                    image_data = cached.latent
+                result.append(Output(
+                    task=i.task,
+                    cached=cached,
+                    content_type='image/png'
+                    if i.decode else LATENT_CONTENT_TYPE,
+                    image_data=image_data,
+                    timings=timings))
+            with timings.phase('latency'):
+                time.sleep(self._latency)
+
+        LOG.info(
+            'Completed synthetic image generation for %d tasks in %s s',
+            len(inputs), duration())
+
+        return result
+
+    def decode(self, input: Decode) -> Decoded:
+        timings = Timings()
+        with timings.phase('png'):
+            image_data = self._decode(self._deserialize(input.latent))
+        return Decoded(
+            content_type='image/png',
+            image_data=image_data,
+            timings=timings)
+
+    def _transform(self, input: Input, width: int, height: int) -> np.array:
+        """Generates the next latent.
+
+        The latent is moved towards noise seeded by the prompt text, seed,
+        strength and step, reaching it at the last step.
+
+        :param input: The input.
+
+        :param width: The normalised image width.
+
+        :param height: The normalised image height.
+
+        :return: a latent with the shape ``(1, height // 8, width // 8, 4)``
+        """
+        shape = (1, height // 8, width // 8, 4)
+        seed = input.task.seed & SEED_MASK
+        if input.cached.latent is not None:
+            latent = self._deserialize(input.cached.latent)
+        else:
+            latent = np.random.default_rng(
+                [seed, 0],
+            ).standard_normal(shape, dtype=np.float32)
+
+        noise = np.random.default_rng([
+            seed,
+            input.cached.step + 1,
+            zlib.crc32(input.task.prompt.text.encode('utf-8')),
+            zlib.crc32(repr(float(input.cached.strength)).encode('ascii'))],
+        ).standard_normal(shape, dtype=np.float32)
+        weight = np.float32(
+            1 / max(1, input.cached.steps - input.cached.step))
+        return (1 - weight) * latent + weight * noise
+
+    def _decode(self, latent: np.array) -> bytes:
+        """Converts a latent to an image eight times its size.
+
+        :param latent: The latent to convert.
+
+        :return: encoded image data
+        """
+        data = np.clip((latent[0, :, :, :3] + 2) * 64, 0, 255).astype('uint8')
+        image = im.fromarray(data, mode='RGB').resize(
+            (data.shape[1] * 8, data.shape[0] * 8),
+            im.NEAREST)
+        with io.BytesIO() as out:
+            image.save(out, format='PNG')
+            return out.getvalue()
+
+    def _deserialize(self, data: bytes) -> np.array:
+        """Deserialises data into a numpy array.
+
+        :param data: The data to serialise.
+
+        :return: a numpy array
+        """
+        with io.BytesIO(data) as f:
+            return np.load(f)
+
+    def _serialize(self, data: np.array) -> bytes:
+        """Serialises a numpy array.
+
+        :param data: The array to serialise.
+
+        :return: bytes
+        """
+        with io.BytesIO() as f:
+            np.save(f, data)
+            return f.getvalue()
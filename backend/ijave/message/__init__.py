@@ -1,6 +1,12 @@
-from asyncio import Lock, Queue, create_task, wait_for, wait
+import weakref
+
+from asyncio import (
+    Lock, Queue, create_task, get_running_loop, run_coroutine_threadsafe,
+    wait_for, wait)
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from .. import metrics
 
 
 @dataclass(frozen=True, eq=True)
@@ -98,6 +104,25 @@ class Broker:
     def __init__(self):
         self._lock = Lock()
         self._topics = {}
+        self._loop = None
+        _BROKERS.add(self)
+
+    def statistics(self) -> Iterator[Tuple[str, int, int]]:
+        """Lists the listeners and queued messages of every topic.
+
+        This does not take the broker lock, so it may be called from any
+        thread, but the values may be slightly out of date.
+
+        :return: an iterator over tuples ``(kind, listeners, queued)``, where
+            ``kind`` is the topic kind and ``queued`` the number of messages
+            not yet received by listeners
+        """
+        for (topic, broadcaster) in list(self._topics.items()):
+            listeners = list(broadcaster._listeners)
+            yield (
+                topic.kind,
+                len(listeners),
+                sum(listener._queue.qsize() for listener in listeners))
 
     async def broadcaster(self, topic: Topic) -> Broadcaster:
         """Generates a broadcaster for a specific topic.
@@ -111,6 +136,25 @@ class Broker:
                 self._topics[topic] = Broadcaster(topic)
             return self._topics[topic]
 
+    def publish(self, topic: Topic, message: Any):
+        """Broadcasts a single message from any thread.
+
+        The message is sent on the event loop on which listeners are created,
+        and this method returns without waiting for it to be delivered. If no
+        listener has been created yet, nobody can receive the message, and it
+        is dropped.
+
+        :param topic: The topic of the message.
+
+        :param message: The message to send.
+        """
+        async def send():
+            broadcaster = await self.broadcaster(topic)
+            await broadcaster.send(message)
+
+        if self._loop is not None:
+            run_coroutine_threadsafe(send(), self._loop)
+
     async def listener(self, topic: Topic) -> Listener:
         """Generates a listener for a specific topic.
 
@@ -118,7 +162,45 @@ class Broker:
 
         :return: a listener
         """
+        self._loop = get_running_loop()
         broadcaster = await self.broadcaster(topic)
         result = Listener(broadcaster)
         await broadcaster._register(result)
         return result
+
+
+#: All live brokers, reported by the broker metrics.
+_BROKERS = weakref.WeakSet()
+
+
+def _collect(
+        value: Callable[[int, int], int],
+        ) -> Callable[[], Iterator[Tuple[Dict[str, str], float]]]:
+    def inner():
+        for broker in list(_BROKERS):
+            for (kind, listeners, queued) in broker.statistics():
+                yield ({'kind': kind}, value(listeners, queued))
+
+    return inner
+
+
+#: The number of topics.
+TOPICS = metrics.gauge(
+    'ijave_broker_topics',
+    'The number of message topics.',
+    ('kind',),
+    _collect(lambda listeners, queued: 1))
+
+#: The number of listeners.
+LISTENERS = metrics.gauge(
+    'ijave_broker_listeners',
+    'The number of listeners on message topics.',
+    ('kind',),
+    _collect(lambda listeners, queued: listeners))
+
+#: The number of messages not yet received.
+QUEUED = metrics.gauge(
+    'ijave_broker_queued_messages',
+    'The number of messages sent but not yet received by listeners.',
+    ('kind',),
+    _collect(lambda listeners, queued: queued))
@@ -0,0 +1,311 @@
+"""
+Metrics
+-------
+
+Metrics collected by the application, rendered in the Prometheus text format.
+
+Metrics are created with :func:`counter`, :func:`gauge` and
+:func:`histogram`, which register them in :data:`REGISTRY`. Recording a value
+only takes a lock and updates a few numbers, and gauges describing internal
+state are read only when metrics are rendered, so metrics are always enabled.
+"""
+import math
+import threading
+
+from typing import Callable, Dict, Iterable, Iterator, Sequence, Tuple
+
+
+#: The default histogram buckets, in seconds.
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0)
+
+#: The content type of rendered metrics.
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class Metric:
+    """A named metric with optional labels.
+    """
+    #: The Prometheus metric type.
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Lists the current samples of this metric.
+
+        :return: an iterator over tuples ``(name, labels, value)``
+        """
+        raise NotImplementedError()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Converts label values to a key.
+
+        :param labels: The label values.
+
+        :return: a tuple of label values ordered as :attr:`labels`
+
+        :raise ValueError: if the label names do not match
+        """
+        if set(labels) != set(self.labels):
+            raise ValueError('expected labels {}, got {}'.format(
+                self.labels, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+class Counter(Metric):
+    """A monotonically increasing value.
+    """
+    TYPE = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, value: float = 1.0, **labels: str):
+        """Increments the counter.
+
+        :param value: The amount by which to increment.
+
+        :param labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for (key, value) in values:
+            yield (self.name, dict(zip(self.labels, key)), value)
+
+
+class Gauge(Metric):
+    """A value that may go up and down.
+
+    Values are either set explicitly, or read from a collection function when
+    the metric is rendered.
+    """
+    TYPE = 'gauge'
+
+    def __init__(
+            self, name: str, help: str, labels: Sequence[str] = (),
+            collect: Callable[
+                [], Iterable[Tuple[Dict[str, str], float]]] = None):
+        """A gauge.
+
+        :param collect: A function returning tuples ``(labels, value)``,
+            called every time the metric is rendered. Values returned for the
+            same labels are summed.
+        """
+        super().__init__(name, help, labels)
+        self._values = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str):
+        """Sets the value.
+
+        :param value: The new value.
+
+        :param labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = dict(self._values)
+        if self._collect is not None:
+            for (labels, value) in self._collect():
+                key = self._key(labels)
+                values[key] = values.get(key, 0.0) + value
+        for (key, value) in values.items():
+            yield (self.name, dict(zip(self.labels, key)), value)
+
+
+class Histogram(Metric):
+    """A histogram of observed values.
+    """
+    TYPE = 'histogram'
+
+    def __init__(
+            self, name: str, help: str, labels: Sequence[str] = (),
+            buckets: Sequence[float] = BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels: str):
+        """Records an observed value.
+
+        :param value: The value.
+
+        :param labels: The label values.
+        """
+        key = self._key(labels)
+        index = next(
+            (i for (i, bound) in enumerate(self.buckets) if value <= bound),
+            len(self.buckets))
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry = self._values[key]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for (key, (counts, total)) in self._values.items()]
+        for (key, counts, total) in values:
+            labels = dict(zip(self.labels, key))
+            count = 0
+            for (bound, n) in zip(self.buckets + (math.inf,), counts):
+                count += n
+                yield (
+                    self.name + '_bucket',
+                    dict(labels, le=_format(bound)),
+                    count)
+            yield (self.name + '_sum', labels, total)
+            yield (self.name + '_count', labels, count)
+
+
+class Registry:
+    """A collection of metrics.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Registers a metric.
+
+        If a metric with the same name and type is already registered, that
+        metric is returned instead.
+
+        :param metric: The metric to register.
+
+        :return: the registered metric
+
+        :raise ValueError: if a metric with the same name but another type is
+            already registered
+        """
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError('metric {} already registered as {}'.format(
+                metric.name, existing.TYPE))
+        return existing
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text format.
+
+        :return: the rendered metrics
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(
+                metric.name,
+                metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.TYPE))
+            for (name, labels, value) in metric.samples():
+                lines.append('{}{} {}'.format(
+                    name,
+                    '{{{}}}'.format(','.join(
+                        '{}="{}"'.format(k, _escape(v))
+                        for (k, v) in labels.items())) if labels else '',
+                    _format(value)))
+        return '\n'.join(lines) + '\n'
+
+
+#: The application metrics.
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    """Creates and registers a counter in :data:`REGISTRY`.
+
+    :param name: The metric name.
+
+    :param help: A description of the metric.
+
+    :param labels: The label names.
+
+    :return: a counter
+    """
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(
+        name: str, help: str, labels: Sequence[str] = (),
+        collect: Callable[
+            [], Iterable[Tuple[Dict[str, str], float]]] = None) -> Gauge:
+    """Creates and registers a gauge in :data:`REGISTRY`.
+
+    :param name: The metric name.
+
+    :param help: A description of the metric.
+
+    :param labels: The label names.
+
+    :param collect: A function returning tuples ``(labels, value)``, called
+        every time the metric is rendered.
+
+    :return: a gauge
+    """
+    return REGISTRY.register(Gauge(name, help, labels, collect))
+
+
+def histogram(
+        name: str, help: str, labels: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS) -> Histogram:
+    """Creates and registers a histogram in :data:`REGISTRY`.
+
+    :param name: The metric name.
+
+    :param help: A description of the metric.
+
+    :param labels: The label names.
+
+    :param buckets: The upper bounds of the buckets.
+
+    :return: a histogram
+    """
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value.
+
+    :param value: The value to escape.
+
+    :return: an escaped value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _format(value: float) -> str:
+    """Formats a sample value or bucket bound.
+
+    :param value: The value to format.
+
+    :return: a string
+    """
+    if value == math.inf:
+        return '+Inf'
+    elif value == -math.inf:
+        return '-Inf'
+    elif isinstance(value, int):
+        return str(value)
+    else:
+        return repr(float(value))
@@ -0,0 +1,221 @@
+"""
+Image retention
+---------------
+
+Every step of image generation stores an image, but only the latest image of a
+prompt is generally of interest. This module provides a background compactor
+that applies a :class:`ent.RetentionPolicy` to the superseded images of every
+prompt, deleting images or replacing them with thumbnails, and then reclaims
+the freed space.
+
+The policy of a project is used if present, and otherwise the global policy. If
+neither exists, all images are retained.
+"""
+import io
+import logging
+
+from threading import Event, Thread
+from typing import Optional
+
+import PIL.Image as im
+
+from .. import db, ent
+
+
+LOG = logging.getLogger(__name__)
+
+#: The number of seconds between compaction passes.
+INTERVAL = 10 * 60
+
+#: The maximum number of images compacted in a single transaction.
+BATCH_SIZE = 16
+
+#: The maximum number of pages reclaimed while holding the database lock.
+RECLAIM_PAGES = 256
+
+#: The default number of seconds an image must have been superseded before it
+#: is compacted.
+DEFAULT_MIN_AGE = 60 * 60
+
+
+def policy(
+        database: db.Database,
+        tx: db.Cur,
+        project: ent.ProjectID) -> Optional[ent.RetentionPolicy]:
+    """Loads the retention policy applying to a project.
+
+    :param database: The application database.
+
+    :param tx: An ongoing transaction.
+
+    :param project: The project ID.
+
+    :return: the policy of the project, or the global policy if the project has
+        none, or ``None`` if neither exists
+    """
+    return database.load(
+        tx,
+        ent.RetentionPolicyID.from_project_id(project)) or database.load(
+            tx,
+            ent.RetentionPolicyID.default())
+
+
+def thumbnail(data: bytes, size: int) -> Optional[bytes]:
+    """Downsamples an encoded image so that neither dimension exceeds a size.
+
+    The image is encoded in its original format.
+
+    :param data: The encoded image.
+
+    :param size: The maximum width and height.
+
+    :return: the encoded thumbnail, or ``None`` if the image already fits
+    """
+    with im.open(io.BytesIO(data)) as image:
+        if max(image.size) <= size:
+            return None
+        image_format = image.format
+        image.thumbnail((size, size))
+        result = io.BytesIO()
+        image.save(result, format=image_format)
+        return result.getvalue()
+
+
+def compact_prompt(database: db.Database, prompt: ent.PromptID) -> bool:
+    """Compacts a batch of superseded images of a prompt.
+
+    The batch is read in one transaction, thumbnails are computed without
+    holding the database lock, and the changes are written in a second
+    transaction. If the policy or the compaction state of the prompt changed
+    in between, nothing is written and the batch is compacted again.
+
+    :param database: The application database.
+
+    :param prompt: The prompt whose images to compact.
+
+    :return: whether more images may remain to be compacted
+    """
+    with database.transaction() as tx:
+        entity = database.load(tx, prompt)
+        if entity is None:
+            return False
+        current = policy(database, tx, entity.project)
+        if current is None or (
+                current.keep_every is None
+                and current.thumbnail_size is None):
+            return False
+
+        state_id = ent.RetentionStateID.from_prompt_id(prompt)
+        state = database.load(tx, state_id)
+        images = database.superseded_images(
+            tx,
+            prompt,
+            (state.timestamp, state.image) if state is not None else None,
+            database.now() - current.min_age,
+            BATCH_SIZE)
+        if not images:
+            return False
+
+        position = state.position if state is not None else 0
+        superseded = []
+        retained = []
+        for image in images:
+            position += 1
+            if current.keep_every is not None \
+                    and position % current.keep_every != 0:
+                superseded.append(image.id)
+            elif current.thumbnail_size is not None \
+                    and image.content_type.startswith('image/'):
+                retained.append(database.load(tx, image.id))
+
+    thumbnails = []
+    for image in retained:
+        data = thumbnail(image.data, current.thumbnail_size)
+        if data is not None:
+            image.data = data
+            thumbnails.append(image)
+
+    with database.transaction() as tx:
+        entity = database.load(tx, prompt)
+        if entity is None:
+            return False
+        elif policy(database, tx, entity.project) != current \
+                or database.load(tx, state_id) != state:
+            return True
+
+        existing = set(database.existing(
+            tx,
+            superseded + [image.id for image in thumbnails]))
+        database.delete_many(tx, [
+            id
+            for id in superseded
+            if id in existing])
+        for image in thumbnails:
+            if image.id in existing:
+                database.update(tx, image)
+
+        last = images[-1]
+        if state is None:
+            database.create(tx, ent.RetentionState(
+                id=state_id,
+                timestamp=last.timestamp,
+                image=last.id,
+                position=position))
+        else:
+            state.timestamp = last.timestamp
+            state.image = last.id
+            state.position = position
+            database.update(tx, state)
+        return len(images) == BATCH_SIZE
+
+
+def compact(database: db.Database):
+    """Compacts the superseded images of all prompts and reclaims the freed
+    space.
+
+    Every transaction handles at most :data:`BATCH_SIZE` images, so other
+    transactions are not blocked for long.
+
+    :param database: The application database.
+    """
+    with database.transaction() as tx:
+        prompts = database.compactable_prompts(tx)
+
+    for prompt in prompts:
+        try:
+            while compact_prompt(database, prompt):
+                pass
+        except Exception:
+            LOG.exception('Failed to compact images of %s', prompt)
+
+    while database.reclaim(RECLAIM_PAGES) > 0:
+        pass
+
+
+class Compactor(Thread):
+    def __init__(self, database: db.Database, interval: float = INTERVAL):
+        """A background thread periodically compacting images.
+
+        :param database: The application database.
+
+        :param interval: The number of seconds between compaction passes.
+        """
+        super().__init__(daemon=True)
+        self._database = database
+        self._interval = interval
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                compact(self._database)
+            except Exception:
+                LOG.exception('Failed to compact images')
+
+    def stop(self):
+        """Stops the compactor.
+
+        This call is blocking until an ongoing compaction pass completes.
+        """
+        self._stopped.set()
+        self.join()
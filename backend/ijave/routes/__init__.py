@@ -6,11 +6,14 @@ The definitions are grouped into modules based on resource type, but ``ALL`` is
 imported and populated in all submodules.
 """
 from json import JSONDecodeError
-from typing import get_args, get_origin, Any, Union
+from typing import (
+    get_args, get_origin, Any, Callable, Iterable, List, Optional, Tuple,
+    Union)
 
 from aiohttp import web
 
-from .. import ent
+from .. import ent, serialize
+from ..executor import Priority
 
 #: All routes.
 ALL = web.RouteTableDef()
@@ -18,6 +21,9 @@ ALL = web.RouteTableDef()
 #: The interval for web socket pings.
 PING_INTERVAL = 5
 
+#: The maximum number of items in a page.
+MAX_PAGE_SIZE = 1000
+
 
 def created(entity: ent.Entity) -> web.Response:
     """Generates a *202 Created* response containing the entity.
@@ -26,7 +32,109 @@ def created(entity: ent.Entity) -> web.Response:
 
     :return: a response
     """
-    return web.json_response(entity.to_json(), status=202)
+    return json_response(entity.to_json(), status=202)
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    """Generates a JSON response.
+
+    :param data: The value to serialise.
+
+    :param status: The response status.
+
+    :return: a response
+    """
+    return web.Response(
+        body=serialize.dumps(data),
+        status=status,
+        content_type='application/json')
+
+
+async def json_array(
+        req: web.Request,
+        encoder: serialize.Encoder,
+        batches: Iterable[List[tuple]],
+        limit: Optional[int] = None,
+        cursor: Optional[Callable[[tuple], str]] = None) -> web.StreamResponse:
+    """Streams database rows as a JSON array.
+
+    Each batch is encoded and written as a separate chunk, so the full
+    listing is never held in memory.
+
+    If ``limit`` is specified, the response is a page: an object with the
+    array as ``items`` and the cursor of the last item as ``next``, or
+    ``null`` if this is the last page. ``batches`` must then contain at most
+    ``limit + 1`` rows; the last row is used only to determine whether another
+    page exists.
+
+    :param req: The request.
+
+    :param encoder: The encoder for the rows.
+
+    :param batches: The batches of rows to encode.
+
+    :param limit: The page size.
+
+    :param cursor: A function generating the cursor for a row. This is
+        required if ``limit`` is specified.
+
+    :return: a response
+    """
+    response = web.StreamResponse()
+    response.content_type = 'application/json'
+    response.enable_chunked_encoding()
+    await response.prepare(req)
+
+    await response.write(b'[' if limit is None else b'{"items":[')
+    separator = b''
+    remaining = limit
+    last = None
+    more = False
+    for batch in batches:
+        if remaining is not None and len(batch) > remaining:
+            batch = batch[:remaining]
+            more = True
+        if batch:
+            await response.write(separator + encoder.encode_many(batch))
+            separator = b','
+            last = batch[-1]
+            if remaining is not None:
+                remaining -= len(batch)
+    if limit is None:
+        await response.write(b']')
+    else:
+        await response.write(b'],"next":' + serialize.dumps(
+            cursor(last) if more else None) + b'}')
+    await response.write_eof()
+
+    return response
+
+
+def page(req: web.Request) -> Tuple[Optional[str], Optional[int]]:
+    """Reads the pagination parameters from the query string of a request.
+
+    The parameter ``after`` is the cursor returned with the previous page, and
+    ``limit`` is the page size. If ``limit`` is not specified, the listing is
+    not paginated.
+
+    :param req: The request.
+
+    :return: the tuple ``(after, limit)``, where ``limit`` is ``None`` if the
+        listing is not paginated
+
+    :raise web.HTTPBadRequest: if the limit is invalid
+    """
+    after = req.query.get('after')
+    limit = req.query.get('limit')
+    if limit is None:
+        return (after, None)
+    try:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError(limit)
+        return (after, min(limit, MAX_PAGE_SIZE))
+    except ValueError:
+        raise web.HTTPBadRequest(body='invalid limit: "{}"'.format(limit))
 
 
 def not_found() -> web.Response:
@@ -80,7 +188,7 @@ def field(data: dict, name: str, type: type) -> web.Response:
     except KeyError:
         raise web.HTTPBadRequest(
             body='missing field "{}"'.format(name))
-    except TypeError:
+    except (TypeError, ValueError, OverflowError):
         raise web.HTTPBadRequest(
             body='invalid value for field "{}": "{}"'.format(
                 name,
@@ -125,6 +233,25 @@ async def json(req: web.Request) -> dict:
         raise web.HTTPBadRequest()
 
 
+def priority(req: web.Request, default: Priority) -> Priority:
+    """Reads the task priority from the query string of a request.
+
+    :param req: The request.
+
+    :param default: The priority to use if none is specified.
+
+    :return: a priority
+
+    :raise web.HTTPBadRequest: if the value is not a known priority
+    """
+    try:
+        value = req.query.get('priority')
+        return Priority[value.upper()] if value is not None else default
+    except KeyError:
+        raise web.HTTPBadRequest(
+            body='invalid priority: "{}"'.format(value))
+
+
 def file_field(value: Any) -> web.FileField:
     """Converts a value to a file field.
 
@@ -141,6 +268,14 @@ def file_field(value: Any) -> web.FileField:
 
 
 # Import just to fill in routing definitions
+from . import admin as _
+from . import batch as _
+from . import change as _
 from . import image as _
+from . import metrics as _
 from . import prompt as _
 from . import project as _
+from . import queue as _
+from . import ready as _
+from . import retention as _
+from . import search as _
@@ -0,0 +1,55 @@
+import math
+
+from typing import Optional
+
+from aiohttp import web
+
+from . import ALL, field, json, json_response, not_found
+from ..db import trace
+
+
+@ALL.get('/api/admin/db/trace')
+async def get_trace(req):
+    tracer = req.app.db.tracer
+    if tracer is None:
+        return not_found()
+    return json_response(tracer.to_json())
+
+
+@ALL.put('/api/admin/db/trace')
+async def put_trace(req):
+    data = await json(req)
+    if not isinstance(data, dict):
+        raise web.HTTPBadRequest(body='expected an object')
+    size = field(data, 'size', Optional[int])
+    slow_statement = field(data, 'slow_statement', Optional[float])
+    sample_rate = field(data, 'sample_rate', Optional[float])
+    if size is not None and size < 1:
+        raise web.HTTPBadRequest(body='invalid field: "size"')
+    if slow_statement is not None \
+            and not 0 <= slow_statement < math.inf:
+        raise web.HTTPBadRequest(body='invalid field: "slow_statement"')
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise web.HTTPBadRequest(body='invalid field: "sample_rate"')
+
+    tracer = trace.Tracer(
+        size=size if size is not None else trace.SIZE,
+        slow_statement=slow_statement
+        if slow_statement is not None else trace.SLOW_STATEMENT,
+        sample_rate=sample_rate if sample_rate is not None else 0.0)
+    req.app.db.trace(tracer)
+    return json_response(tracer.to_json())
+
+
+@ALL.delete('/api/admin/db/trace')
+async def delete_trace(req):
+    req.app.db.trace(None)
+    return web.Response()
+
+
+@ALL.get('/api/admin/db/migrations')
+async def get_migrations(req):
+    return json_response({
+        'background': [
+            status.to_json()
+            for status in req.app.db.background_migrations()]})
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from aiohttp import web
+
+from . import ALL, MAX_PAGE_SIZE, field, json, json_response
+from .. import ent
+from ..db import CHANGE_KINDS
+
+
+@ALL.post('/api/batch/get')
+async def batch_get(req):
+    data = await json(req)
+    items = field(data, 'ids', list)
+    icons = field(data, 'icons', Optional[bool])
+    if len(items) > MAX_PAGE_SIZE:
+        raise web.HTTPBadRequest(
+            body='too many IDs; the maximum is {}'.format(MAX_PAGE_SIZE))
+
+    kinds = []
+    ids = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise web.HTTPBadRequest(body='invalid ID: {}'.format(item))
+        kind = field(item, 'kind', str)
+        if kind not in CHANGE_KINDS:
+            raise web.HTTPBadRequest(body='invalid kind: "{}"'.format(kind))
+        try:
+            ids.append(CHANGE_KINDS[kind].from_string(field(item, 'id', str)))
+        except ValueError as e:
+            raise web.HTTPBadRequest(body=str(e))
+        kinds.append(kind)
+
+    with req.app.db.transaction() as tx:
+        entities = req.app.db.load_many(tx, ids)
+        prompts = [id for id in ids if isinstance(id, ent.PromptID)]
+        prompt_icons = dict(zip(prompts, req.app.db.icons(tx, prompts))) \
+            if icons else {}
+
+    result = []
+    for (kind, id, entity) in zip(kinds, ids, entities):
+        value = {
+            'kind': kind,
+            'id': str(id),
+            'entity': entity.to_json() if entity is not None else None,
+        }
+        if id in prompt_icons:
+            value['icon'] = str(prompt_icons[id]) \
+                if prompt_icons[id] is not None else None
+        result.append(value)
+    return json_response({'items': result})
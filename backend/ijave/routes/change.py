@@ -0,0 +1,31 @@
+from aiohttp import web
+
+from . import ALL, MAX_PAGE_SIZE, json_response, page
+
+
+@ALL.get('/api/changes')
+async def all_changes(req):
+    try:
+        since = int(req.query.get('since', 0))
+    except ValueError:
+        raise web.HTTPBadRequest(
+            body='invalid sequence: "{}"'.format(req.query['since']))
+    (_, limit) = page(req)
+    limit = limit or MAX_PAGE_SIZE
+
+    with req.app.db.transaction() as tx:
+        changes = req.app.db.changes(tx, since, limit + 1)
+
+    more = len(changes) > limit
+    changes = changes[:limit]
+    return json_response({
+        'changes': [
+            {
+                'sequence': sequence,
+                'kind': kind,
+                'id': str(id),
+                'entity': entity.to_json() if entity is not None else None,
+            }
+            for (sequence, kind, id, entity) in changes],
+        'next': changes[-1][0] if changes else since,
+        'more': more})
@@ -1,7 +1,10 @@
+import asyncio
+
 from aiohttp import web
 
-from . import ALL, field, not_found
+from . import ALL, field, json_response, not_found
 from .. import ent
+from ..executor import image
 
 
 #: The allowed upload content types.
@@ -34,7 +37,7 @@ async def create(req):
                         data=bytes(await f.read()))
                     req.app.db.create(tx, entity)
                     ids.append(str(entity.id))
-    return web.json_response(ids, status=202)
+    return json_response(ids, status=202)
 
 
 @ALL.get('/api/image/{id}/png')
@@ -47,12 +50,19 @@ async def png(req):
     with req.app.db.transaction() as tx:
         entity = req.app.db.load(tx, id)
 
-        if entity is not None and entity.data_is_loaded:
-            return web.Response(
-                body=entity.data,
-                content_type=entity.content_type)
-        else:
-            return not_found()
+    if entity is not None \
+            and entity.content_type == image.LATENT_CONTENT_TYPE:
+        # Decode the preview and load the result
+        await asyncio.wrap_future(image.decode(req.app.image_executor, id))
+        with req.app.db.transaction() as tx:
+            entity = req.app.db.load(tx, id)
+
+    if entity is not None and entity.data_is_loaded:
+        return web.Response(
+            body=entity.data,
+            content_type=entity.content_type)
+    else:
+        return not_found()
 
 
 @ALL.delete('/api/image/{id}')
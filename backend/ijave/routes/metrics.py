@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from . import ALL
+from .. import metrics
+from ..executor import image
+
+
+#: The default number of generator calls traced when profiling.
+PROFILE_STEPS = 5
+
+#: The time taken to handle requests.
+REQUEST_SECONDS = metrics.histogram(
+    'ijave_http_request_seconds',
+    'The time taken to handle HTTP requests, by route; for WebSockets, this '
+    'is the lifetime of the connection.',
+    ('method', 'route', 'status'))
+
+
+@web.middleware
+async def middleware(req, handler):
+    """Records the time taken to handle every request.
+
+    Requests are labelled with the route pattern rather than the path, so
+    that the number of label values is bounded.
+    """
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(req)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = req.match_info.route.resource
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start_time,
+            method=req.method,
+            route=resource.canonical if resource is not None else '',
+            status=str(status))
+
+
+@ALL.get('/api/metrics')
+async def get(req):
+    return web.Response(
+        body=metrics.REGISTRY.render().encode('utf-8'),
+        headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+@ALL.post('/api/profile')
+async def profile(req):
+    try:
+        steps = int(req.query.get('steps', PROFILE_STEPS))
+        if steps < 1:
+            raise ValueError(steps)
+    except ValueError:
+        raise web.HTTPBadRequest(
+            body='invalid steps: "{}"'.format(req.query.get('steps')))
+
+    try:
+        await asyncio.wrap_future(
+            image.profile(req.app.image_executor, steps))
+    except ValueError as e:
+        raise web.HTTPConflict(body=str(e))
+
+    return web.Response(status=202)
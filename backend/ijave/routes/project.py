@@ -1,4 +1,11 @@
+import asyncio
+import itertools
+import math
+
 from asyncio import TimeoutError
+from random import randrange
+from tempfile import SpooledTemporaryFile
+from typing import Any, List, Optional, Tuple, Union
 
 from aiohttp import web
 
@@ -10,12 +17,41 @@ from . import (
     field,
     image_redirect,
     json,
-    not_found)
-from .. import ent
-from ..executor import image
+    json_array,
+    json_response,
+    not_found,
+    page,
+    priority)
+from .. import archive, ent, serialize
+from ..executor import Priority, image
 from ..message import Topic
 
 
+#: The upper bound for generated random seeds.
+MAX_SEED = 2 ** 31
+
+#: The maximum number of prompts created by a single bulk request.
+MAX_BULK_PROMPTS = 1000
+
+#: The maximum number of variants generated by a single sweep.
+MAX_SWEEP_VARIANTS = 64
+
+#: The number of bytes of an uploaded archive kept in memory before it is
+#: spooled to disk.
+ARCHIVE_SPOOL_SIZE = 16 * 1024 * 1024
+
+#: The size of chunks read from uploaded archives.
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+def random_seed() -> int:
+    """Generates a random seed for prompts created without one.
+
+    :return: a seed
+    """
+    return randrange(MAX_SEED)
+
+
 @ALL.post('/api/project')
 async def create(req):
     data = await json(req)
@@ -42,7 +78,7 @@ async def get(req):
         entity = req.app.db.load(tx, id)
 
         if entity is not None:
-            return web.json_response(entity.to_json())
+            return json_response(entity.to_json())
         else:
             return not_found()
 
@@ -64,8 +100,8 @@ async def update(req):
                     setattr(entity, key, value)
                 entity = entity.validate_fields()
                 req.app.db.update(tx, entity)
-                return web.json_response(entity.to_json())
-            except ValueError as e:
+                return json_response(entity.to_json())
+            except (AttributeError, ValueError) as e:
                 raise web.HTTPBadRequest(body='invalid field: "{}"'.format(e))
         else:
             return not_found()
@@ -79,10 +115,62 @@ async def delete(req):
         raise web.HTTPBadRequest(body=str(e))
 
     with req.app.db.transaction() as tx:
-        if req.app.db.delete(tx, id):
-            return web.Response()
-        else:
-            return not_found()
+        deleted = req.app.db.delete(tx, id)
+    if deleted:
+        req.app.image_executor.cancel(group=id)
+        return web.Response()
+    else:
+        return not_found()
+
+
+@ALL.get('/api/project/{id}/export')
+async def export(req):
+    try:
+        id = ent.ProjectID.from_string(req.match_info['id'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    chunks = archive.export(req.app.db, id)
+    if chunks is None:
+        return not_found()
+
+    response = web.StreamResponse()
+    response.content_type = archive.CONTENT_TYPE
+    response.headers['Content-Disposition'] = \
+        'attachment; filename="{}.tar"'.format(id)
+    response.enable_chunked_encoding()
+    await response.prepare(req)
+    for chunk in chunks:
+        await response.write(chunk)
+    await response.write_eof()
+
+    return response
+
+
+@ALL.post('/api/project/import')
+async def import_archive(req):
+    if req.content_type != archive.CONTENT_TYPE:
+        raise web.HTTPUnsupportedMediaType()
+
+    with SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE) as f:
+        async for chunk in req.content.iter_chunked(ARCHIVE_CHUNK_SIZE):
+            f.write(chunk)
+        f.seek(0)
+
+        try:
+            entity = await asyncio.get_running_loop().run_in_executor(
+                None,
+                archive.import_archive,
+                req.app.db,
+                f)
+        except archive.ProjectExists as e:
+            raise web.HTTPConflict(body='project exists: {}'.format(e))
+        except archive.EntityExists as e:
+            raise web.HTTPConflict(body='entity exists: {}'.format(e))
+        except archive.InvalidArchive as e:
+            raise web.HTTPBadRequest(body='invalid archive: {}'.format(e))
+
+    return created(entity)
 
 
 @ALL.get('/api/project/{id}/icon')
@@ -103,29 +191,43 @@ async def icon(req):
 
 @ALL.get('/api/project')
 async def all_entities(req):
-    return web.json_response(
-        [
-            project.to_json()
-            for project in req.app.db.projects()])
+    (after, limit) = page(req)
+    try:
+        after = ent.ProjectID.from_string(after) \
+            if after is not None else None
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    return await json_array(
+        req,
+        serialize.encoder(ent.Project),
+        req.app.db.project_rows(after, limit and limit + 1),
+        limit,
+        lambda row: str(ent.ProjectID.trusted(row[0])))
 
 
 @ALL.get('/api/project/{id}/prompts')
 async def prompts(req):
+    (after, limit) = page(req)
     try:
         id = ent.ProjectID.from_string(req.match_info['id'])
+        after = ent.PromptID.from_string(after) \
+            if after is not None else None
     except ValueError as e:
         raise web.HTTPBadRequest(body=str(e))
 
     with req.app.db.transaction() as tx:
         project = req.app.db.load(tx, id)
 
-        if project is not None:
-            return web.json_response(
-                [
-                    prompt.to_json()
-                    for prompt in req.app.db.prompts(project.id)])
-        else:
-            return not_found()
+    if project is not None:
+        return await json_array(
+            req,
+            serialize.encoder(ent.Prompt),
+            req.app.db.prompt_rows(project.id, after, limit and limit + 1),
+            limit,
+            lambda row: str(ent.PromptID.trusted(row[0])))
+    else:
+        return not_found()
 
 
 @ALL.post('/api/project/{id}/prompts')
@@ -135,35 +237,233 @@ async def prompt_create(req):
     except ValueError as e:
         raise web.HTTPBadRequest(body=str(e))
 
+    task_priority = priority(req, Priority.INTERACTIVE)
+    (entity, cached) = prompt_spec(await json(req), id)
     with req.app.db.transaction() as tx:
         project = req.app.db.load(tx, id)
+        if project is None:
+            return not_found()
+        req.app.db.create(tx, entity)
+        req.app.db.create(tx, cached)
 
-        if project is not None:
-            data = await json(req)
-            if isinstance(data.get('seed'), float):
-                seed = int(field(data, 'seed', float))
-            else:
-                seed = None
-            entity = ent.Prompt(
-                id=ent.PromptID.new(),
-                project=project.id,
-                text=field(data, 'text', str))
-            req.app.db.create(tx, entity)
-            cached = ent.ImageExecutorCache(
-                id=ent.ImageExecutorCacheID.from_prompt_id(entity.id),
-                step=0,
-                steps=field(data, 'steps', int),
-                strength=field(data, 'strength', float),
-                latent=None)
-            req.app.db.create(tx, cached)
-            req.app.image_executor.schedule(image.Task(
+    req.app.image_executor.schedule(*prompt_task(
+        project,
+        entity,
+        cached,
+        task_priority))
+    return created(entity)
+
+
+@ALL.post('/api/project/{id}/prompts/bulk')
+async def prompt_create_bulk(req):
+    try:
+        id = ent.ProjectID.from_string(req.match_info['id'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    data = await json(req)
+    if not isinstance(data, list):
+        raise web.HTTPBadRequest(body='expected an array of prompts')
+    elif len(data) > MAX_BULK_PROMPTS:
+        raise web.HTTPBadRequest(body='too many prompts: {}'.format(
+            len(data)))
+    specs = []
+    for (i, item) in enumerate(data):
+        try:
+            specs.append(prompt_spec(item, id))
+        except web.HTTPBadRequest as e:
+            raise web.HTTPBadRequest(body='prompt {}: {}'.format(i, e.text))
+
+    task_priority = priority(req, Priority.BULK)
+    with req.app.db.transaction() as tx:
+        project = req.app.db.load(tx, id)
+        if project is None:
+            return not_found()
+        req.app.db.create_many(tx, (entity for (entity, _) in specs))
+        req.app.db.create_many(tx, (cached for (_, cached) in specs))
+
+    req.app.image_executor.schedule_many(
+        prompt_task(project, entity, cached, task_priority)
+        for (entity, cached) in specs)
+    return json_response(
+        [entity.to_json() for (entity, _) in specs],
+        status=202)
+
+
+@ALL.post('/api/project/{id}/sweep')
+async def sweep(req):
+    try:
+        id = ent.ProjectID.from_string(req.match_info['id'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    data = await json(req)
+    if not isinstance(data, dict):
+        raise web.HTTPBadRequest(body='expected an object')
+    text = field(data, 'text', str)
+    seeds = sweep_values(data, 'seeds', int) if 'seeds' in data \
+        else [random_seed()]
+    strengths = sweep_values(data, 'strengths', (int, float))
+    steps = sweep_values(data, 'steps', int)
+    variants = len(seeds) * len(strengths) * len(steps)
+    if variants == 0:
+        raise web.HTTPBadRequest(body='no variants')
+    elif variants > MAX_SWEEP_VARIANTS:
+        raise web.HTTPBadRequest(body='too many variants: {}'.format(
+            variants))
+    specs = [
+        prompt_spec({
+            'text': text,
+            'seed': seed,
+            'strength': strength,
+            'steps': step_count}, id)
+        for (seed, strength, step_count) in itertools.product(
+            seeds, strengths, steps)]
+
+    task_priority = priority(req, Priority.BULK)
+    with req.app.db.transaction() as tx:
+        project = req.app.db.load(tx, id)
+        if project is None:
+            return not_found()
+        req.app.db.create_many(tx, (entity for (entity, _) in specs))
+        req.app.db.create_many(tx, (cached for (_, cached) in specs))
+
+    task = image.sweep(
+        req.app.image_executor,
+        [
+            image.Task(
                 prompt=entity,
                 width=project.image_width,
                 height=project.image_height,
-                seed=seed))
-            return created(entity)
-        else:
-            return not_found()
+                seed=cached.seed)
+            for (entity, cached) in specs],
+        task_priority)
+    return json_response(
+        {
+            'id': str(task.id),
+            'variants': [
+                {
+                    'prompt': entity.to_json(),
+                    'seed': cached.seed,
+                    'strength': cached.strength,
+                    'steps': cached.steps}
+                for (entity, cached) in specs]},
+        status=202)
+
+
+def sweep_values(
+        data: dict,
+        name: str,
+        types: Union[type, Tuple[type, ...]]) -> List[Any]:
+    """Reads the values of a swept parameter.
+
+    A value is either a single value, an array of values or, for integer
+    parameters, an object with the fields ``start``, ``stop`` and, optionally,
+    ``step`` describing a range.
+
+    :param data: The source of values.
+
+    :param name: The name of the field.
+
+    :param types: The accepted types of individual values.
+
+    :return: a list of values
+
+    :raise web.HTTPBadRequest: if the value is invalid
+    """
+    value = data.get(name)
+    if value is None:
+        raise web.HTTPBadRequest(
+            body='missing field "{}"'.format(name))
+    elif isinstance(value, dict):
+        step = field(value, 'step', Optional[int])
+        try:
+            values = range(
+                field(value, 'start', int),
+                field(value, 'stop', int),
+                step if step is not None else 1)
+        except ValueError as e:
+            raise web.HTTPBadRequest(body=str(e))
+        try:
+            count = len(values)
+        except OverflowError:
+            count = math.inf
+        if count > MAX_SWEEP_VARIANTS:
+            raise web.HTTPBadRequest(body='too many values for "{}"'.format(
+                name))
+        return list(values)
+
+    values = value if isinstance(value, list) else [value]
+    for v in values:
+        if isinstance(v, bool) or not isinstance(v, types):
+            raise web.HTTPBadRequest(
+                body='invalid value for field "{}": "{}"'.format(name, v))
+    return values
+
+
+def prompt_spec(
+        data: dict,
+        project: ent.ProjectID) -> Tuple[ent.Prompt, ent.ImageExecutorCache]:
+    """Reads the specification of a new prompt.
+
+    :param data: The specification, with the fields ``text``, ``steps``,
+        ``strength`` and, optionally, ``seed``.
+
+    :param project: The ID of the project to which the prompt belongs.
+
+    :return: the tuple ``(prompt, cached)``
+
+    :raise web.HTTPBadRequest: if the specification is invalid
+    """
+    if not isinstance(data, dict):
+        raise web.HTTPBadRequest(body='expected an object')
+    seed = field(data, 'seed', Optional[float])
+    try:
+        seed = int(seed) if seed is not None else random_seed()
+    except (ValueError, OverflowError):
+        raise web.HTTPBadRequest(
+            body='invalid value for field "seed": "{}"'.format(seed))
+    entity = ent.Prompt(
+        id=ent.PromptID.new(),
+        project=project,
+        text=field(data, 'text', str))
+    cached = ent.ImageExecutorCache(
+        id=ent.ImageExecutorCacheID.from_prompt_id(entity.id),
+        step=0,
+        steps=field(data, 'steps', int),
+        strength=field(data, 'strength', float),
+        latent=None,
+        seed=seed)
+    return (entity, cached)
+
+
+def prompt_task(
+        project: ent.Project,
+        entity: ent.Prompt,
+        cached: ent.ImageExecutorCache,
+        task_priority: Priority) -> Tuple[
+            image.Task, Priority, ent.ProjectID, ent.PromptID]:
+    """Generates the scheduling arguments for the first image of a new prompt.
+
+    :param project: The project to which the prompt belongs.
+
+    :param entity: The prompt.
+
+    :param cached: The image executor cache of the prompt.
+
+    :param task_priority: The priority of the task.
+
+    :return: the tuple ``(task, priority, group, key)``
+    """
+    return (
+        image.Task(
+            prompt=entity,
+            width=project.image_width,
+            height=project.image_height,
+            seed=cached.seed),
+        task_priority,
+        project.id,
+        entity.id)
 
 
 @ALL.get('/api/project/{id}/notifications')
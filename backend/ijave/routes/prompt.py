@@ -1,8 +1,15 @@
 from aiohttp import web
 
-from . import ALL, image_redirect, not_found
-from .. import ent
-from ..executor import image
+from . import (
+    ALL,
+    image_redirect,
+    json_array,
+    json_response,
+    not_found,
+    page,
+    priority)
+from .. import ent, serialize
+from ..executor import Priority, image
 
 
 @ALL.get('/api/prompt/{id}')
@@ -16,11 +23,31 @@ async def get(req):
         entity = req.app.db.load(tx, id)
 
         if entity is not None:
-            return web.json_response(entity.to_json())
+            return json_response(entity.to_json())
         else:
             return not_found()
 
 
+@ALL.get('/api/prompt/{id}/parameters')
+async def parameters(req):
+    try:
+        id = ent.PromptID.from_string(req.match_info['id'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    with req.app.db.transaction() as tx:
+        cached = req.app.db.load(
+            tx,
+            ent.ImageExecutorCacheID.from_prompt_id(id))
+    if cached is not None:
+        return json_response({
+            'steps': cached.steps,
+            'strength': cached.strength,
+            'seed': cached.seed})
+    else:
+        return not_found()
+
+
 @ALL.delete('/api/prompt/{id}')
 async def delete(req):
     try:
@@ -29,10 +56,25 @@ async def delete(req):
         raise web.HTTPBadRequest(body=str(e))
 
     with req.app.db.transaction() as tx:
-        if req.app.db.delete(tx, id):
-            return web.Response()
-        else:
-            return not_found()
+        deleted = req.app.db.delete(tx, id)
+    if deleted:
+        req.app.image_executor.cancel(key=id)
+        return web.Response()
+    else:
+        return not_found()
+
+
+@ALL.delete('/api/prompt/{id}/task')
+async def task_cancel(req):
+    try:
+        id = ent.PromptID.from_string(req.match_info['id'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+    if req.app.image_executor.cancel(key=id):
+        return web.Response()
+    else:
+        return not_found()
 
 
 @ALL.get('/api/prompt/{id}/icon')
@@ -52,15 +94,21 @@ async def icon(req):
 
 @ALL.get('/api/prompt/{id}/images')
 async def images(req):
+    (after, limit) = page(req)
     try:
         id = ent.PromptID.from_string(req.match_info['id'])
+        if after is not None:
+            (timestamp, image) = after.split('_', 1)
+            after = (float(timestamp), ent.ImageID.from_string(image))
     except ValueError as e:
         raise web.HTTPBadRequest(body=str(e))
 
-    return web.json_response(
-        [
-            image.to_json()
-            for image in req.app.db.images(id)])
+    return await json_array(
+        req,
+        serialize.encoder(ent.Image),
+        req.app.db.image_rows(id, after, limit and limit + 1),
+        limit,
+        lambda row: '{}_{}'.format(row[1], ent.ImageID.trusted(row[0])))
 
 
 @ALL.post('/api/prompt/{id}/generate-next')
@@ -81,10 +129,14 @@ async def image_generate(req):
             return web.Response(status=202)
         project = req.app.db.load(tx, prompt.project)
 
-    req.app.image_executor.schedule(image.Task(
-        prompt=prompt,
-        width=project.image_width,
-        height=project.image_height,
-        seed=None))
+    req.app.image_executor.schedule(
+        image.Task(
+            prompt=prompt,
+            width=project.image_width,
+            height=project.image_height,
+            seed=cached.seed),
+        priority(req, Priority.INTERACTIVE),
+        project.id,
+        prompt.id)
 
     return web.Response(status=202)
@@ -0,0 +1,12 @@
+from . import ALL, json_response
+
+
+@ALL.get('/api/queue')
+async def get(req):
+    executor = req.app.image_executor
+    task = executor.task
+    return json_response({
+        'running': task.to_json() if task is not None else None,
+        'queue': [
+            entry.to_json()
+            for entry in executor.queue]})
@@ -0,0 +1,13 @@
+from . import ALL, json_response
+from ..executor.image import GeneratorState
+
+
+@ALL.get('/api/ready')
+async def get(req):
+    generator = req.app.image_executor.generator
+    ready = generator.state == GeneratorState.READY
+    return json_response(
+        {
+            'ready': ready,
+            'generator': generator.to_json()},
+        status=200 if ready else 503)
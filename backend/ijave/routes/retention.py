@@ -0,0 +1,111 @@
+import math
+
+from typing import Optional
+
+from aiohttp import web
+
+from . import ALL, assert_missing, field, json, json_response, not_found
+from .. import ent, retention
+
+
+def read_policy(data: dict, id: ent.RetentionPolicyID) -> ent.RetentionPolicy:
+    """Reads a retention policy from a request payload.
+
+    :param data: The payload.
+
+    :param id: The ID of the policy.
+
+    :return: a policy
+
+    :raise web.HTTPBadRequest: if a field is invalid
+    """
+    min_age = field(data, 'min_age', Optional[float])
+    entity = ent.RetentionPolicy(
+        id=id,
+        keep_every=field(data, 'keep_every', Optional[int]),
+        thumbnail_size=field(data, 'thumbnail_size', Optional[int]),
+        min_age=min_age if min_age is not None else retention.DEFAULT_MIN_AGE)
+    if entity.keep_every is not None and entity.keep_every < 1:
+        raise web.HTTPBadRequest(body='invalid field: "keep_every"')
+    if entity.thumbnail_size is not None and entity.thumbnail_size < 1:
+        raise web.HTTPBadRequest(body='invalid field: "thumbnail_size"')
+    if not 0 <= entity.min_age < math.inf:
+        raise web.HTTPBadRequest(body='invalid field: "min_age"')
+    return entity
+
+
+def project_policy_id(req: web.Request) -> ent.RetentionPolicyID:
+    """Reads the ID of the policy of the project identified in the path.
+
+    :param req: The request.
+
+    :return: a policy ID
+
+    :raise web.HTTPBadRequest: if the project ID is invalid
+    """
+    try:
+        return ent.RetentionPolicyID.from_project_id(
+            ent.ProjectID.from_string(req.match_info['id']))
+    except ValueError as e:
+        raise web.HTTPBadRequest(body=str(e))
+
+
+async def get_policy(req: web.Request, id: ent.RetentionPolicyID):
+    with req.app.db.transaction() as tx:
+        entity = req.app.db.load(tx, id)
+
+        if entity is not None:
+            return json_response(entity.to_json())
+        else:
+            return not_found()
+
+
+async def put_policy(req: web.Request, id: ent.RetentionPolicyID):
+    entity = read_policy(assert_missing(await json(req), 'id'), id)
+
+    with req.app.db.transaction() as tx:
+        if not req.app.db.update(tx, entity):
+            req.app.db.create(tx, entity)
+        return json_response(entity.to_json())
+
+
+@ALL.get('/api/retention')
+async def get(req):
+    return await get_policy(req, ent.RetentionPolicyID.default())
+
+
+@ALL.put('/api/retention')
+async def update(req):
+    return await put_policy(req, ent.RetentionPolicyID.default())
+
+
+@ALL.delete('/api/retention')
+async def delete(req):
+    with req.app.db.transaction() as tx:
+        if req.app.db.delete(tx, ent.RetentionPolicyID.default()):
+            return web.Response()
+        else:
+            return not_found()
+
+
+@ALL.get('/api/project/{id}/retention')
+async def get_project(req):
+    return await get_policy(req, project_policy_id(req))
+
+
+@ALL.put('/api/project/{id}/retention')
+async def update_project(req):
+    id = project_policy_id(req)
+    with req.app.db.transaction() as tx:
+        if req.app.db.load(tx, id.project) is None:
+            return not_found()
+    return await put_policy(req, id)
+
+
+@ALL.delete('/api/project/{id}/retention')
+async def delete_project(req):
+    with req.app.db.transaction() as tx:
+        if req.app.db.delete(tx, project_policy_id(req)):
+            return web.Response()
+        else:
+            return not_found()
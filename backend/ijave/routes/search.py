@@ -0,0 +1,34 @@
+from aiohttp import web
+
+from . import ALL, json_response, page
+
+
+#: The number of matches returned if no limit is specified.
+PAGE_SIZE = 50
+
+
+@ALL.get('/api/search')
+async def search(req):
+    query = req.query.get('q', '')
+    if not query.strip():
+        raise web.HTTPBadRequest(body='missing query')
+    (after, limit) = page(req)
+    limit = limit or PAGE_SIZE
+    try:
+        offset = int(after) if after is not None else 0
+        if offset < 0:
+            raise ValueError(offset)
+    except ValueError:
+        raise web.HTTPBadRequest(body='invalid cursor: "{}"'.format(after))
+
+    with req.app.db.transaction() as tx:
+        matches = req.app.db.search(tx, query, offset, limit + 1)
+
+    return json_response({
+        'items': [
+            {
+                'kind': kind,
+                'entity': entity.to_json(),
+            }
+            for (kind, entity) in matches[:limit]],
+        'next': str(offset + limit) if len(matches) > limit else None})
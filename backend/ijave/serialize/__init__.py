@@ -0,0 +1,145 @@
+"""
+JSON serialisation
+------------------
+
+This module provides fast JSON serialisation of entities.
+
+Listings are serialised directly from database rows by an :class:`Encoder`
+compiled once per entity class, without constructing any entities. If
+`orjson <https://github.com/ijl/orjson>`_ is installed, it is used for all
+other values.
+"""
+import json
+import math
+
+from dataclasses import fields
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Iterable, Optional, Type
+
+from .. import ent
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Serialises a value to JSON.
+
+    :param value: The value to serialise.
+
+    :return: UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    else:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class Encoder:
+    def __init__(self, entity: Type[ent.Entity]):
+        """An encoder of database rows as JSON objects.
+
+        The rows must contain the values of all fields of ``entity`` in
+        declaration order, with IDs in their binary representation, as they
+        are stored in the database.
+
+        The encoding function is generated and compiled once for the entity
+        class. If *orjson* is available, it converts a row to a ``dict`` that
+        is serialised by *orjson*, otherwise it formats the JSON directly.
+
+        :param entity: The entity class.
+        """
+        converters = [_converter(field.type) for field in fields(entity)]
+        if orjson is not None:
+            source = 'lambda row: {{{}}}'.format(', '.join(
+                '{!r}: {}(row[{}])'.format(field.name, converter.__name__, i)
+                if converter is _id else
+                '{!r}: row[{}]'.format(field.name, i)
+                for (i, (field, converter)) in enumerate(zip(
+                    fields(entity), converters))))
+            self._encode = eval(source, {'_id': _uuid_string})
+        else:
+            source = 'lambda row: {!r} % ({},)'.format(
+                '{' + ','.join(
+                    '{}:%s'.format(encode_basestring_ascii(field.name))
+                    for field in fields(entity)) + '}',
+                ', '.join(
+                    '{}(row[{}])'.format(converter.__name__, i)
+                    for (i, converter) in enumerate(converters)))
+            self._encode = eval(source, {
+                converter.__name__: converter
+                for converter in converters})
+
+    def encode_many(self, rows: Iterable[tuple]) -> bytes:
+        """Encodes rows as comma separated JSON objects.
+
+        :param rows: The rows to encode.
+
+        :return: UTF-8 encoded JSON objects, without surrounding brackets
+        """
+        if orjson is not None:
+            return orjson.dumps(list(map(self._encode, rows)))[1:-1]
+        else:
+            return ','.join(map(self._encode, rows)).encode('utf-8')
+
+
+@lru_cache(maxsize=None)
+def encoder(entity: Type[ent.Entity]) -> Encoder:
+    """Returns the encoder for an entity class.
+
+    The encoder is compiled the first time this function is called for a
+    class.
+
+    :param entity: The entity class.
+
+    :return: an encoder
+    """
+    return Encoder(entity)
+
+
+def _converter(field_type: Any) -> Callable[[Any], str]:
+    """Selects the function converting a row value to JSON for a field type.
+
+    :param field_type: The type of the field.
+
+    :return: a function
+    """
+    if isinstance(field_type, type):
+        if issubclass(field_type, ent.ID):
+            return _id
+        elif issubclass(field_type, str):
+            return _string
+        elif issubclass(field_type, (int, float)) \
+                and not issubclass(field_type, bool):
+            return _number
+    return _value
+
+
+def _uuid_string(value: bytes) -> Optional[str]:
+    if value is None:
+        return None
+    else:
+        h = value.hex()
+        return '{}-{}-{}-{}-{}'.format(
+            h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+def _id(value: bytes) -> str:
+    return 'null' if value is None else '"{}"'.format(_uuid_string(value))
+
+
+def _string(value: str) -> str:
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def _number(value: float) -> str:
+    # JSON has no representation of non-finite numbers; orjson writes null
+    return 'null' if value is None or not math.isfinite(value) \
+        else repr(value)
+
+
+def _value(value: Any) -> str:
+    return dumps(value).decode('utf-8')
@@ -71,8 +71,9 @@ const module = {
          *     The entity ID.
          * @return the entity
          */
-        get: (state, id) => module.get(
-            "project/{}".format(id))
+        get: (state, id) => module.batched(
+            "project", id)
+            .then(r => r.entity)
             .then(state
                 .project(id)
                 .update)
@@ -133,6 +134,41 @@ const module = {
             .catch(module.orElse(undefined, () => state.project().all()))
             .catch(module.onError),
 
+        /**
+         * Lists a page of projects.
+         *
+         * @param state
+         *     The application state.
+         * @param cursor
+         *     The cursor returned with the previous page, or `undefined` for
+         *     the first page.
+         * @param seen
+         *     The IDs of all projects listed on previous pages. When the last
+         *     page has been loaded, cached projects not listed are removed.
+         * @return an object with the attributes `items`, the projects on this
+         *     page, and `next`, the cursor of the next page or `null`
+         */
+        page: (state, cursor, seen) => state.synchronized
+            ? module.cachedPage(state.project().all(), cursor)
+            : module.get(
+            module.paged("project", cursor))
+            .then(r => {
+                const items = r.items.map(
+                    r => state
+                        .project(r.id)
+                        .update(r));
+                if (r.next === null) {
+                    state.project().filter(
+                        (seen ?? []).concat(items.map(p => p.id)));
+                }
+                return { items, next: r.next };
+            })
+            .then(module.storeT(state))
+            .catch(module.firstPageOrElse(
+                cursor,
+                () => state.project().all()))
+            .catch(module.onError),
+
         /**
          * Retrieves the prompts for a project.
          *
@@ -154,6 +190,42 @@ const module = {
             .catch(module.orElse(id, id => state.project(id), p => p.prompts))
             .catch(module.onError),
 
+        /**
+         * Retrieves a page of the prompts for a project.
+         *
+         * The prompts are appended to the prompts of the project.
+         *
+         * @param state
+         *     The application state.
+         * @param id
+         *     The project ID.
+         * @param cursor
+         *     The cursor returned with the previous page, or `undefined` for
+         *     the first page.
+         * @return an object with the attributes `items`, the prompts on this
+         *     page, and `next`, the cursor of the next page or `null`
+         */
+        promptPage: (state, id, cursor) => state.synchronized
+            ? module.cachedPage(state.project(id).prompts, cursor)
+            : module.get(
+            module.paged("project/{}/prompts".format(id), cursor))
+            .then(r => {
+                const project = state.project(id);
+                const items = r.items.map(
+                    r => state
+                        .prompt(r.id)
+                        .update(r));
+                project.withPrompts((cursor === undefined
+                    ? []
+                    : project.prompts).concat(items));
+                return { items, next: r.next };
+            })
+            .then(module.storeT(state))
+            .catch(module.firstPageOrElse(
+                cursor,
+                () => state.project(id).prompts))
+            .catch(module.onError),
+
         /**
          * The URL of a project icon.
          *
@@ -202,8 +274,9 @@ const module = {
          *     The entity ID.
          * @return the entity
          */
-        get: (state, id) => module.get(
-            "prompt/{}".format(id))
+        get: (state, id) => module.batched(
+            "prompt", id)
+            .then(r => r.entity)
             .then(state
                 .prompt(id)
                 .update)
@@ -211,6 +284,20 @@ const module = {
             .catch(module.orElse(id, id => state.prompt(id)))
             .catch(module.onError),
 
+        /**
+         * Retrieves the generation parameters of a prompt.
+         *
+         * @param state
+         *     The application state.
+         * @param id
+         *     The entity ID.
+         * @return an object with the attributes `steps`, `strength` and
+         *     `seed`, or `undefined` if they are unavailable
+         */
+        parameters: (state, id) => module.get(
+            "prompt/{}/parameters".format(id))
+            .catch(() => undefined),
+
         /**
          * Deletes an entity.
          *
@@ -251,9 +338,13 @@ const module = {
          *     The application state.
          * @param id
          *     The prompt ID.
+         * @param priority
+         *     The priority of the task; either `"interactive"` or `"bulk"`.
+         *     If not specified, `"interactive"` is used.
          */
-        generate: (state, id) => module.post(
-            "prompt/{}/generate-next".format(id))
+        generate: (state, id, priority) => module.post(
+            "prompt/{}/generate-next?priority={}".format(
+                id, priority ?? "interactive"))
             .catch(module.onError),
 
         /**
@@ -265,6 +356,23 @@ const module = {
          *     The entity ID.
          */
         iconURL: (id) => `${BASE_URL}/prompt/${id}/icon`,
+
+        /**
+         * Resolves the URL of the image used as icon for a prompt.
+         *
+         * Unlike `iconURL`, the URL does not redirect, and icons requested
+         * together are resolved using a single request.
+         *
+         * @param id
+         *     The entity ID.
+         * @return the URL of the icon image, `undefined` if the prompt has no
+         *     images, or the value of `iconURL` if the backend cannot be
+         *     reached
+         */
+        icon: (id) => module.batched(
+            "prompt", id, true)
+            .then(r => r.icon ? module.image.url(r.icon) : undefined)
+            .catch(() => module.prompt.iconURL(id)),
     },
 
     image: {
@@ -295,14 +403,185 @@ const module = {
         url: (id) => `${BASE_URL}/image/${id}/png`,
     },
 
+    /**
+     * Applies all changes made in the backend since the last synchronisation
+     * to the application state.
+     *
+     * Once this has completed successfully, listings are read from the
+     * application state. If the backend cannot be reached, the state is left
+     * unchanged.
+     *
+     * @param state
+     *     The application state.
+     * @return the application state
+     */
+    sync: async (state) => {
+        try {
+            for (let more = true; more;) {
+                const r = await module.get(
+                    "changes?since={}".format(state.sequence ?? 0));
+                state.applyChanges(r.changes, r.next);
+                more = r.more;
+            }
+            state.synchronized = true;
+        } catch (e) {
+            console.log(`failed to synchronise state: ${e}`);
+        }
+        await state.store();
+        return state;
+    },
+
+    /**
+     * Generates a page of a listing from cached entities.
+     *
+     * The entities are ordered by ID, like the listings of the backend.
+     *
+     * @param entities
+     *     All cached entities of the listing.
+     * @param cursor
+     *     The cursor returned with the previous page, or `undefined` for the
+     *     first page.
+     * @return a promise resolving to an object with the attributes `items`
+     *     and `next`, like a page retrieved from the backend
+     */
+    cachedPage: async (entities, cursor) => {
+        const items = entities
+            .filter(e => cursor === undefined || e.id > cursor)
+            .sort((a, b) => a.id < b.id ? -1 : a.id > b.id ? 1 : 0)
+            .slice(0, module.PAGE_SIZE);
+        return {
+            items,
+            next: items.length === module.PAGE_SIZE
+                ? items[items.length - 1].id
+                : null,
+        };
+    },
+
+    /**
+     * The number of items requested per page for paginated listings.
+     */
+    PAGE_SIZE: 50,
+
+    /**
+     * Generates the resource path for a page of a listing.
+     *
+     * @param resource
+     *     The relative path of the listing.
+     * @param cursor
+     *     The cursor returned with the previous page, or `undefined` for the
+     *     first page.
+     * @return a relative path
+     */
+    paged: (resource, cursor) => `${resource}?limit=${module.PAGE_SIZE}`
+        + (cursor ? `&after=${encodeURIComponent(cursor)}` : ""),
+
     /**
      * A wrapper for `fetch` with method `GET` taking `BASE_URL` into account.
      *
      * This function automatically parses the response as JSON.
      */
-    get: (resource) => module.req(resource, {
-        method: "GET",
-    }),
+    get: (resource) => {
+        const pending = module.inflight.get(resource);
+        if (pending !== undefined) {
+            return pending;
+        }
+        const result = module.req(resource, {
+            method: "GET",
+        }).finally(() => module.inflight.delete(resource));
+        module.inflight.set(resource, result);
+        return result;
+    },
+
+    /**
+     * The responses of `GET` requests and batched retrievals in progress,
+     * keyed on resource.
+     *
+     * Concurrent requests for the same resource share a response.
+     */
+    inflight: new Map(),
+
+    /**
+     * Retrieves an entity as part of a batch.
+     *
+     * All entities requested until the next animation frame are retrieved
+     * using a single request to `batch/get`, and an entity already being
+     * retrieved is not requested again.
+     *
+     * @param kind
+     *     The kind of entity; either `"project"` or `"prompt"`.
+     * @param id
+     *     The entity ID.
+     * @param icon
+     *     Whether to retrieve the ID of the icon of a prompt.
+     * @return an object with the attributes `entity` and, if requested,
+     *     `icon`; if the entity does not exist, the promise is rejected like
+     *     for a *404 Not Found* response
+     */
+    batched: (kind, id, icon) => {
+        const resource = `batch/${kind}/${id}`;
+        const pending = module.inflight.get(resource);
+        if (pending !== undefined && (pending.icon || !icon)) {
+            return pending.promise;
+        }
+
+        let request = module.queue.get(resource);
+        if (request === undefined) {
+            request = { kind, id, icon: false };
+            request.promise = new Promise((resolve, reject) => {
+                request.resolve = resolve;
+                request.reject = reject;
+            });
+            if (module.queue.size === 0) {
+                (window.requestAnimationFrame ?? setTimeout)(module.flush);
+            }
+            module.queue.set(resource, request);
+        }
+        request.icon ||= !!icon;
+        return request.promise;
+    },
+
+    /**
+     * Entities waiting to be retrieved by `flush`, keyed on resource.
+     */
+    queue: new Map(),
+
+    /**
+     * The maximum number of entities retrieved by a single request.
+     */
+    MAX_BATCH_SIZE: 1000,
+
+    /**
+     * Retrieves all entities requested using `batched`.
+     */
+    flush: async () => {
+        const requests = Array.from(module.queue.entries());
+        module.queue.clear();
+        requests.forEach(([resource, request]) =>
+            module.inflight.set(resource, request));
+
+        for (let i = 0; i < requests.length; i += module.MAX_BATCH_SIZE) {
+            const batch = requests
+                .slice(i, i + module.MAX_BATCH_SIZE)
+                .map(([_, request]) => request);
+            try {
+                const r = await module.post("batch/get", {
+                    ids: batch.map(({ kind, id }) => ({ kind, id })),
+                    icons: batch.some(request => request.icon),
+                });
+                r.items.forEach((item, j) => item.entity === null
+                    ? batch[j].reject("")
+                    : batch[j].resolve(item));
+            } catch (e) {
+                batch.forEach(request => request.reject(e));
+            }
+        }
+
+        requests.forEach(([resource, request]) => {
+            if (module.inflight.get(resource) === request) {
+                module.inflight.delete(resource);
+            }
+        });
+    },
 
     /**
      * A wrapper for `fetch` with method `DELETE` taking `BASE_URL` into account.
@@ -439,6 +718,27 @@ const module = {
         },
         initial),
 
+    /**
+     * Generates a function that returns cached entities as a single page if
+     * the first page of a listing could not be loaded.
+     *
+     * For other pages, the exception that is passed to the generated function
+     * is reraised.
+     *
+     * @param cursor
+     *     The cursor of the page being loaded.
+     * @param generator
+     *     A function returning the cached entities.
+     * @return a function
+     */
+    firstPageOrElse: (cursor, generator) => e => {
+        if (cursor === undefined) {
+            return { items: generator(), next: null };
+        } else {
+            throw e;
+        }
+    },
+
     /**
      * An error handker used when all else fails.
      */
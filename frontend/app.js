@@ -72,7 +72,7 @@ const load = async () => {
             async () => {
                 return await db.load() || {};
             },
-            async (v) => await db.store(v));
+            async (v, changed) => await db.store(v, changed));
     };
 
     const loadTranslations = async (state) => {
@@ -158,7 +158,7 @@ if ("serviceWorker" in navigator) {
             const db = await connect();
             const state = await State.load(
                 async () => await db.load(),
-                async (v) => db.store(v),
+                async (v, changed) => db.store(v, changed),
                 async () => db.clear());
         });
         await navigator.serviceWorker.ready;
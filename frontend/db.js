@@ -6,7 +6,7 @@ const NAME = "ijave";
 /**
  * Our current schema version
  */
-const VERSION = 1;
+const VERSION = 2;
 
 /**
  * The key used for the current state.
@@ -20,9 +20,29 @@ const T = {
     /**
      * Application state.
      *
-     * This object store contains an object keyed on `KEY`.
+     * This object store contains an object keyed on `KEY`, holding everything
+     * but the entities.
      */
     STATE: "state",
+
+    /**
+     * Projects keyed on their ID.
+     */
+    PROJECT: "project",
+
+    /**
+     * Prompts keyed on their ID.
+     */
+    PROMPT: "prompt",
+};
+
+
+/**
+ * The object stores containing entities, keyed on the entity type.
+ */
+const ENTITIES = {
+    project: T.PROJECT,
+    prompt: T.PROMPT,
 };
 
 
@@ -38,24 +58,51 @@ export class Database {
      * Loads the current application state from the database.
      */
     async load() {
-        const trans = this._db.transaction(T.STATE);
-        return await get(trans, T.STATE, KEY);
+        const trans = this._db.transaction(Object.values(T));
+        const state = await get(trans, T.STATE, KEY) ?? {};
+        for (const [type, store] of Object.entries(ENTITIES)) {
+            state[type] = Object.fromEntries(
+                (await getAll(trans, store)).map(value => [value.id, value]));
+        }
+        return state;
     }
 
     /**
      * Stores the current state into the database.
+     *
+     * @param state
+     *     The application state.
+     * @param changed
+     *     An object mapping entity types to the IDs of changed entities. Only
+     *     these entities are written; if this is not specified, all entities
+     *     are.
      */
-    async store(state) {
-        const trans = this._db.transaction(T.STATE, "readwrite");
-        await put(trans, T.STATE, KEY, flatten(state));
+    async store(state, changed) {
+        const trans = this._db.transaction(Object.values(T), "readwrite");
+        const { project, prompt, ...rest } = state;
+        await put(trans, T.STATE, KEY, flatten(rest));
+        for (const [type, store] of Object.entries(ENTITIES)) {
+            if (changed === undefined) {
+                await schedule(trans.objectStore(store).clear());
+            }
+            const ids = changed?.[type] ?? Object.keys(state[type]);
+            for (const id of ids) {
+                if (id in state[type]) {
+                    await put(trans, store, id, flatten(state[type][id]));
+                } else {
+                    await schedule(trans.objectStore(store).delete(id));
+                }
+            }
+        }
     }
 
     /**
      * Clears the entire database.
      */
     async clear() {
-        const trans = this._db.transaction(T.STATE, "readwrite");
-        await schedule(trans.objectStore(T.STATE).clear());
+        const trans = this._db.transaction(Object.values(T), "readwrite");
+        await Promise.all(Object.values(T).map(
+            store => schedule(trans.objectStore(store).clear())));
     }
 }
 
@@ -70,14 +117,14 @@ export class Database {
  *     where `eventName` is "error" or "blocked"
  */
 export default async () => {
-    const req = indexedDB.open(Database.NAME, Database.VERSION);
+    const req = indexedDB.open(NAME, VERSION);
     return new Database((await new Promise((resolve, reject) => {
         req.addEventListener("error", reject);
         req.addEventListener("success", resolve);
         req.addEventListener(
             "upgradeneeded",
             async (e) => {
-                await upgrade(req.result, e.oldVersion);
+                await upgrade(req.result, req.transaction, e.oldVersion);
                 resolve(e);
             });
     })).target.result);
@@ -100,6 +147,20 @@ const get = async (trans, store, key) => (await schedule(
     trans.objectStore(store).get(key))).target.result;
 
 
+/**
+ * Reads all values from an object store.
+ *
+ * @param trans
+ *     An open transaction.
+ * @param store
+ *     The name of an object store.
+ * @returns a list of items
+ * @throws an error event wrapped as `{type: eventName, event: eventData}`
+ */
+const getAll = async (trans, store) => (await schedule(
+    trans.objectStore(store).getAll())).target.result;
+
+
 /**
  * Writes a value to an object store.
  *
@@ -167,17 +228,29 @@ const flatten = (i) => {
  *
  * @param db
  *     The database instance.
+ * @param trans
+ *     The upgrade transaction.
  * @param fromVersion
  *     The version from which to upgrade.
  */
-const upgrade = async (db, fromVersion) => {
+const upgrade = async (db, trans, fromVersion) => {
     const v1 = async () => db.createObjectStore(T.STATE);
+    const v2 = async () => {
+        // Entities are stored separately; the old state is dropped and
+        // retrieved again on the next synchronisation
+        db.createObjectStore(T.PROJECT);
+        db.createObjectStore(T.PROMPT);
+        await schedule(trans.objectStore(T.STATE).clear());
+    };
 
     switch (fromVersion) {
     case 0:
         await v1();
         // Fall-through
     case 1:
+        await v2();
+        // Fall-through
+    case 2:
         // Current
         return;
     default:
@@ -5,14 +5,15 @@ import * as ui from "../ui.js";
 
 export default {
     initialize: async (state) => {
-        return await api.project.all(state);
+        await api.sync(state);
+        return await api.project.page(state);
     },
 
     show: async (page, state) => {
         const [target, add] = ui.managed(page.doc);
         const buttonTemplate = document.getElementById("button-large");
         const iconTemplate = document.getElementById("button-icons");
-        page.context.forEach((project) => {
+        const render = (projects) => projects.forEach((project) => {
             const button = buttonTemplate.content.cloneNode(true);
             const [link, icon, name, description] = ui.managed(button);
 
@@ -27,7 +28,21 @@ export default {
 
             target.appendChild(button);
         });
+        render(page.context.items);
         add.appendChild(
             iconTemplate.content.querySelector("#add").cloneNode(true));
+
+        let cursor = page.context.next;
+        if (cursor) {
+            const seen = page.context.items.map(project => project.id);
+            ui.lazy(target, async () => {
+                const next = await api.project.page(state, cursor, seen);
+                const items = next?.items ?? [];
+                seen.push(...items.map(project => project.id));
+                render(items);
+                cursor = next?.next;
+                return !!cursor;
+            });
+        }
     },
 };
@@ -5,18 +5,19 @@ import * as ui from "../ui.js";
 
 export default {
     initialize: async (state, id) => {
+        await api.sync(state);
         const [project, prompts] = await Promise.all([
             api.project.get(state, id),
-            api.project.prompts(state, id),
+            api.project.promptPage(state, id),
         ]);
-        return { project };
+        return { project, next: prompts?.next };
     },
 
     show: async (page, state) => {
         const [target, add, remover, remove] = ui.managed(page.doc);
         const buttonTemplate = document.getElementById("button-large");
         const iconTemplate = document.getElementById("button-icons");
-        page.context.project.prompts.forEach((prompt) => {
+        const render = (prompts) => prompts.forEach((prompt) => {
             const button = buttonTemplate.content.cloneNode(true);
             const [link, icon, name, description] = ui.managed(button);
 
@@ -24,12 +25,16 @@ export default {
                 ui.PROMPT_CLASS,
                 ui.className(prompt.id));
             link.href = `#prompt/${prompt.id}`;
-            icon.style.backgroundImage =
-                `url(${api.prompt.iconURL(prompt.id)})`;
+            api.prompt.icon(prompt.id).then(url => {
+                if (url) {
+                    icon.style.backgroundImage = `url(${url})`;
+                }
+            });
             name.innerText = prompt.text;
 
             target.appendChild(button);
         });
+        render(page.context.project.prompts);
         add.appendChild(
             iconTemplate.content.querySelector("#add").cloneNode(true));
         remove.appendChild(
@@ -47,6 +52,17 @@ export default {
                 location.href = `#overview`;
             }
         };
+
+        let cursor = page.context.next;
+        if (cursor) {
+            const id = page.context.project.id;
+            ui.lazy(target, async () => {
+                const next = await api.project.promptPage(state, id, cursor);
+                render(next?.items ?? []);
+                cursor = next?.next;
+                return !!cursor;
+            });
+        }
     },
 
     notificationURL: (page) =>
@@ -58,12 +74,12 @@ export default {
             switch (event.image?.kind) {
                 case "idle":
                     if (!prompt.completed) {
-                        await api.prompt.generate(state, prompt.id);
+                        await api.prompt.generate(state, prompt.id, "bulk");
                     }
                     break;
                 case "completed":
                     if (event.image.data.prompt.id === prompt.id) {
-                        await api.prompt.generate(state, prompt.id);
+                        await api.prompt.generate(state, prompt.id, "bulk");
                     }
                     break;
             }
@@ -7,6 +7,7 @@ export default {
     initialize: async (state, projectID, template) => ({
         projectID,
         template: template && state.prompt(template),
+        parameters: template && await api.prompt.parameters(state, template),
     }),
 
     show: async (page, state) => {
@@ -15,6 +16,14 @@ export default {
             form.querySelector("[name = text]").value =
                 page.context.template.text;
         }
+        if (page.context.parameters) {
+            // Reusing the parameters of the template lets the server reuse
+            // its cached results
+            for (const name of ["steps", "strength", "seed"]) {
+                form.querySelector(`[name = ${name}]`).value =
+                    page.context.parameters[name] ?? "";
+            }
+        }
         form.addEventListener("submit", async (e) => {
             e.preventDefault();
             const data = new FormData(form);
@@ -26,7 +35,9 @@ export default {
                     .withProject(page.context.projectID)
                     .withText(data.get("text")),
                 parseInt(data.get("steps") || 50),
-                65536 * Math.random(),
+                data.get("seed")
+                    ? parseInt(data.get("seed"))
+                    : 65536 * Math.random(),
                 parseFloat(data.get("strength") || 10.0));
             location.href = `#prompt/${prompt.id}`;
         });
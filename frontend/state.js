@@ -19,16 +19,83 @@ class State {
         if (this._state.prompt === undefined) {
            this._state.prompt = {};
         }
+        this._changed = changeset();
+    }
+
+    /**
+     * The sequence number of the last change retrieved from the backend, or
+     * `undefined` if the state has never been synchronised.
+     */
+    get sequence() {
+        return this._state.sequence;
     }
 
     /**
      * Stores the application state to the database.
+     *
+     * Only the entities changed since the last call are passed to the store
+     * function.
      */
     async store() {
-        await this._store(this._state);
+        const changed = this._changed;
+        this._changed = changeset();
+        await this._store(this._state, changed);
         return this;
     }
 
+    /**
+     * Marks an entity as changed, so that it is written by the next call to
+     * `store`.
+     *
+     * @param type
+     *     The type of entity.
+     * @param id
+     *     The entity ID.
+     */
+    touch(type, id) {
+        this._changed[type].add(id);
+    }
+
+    /**
+     * Applies changes retrieved from the backend.
+     *
+     * @param changes
+     *     The changes. Every change has the attributes `kind`, the entity
+     *     type, `id`, the entity ID, and `entity`, the backend representation
+     *     of the entity or `null` if it has been deleted.
+     * @param sequence
+     *     The sequence number of the last change.
+     */
+    applyChanges(changes, sequence) {
+        changes.forEach(change => {
+            const project = change.kind === "prompt"
+                ? (change.entity ?? this._state.prompt[change.id])?.project
+                : undefined;
+            if (change.entity) {
+                this[change.kind](change.id).update(change.entity);
+            } else if (change.id in this._state[change.kind]) {
+                delete this._state[change.kind][change.id];
+                this.touch(change.kind, change.id);
+            }
+
+            // Maintain the list of prompts of the project
+            if (project in this._state.project) {
+                const ids = this._state.project[project].prompts ?? [];
+                const i = ids.indexOf(change.id);
+                if (change.entity && i < 0) {
+                    this._state.project[project].prompts = ids.concat(
+                        [change.id]);
+                    this.touch("project", project);
+                } else if (!change.entity && i >= 0) {
+                    this._state.project[project].prompts = ids.filter(
+                        id => id !== change.id);
+                    this.touch("project", project);
+                }
+            }
+        });
+        this._state.sequence = sequence;
+    }
+
     /**
      * Loads a project from the cached state.
      *
@@ -55,6 +122,7 @@ class State {
                 filter: ids => Object.keys(self._state.project).forEach(id => {
                     if (ids.indexOf(id) < 0) {
                         delete self._state.project[id];
+                        self.touch("project", id);
                     }
                 }),
             };
@@ -188,6 +256,11 @@ const entity = (state, type, id, frontToBack, backToFront) => {
     if (!detached) {
         state._state[type][id] = value;
     }
+    const touch = () => {
+        if (!detached) {
+            state.touch(type, id);
+        }
+    };
 
     const self = {
         exists,
@@ -199,6 +272,7 @@ const entity = (state, type, id, frontToBack, backToFront) => {
         json: () => map(value, frontToBack),
         remove: detached ? undefined : async () => {
             delete state._state[type][id];
+            touch();
             await state.store();
         },
         store: detached ? undefined : async () => {
@@ -209,6 +283,7 @@ const entity = (state, type, id, frontToBack, backToFront) => {
             for (const [k, v] of Object.entries(map(r, backToFront))) {
                 value[k] = v;
             }
+            touch();
             return self;
         },
     };
@@ -217,12 +292,18 @@ const entity = (state, type, id, frontToBack, backToFront) => {
         switch (v?.constructor) {
             case Object: return detached ? {} : {
                 get: () => v.get(value, state, id),
-                set: (t) => v.set(value, state, id, t),
+                set: (t) => {
+                    v.set(value, state, id, t);
+                    touch();
+                },
             };
             case undefined:
             case String: return {
                 get: () => value[k],
-                set: (t) => value[k] = t,
+                set: (t) => {
+                    value[k] = t;
+                    touch();
+                },
             };
         }
     };
@@ -240,6 +321,17 @@ const entity = (state, type, id, frontToBack, backToFront) => {
 };
 
 
+/**
+ * Creates an empty set of changed entities.
+ *
+ * @return an object mapping entity types to sets of entity IDs
+ */
+const changeset = () => ({
+    project: new Set(),
+    prompt: new Set(),
+});
+
+
 /**
  * Loads the current application state.
  *
@@ -224,6 +224,42 @@ export const message = async (caption, text, buttons) => {
     });
 };
 
+/**
+ * Loads more content whenever the end of an element is scrolled into view.
+ *
+ * @param target
+ *     The element to which content is added.
+ * @param load
+ *     An asynchronous function loading more content. It must resolve to
+ *     whether even more content is available.
+ */
+export const lazy = (target, load) => {
+    const sentinel = document.createElement("div");
+    target.after(sentinel);
+
+    let loading = false;
+    const observer = new IntersectionObserver(async (entries) => {
+        if (loading || !entries.some(e => e.isIntersecting)) {
+            return;
+        }
+        loading = true;
+        try {
+            if (await load()) {
+                // Observe again to load more if the sentinel is still visible
+                observer.unobserve(sentinel);
+                observer.observe(sentinel);
+            } else {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        } finally {
+            loading = false;
+        }
+    });
+    observer.observe(sentinel);
+};
+
+
 /**
  * Converts an entity ID to a class name.
  *
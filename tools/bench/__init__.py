@@ -0,0 +1,68 @@
+"""
+Benchmarks
+----------
+
+Benchmarks for the backend. Run them from the ``tools`` directory with
+``python -m bench BENCHMARK``.
+"""
+import os
+import sys
+import time
+
+from contextlib import contextmanager
+from typing import Callable, Sequence
+
+
+#: The directory containing the backend package.
+BACKEND_DIR = os.path.join(
+    os.path.dirname(__file__),
+    os.path.pardir,
+    os.path.pardir,
+    'backend')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@contextmanager
+def timer() -> Callable[[], float]:
+    """Constructs a high resolution timer as a context manager.
+
+    The value yielded returns the number of seconds elapsed since the context
+    was entered, or the total duration once it has been exited.
+    """
+    def inner():
+        return (end_time or time.perf_counter()) - start_time
+
+    start_time = time.perf_counter()
+    end_time = None
+    yield inner
+    end_time = time.perf_counter()
+
+
+def rate(count: int, duration: float) -> float:
+    """Calculates a rate.
+
+    :param count: The number of operations performed.
+
+    :param duration: The number of seconds taken.
+
+    :return: operations per second
+    """
+    return count / duration if duration > 0 else float('inf')
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Calculates a percentile using the nearest rank.
+
+    :param values: The values. They need not be sorted.
+
+    :param p: The percentile, in the range ``0`` to ``100``.
+
+    :return: the percentile, or ``nan`` if ``values`` is empty
+    """
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
@@ -0,0 +1,54 @@
+import argparse
+import json
+
+from . import entities, generator, pipeline, startup
+
+
+#: The available benchmarks.
+BENCHMARKS = {
+    'entities': entities.run,
+    'generator': generator.run,
+    'pipeline': pipeline.run,
+    'startup': startup.run}
+
+
+def main(benchmark: str, output: str, baseline: str):
+    if baseline is not None:
+        with open(baseline, encoding='utf-8') as f:
+            previous = json.load(f).get(benchmark, {})
+    else:
+        previous = {}
+
+    results = BENCHMARKS[benchmark]()
+
+    for (name, value) in results.items():
+        if previous.get(name):
+            print('{:<40} {:>16.2f} {:>+9.1f}%'.format(
+                name, value, 100 * (value - previous[name]) / previous[name]))
+        else:
+            print('{:<40} {:>16.2f}'.format(name, value))
+
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({benchmark: results}, f, indent=4)
+
+
+parser = argparse.ArgumentParser(
+    description='Runs a backend benchmark.')
+
+parser.add_argument(
+    'benchmark',
+    help='The benchmark to run.',
+    choices=sorted(BENCHMARKS))
+
+parser.add_argument(
+    '--output',
+    help='A file to which to write the results as JSON.')
+
+parser.add_argument(
+    '--baseline',
+    help='A file with results previously written with --output, for example '
+    'from another commit, to which to compare the results.')
+
+
+main(**vars(parser.parse_args()))
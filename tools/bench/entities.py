@@ -0,0 +1,60 @@
+from typing import Dict
+
+from ijave import ent, serialize
+
+from . import rate, timer
+
+
+#: The default number of rows.
+ROWS = 100000
+
+
+def run(rows: int = ROWS) -> Dict[str, float]:
+    """Measures entity construction and serialisation rates.
+
+    Construction is measured both through the validating constructor and the
+    trusted path used for rows read from the database, and serialisation both
+    through :meth:`ent.Entity.to_json` and directly from rows.
+
+    :param rows: The number of rows to construct.
+
+    :return: a mapping from metric name to operations per second
+    """
+    project = ent.ProjectID.new()
+    data = [
+        (ent.PromptID.new().bytes, project.bytes, 'prompt {}'.format(i))
+        for i in range(rows)]
+
+    with timer() as duration:
+        entities = [
+            ent.Prompt(
+                id=ent.PromptID.from_uuid(id),
+                project=ent.ProjectID.from_uuid(project),
+                text=text)
+            for (id, project, text) in data]
+    construct = rate(rows, duration())
+
+    with timer() as duration:
+        entities = [
+            ent.Prompt.trusted(
+                ent.PromptID.trusted(id),
+                ent.ProjectID.trusted(project),
+                text)
+            for (id, project, text) in data]
+    construct_trusted = rate(rows, duration())
+
+    with timer() as duration:
+        for entity in entities:
+            entity.to_json()
+    to_json = rate(rows, duration())
+
+    encoder = serialize.encoder(ent.Prompt)
+    with timer() as duration:
+        encoder.encode_many(data)
+    encode_rows = rate(rows, duration())
+
+    return {
+        'construct': construct,
+        'construct_trusted': construct_trusted,
+        'to_json': to_json,
+        'encode_rows': encode_rows}
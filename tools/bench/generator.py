@@ -0,0 +1,143 @@
+import multiprocessing as mp
+import os
+
+from multiprocessing.connection import Connection
+from typing import Dict
+
+from ijave import ent
+from ijave.executor.image import (
+    GeneratorConfig, Input, Task, bfloat16_supported)
+
+from . import rate, timer
+
+
+#: The default number of timed steps per configuration.
+STEPS = 5
+
+#: The default image size.
+SIZE = 256
+
+#: The number of latents transformed together when measuring throughput.
+BATCH_SIZE = 4
+
+#: The prompt text used.
+PROMPT = 'Inane Jave riding a horse. In space.'
+
+
+def configurations() -> Dict[str, GeneratorConfig]:
+    """Generates the configurations to compare on this machine.
+
+    Every precision supported by the CPU is measured both with the TensorFlow
+    defaults and with the generator restricted to half of the available CPUs,
+    as when two workers share the host.
+
+    :return: a mapping from configuration name to configuration
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    half = cpus[:max(1, len(cpus) // 2)]
+    precisions = ['float32'] + (['bfloat16'] if bfloat16_supported() else [])
+
+    result = {}
+    for precision in precisions:
+        result[precision] = GeneratorConfig(precision=precision)
+        result['{}-half'.format(precision)] = GeneratorConfig(
+            precision=precision,
+            intra_op_threads=len(half),
+            inter_op_threads=1,
+            cpu_affinity=half)
+    return result
+
+
+def measure(
+        config: GeneratorConfig, steps: int, size: int, pipe: Connection):
+    """Measures a single configuration.
+
+    This is run in a process of its own, since the configuration applies to
+    the entire process. The tuple ``(latency, throughput)`` is sent on
+    ``pipe``.
+
+    :param config: The configuration to measure.
+
+    :param steps: The number of timed steps.
+
+    :param size: The image size.
+
+    :param pipe: The connection on which to send the result.
+    """
+    config.apply()
+
+    from ijave.executor.image import remote
+
+    generator = remote.Generator(config)
+    project = ent.ProjectID.new()
+
+    def inputs(count: int):
+        result = []
+        for seed in range(count):
+            prompt = ent.Prompt(
+                id=ent.PromptID.new(),
+                project=project,
+                text=PROMPT)
+            result.append(Input(
+                task=Task(prompt=prompt, width=size, height=size, seed=seed),
+                cached=ent.ImageExecutorCache(
+                    id=ent.ImageExecutorCacheID.from_prompt_id(prompt.id),
+                    step=0,
+                    steps=steps,
+                    strength=7.5,
+                    latent=None,
+                    seed=seed),
+                decode=False))
+        return result
+
+    # Compile the models for both batch sizes before timing anything
+    generator.generate_batch(inputs(1))
+    generator.generate_batch(inputs(BATCH_SIZE))
+
+    with timer() as duration:
+        for _ in range(steps):
+            generator.generate_batch(inputs(1))
+    latency = duration() / steps
+
+    with timer() as duration:
+        for _ in range(steps):
+            generator.generate_batch(inputs(BATCH_SIZE))
+    throughput = rate(steps * BATCH_SIZE, duration())
+
+    pipe.send((latency, throughput))
+
+
+def run(steps: int = STEPS, size: int = SIZE) -> Dict[str, float]:
+    """Measures generator step latency and throughput for every configuration
+    returned by :func:`configurations`.
+
+    Latency is the number of milliseconds taken by a single step for a single
+    image, and throughput the number of image steps per second when
+    :data:`BATCH_SIZE` latents are transformed together. Images are not
+    decoded.
+
+    :param steps: The number of timed steps per configuration.
+
+    :param size: The image size.
+
+    :return: a mapping from metric name to value
+    """
+    result = {}
+    for (name, config) in configurations().items():
+        (local_pipe, remote_pipe) = mp.Pipe()
+        process = mp.Process(
+            target=measure,
+            args=(config, steps, size, remote_pipe))
+        process.start()
+        remote_pipe.close()
+        try:
+            (latency, throughput) = local_pipe.recv()
+        except EOFError:
+            raise RuntimeError('failed to measure {}'.format(name))
+        finally:
+            process.join()
+
+        result['{}.latency_ms'.format(name)] = 1000 * latency
+        result['{}.throughput'.format(name)] = throughput
+
+    return result
@@ -0,0 +1,370 @@
+import asyncio
+import os
+import random
+import tempfile
+
+from typing import Awaitable, Callable, Dict, List
+
+import aiohttp
+
+from aiohttp import web
+
+from ijave import db
+from ijave.__main__ import application
+from ijave.executor.image import GeneratorConfig
+
+from . import percentile, rate, timer
+
+
+#: The default number of projects created.
+PROJECTS = 50
+
+#: The default number of prompts created per project.
+PROMPTS = 10
+
+#: The default number of requests for every listing and fetching workload.
+REQUESTS = 1000
+
+#: The default number of concurrent clients.
+CONCURRENCY = 16
+
+#: The default number of concurrent notification WebSockets.
+SOCKETS = 200
+
+#: The maximum number of seconds notification WebSockets wait for the images
+#: requested for their project.
+SOCKET_TIMEOUT = 60.0
+
+#: The number of seconds to wait for the server to acknowledge the closing of
+#: a notification WebSocket. The server does not read from them, so it only
+#: notices a closed socket when sending the next ping.
+CLOSE_TIMEOUT = 1.0
+
+#: The number of seconds each call to the synthetic generator takes.
+GENERATOR_LATENCY = 0.01
+
+#: The number of steps for each prompt.
+STEPS = 3
+
+#: The image size.
+SIZE = 256
+
+
+async def workload(
+        name: str,
+        count: int,
+        concurrency: int,
+        request: Callable[[int], Awaitable[None]]) -> Dict[str, float]:
+    """Runs a workload.
+
+    :param name: The name of the workload, used as prefix for the metrics.
+
+    :param count: The total number of requests.
+
+    :param concurrency: The number of concurrent clients.
+
+    :param request: A function performing request number ``n``.
+
+    :return: the throughput and latency percentiles of the workload
+    """
+    latencies = []
+    indices = iter(range(count))
+
+    async def client():
+        for n in indices:
+            with timer() as duration:
+                await request(n)
+            latencies.append(duration())
+
+    with timer() as duration:
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    return metrics(name, latencies, rate(count, duration()))
+
+
+def metrics(
+        name: str,
+        latencies: List[float],
+        throughput: float) -> Dict[str, float]:
+    """Generates the metrics for a workload.
+
+    :param name: The name of the workload.
+
+    :param latencies: The latencies, in seconds, of all requests.
+
+    :param throughput: The number of requests per second.
+
+    :return: a mapping from metric name to value
+    """
+    return {
+        '{}.throughput'.format(name): throughput,
+        '{}.p50_ms'.format(name): 1000 * percentile(latencies, 50),
+        '{}.p90_ms'.format(name): 1000 * percentile(latencies, 90),
+        '{}.p99_ms'.format(name): 1000 * percentile(latencies, 99)}
+
+
+async def benchmark(
+        base: str,
+        projects: int,
+        prompts: int,
+        requests: int,
+        concurrency: int,
+        sockets: int) -> Dict[str, float]:
+    """Runs all workloads against a running server.
+
+    :param base: The base URL of the API.
+
+    :param projects: The number of projects to create.
+
+    :param prompts: The number of prompts to create per project.
+
+    :param requests: The number of requests for every listing and fetching
+        workload.
+
+    :param concurrency: The number of concurrent clients.
+
+    :param sockets: The number of concurrent notification WebSockets.
+
+    :return: a mapping from metric name to value
+    """
+    result = {}
+    project_ids = []
+    prompt_ids = []
+    prompt_projects = {}
+    image_ids = []
+
+    # Every notification WebSocket holds a connection of its own
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def post(path: str, data) -> dict:
+            async with session.post(base + path, json=data) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        async def get(path: str) -> bytes:
+            async with session.get(base + path) as response:
+                response.raise_for_status()
+                return await response.read()
+
+        async def create_project(n: int):
+            project_ids.append((await post('project', {
+                'name': 'project {}'.format(n),
+                'description': 'A benchmark project',
+                'image_width': SIZE,
+                'image_height': SIZE}))['id'])
+
+        async def create_prompt(n: int):
+            project = project_ids[n % projects]
+            prompt = (await post(
+                'project/{}/prompts'.format(project), {
+                    'text': 'prompt {}'.format(n),
+                    'steps': STEPS,
+                    'strength': 7.5,
+                    'seed': n}))['id']
+            prompt_ids.append(prompt)
+            prompt_projects[prompt] = project
+
+        async def list_projects(n: int):
+            await get('project?limit=50')
+
+        async def list_prompts(n: int):
+            await get('project/{}/prompts?limit=50'.format(
+                random.choice(project_ids)))
+
+        async def list_images(n: int):
+            await get('prompt/{}/images?limit=50'.format(
+                random.choice(prompt_ids)))
+
+        async def fetch_image(n: int):
+            await get('image/{}/png'.format(random.choice(image_ids)))
+
+        result.update(await workload(
+            'create_project', projects, concurrency, create_project))
+        result.update(await workload(
+            'create_prompt', projects * prompts, concurrency, create_prompt))
+        result.update(await workload(
+            'list_projects', requests, concurrency, list_projects))
+        result.update(await workload(
+            'list_prompts', requests, concurrency, list_prompts))
+
+        # Wait for the first images of all prompts
+        while len(image_ids) < len(prompt_ids):
+            await asyncio.sleep(0.5)
+            image_ids = await images(session, base, prompt_ids)
+
+        result.update(await workload(
+            'list_images', requests, concurrency, list_images))
+        result.update(await workload(
+            'fetch_image', requests, concurrency, fetch_image))
+        result.update(await notifications(
+            session, base, project_ids, prompt_projects, sockets))
+
+    return result
+
+
+async def images(
+        session: aiohttp.ClientSession,
+        base: str,
+        prompt_ids: List[str]) -> List[str]:
+    """Lists the latest image of every prompt that has one.
+
+    :param session: The client session.
+
+    :param base: The base URL of the API.
+
+    :param prompt_ids: The prompts.
+
+    :return: a list of image IDs
+    """
+    result = []
+    for prompt in prompt_ids:
+        async with session.get(
+                base + 'prompt/{}/images?limit=1'.format(prompt)) as response:
+            response.raise_for_status()
+            result.extend(i['id'] for i in (await response.json())['items'])
+    return result
+
+
+async def notifications(
+        session: aiohttp.ClientSession,
+        base: str,
+        project_ids: List[str],
+        prompt_projects: Dict[str, str],
+        sockets: int) -> Dict[str, float]:
+    """Keeps many notification WebSockets open while images are generated.
+
+    The next image of every prompt is requested once all sockets are open,
+    and every socket is kept open until it has been notified of the images of
+    all prompts of its project. The notification latency is measured from
+    the request of an image until a socket is notified of it, for every
+    socket.
+
+    :param session: The client session.
+
+    :param base: The base URL of the API.
+
+    :param project_ids: The projects, to whose notifications the sockets are
+        distributed.
+
+    :param prompt_projects: The prompts for which to generate images, mapped
+        to their projects.
+
+    :param sockets: The number of sockets.
+
+    :return: the connection and notification latency percentiles, and the
+        rate of messages received across all sockets
+    """
+    loop = asyncio.get_running_loop()
+    latencies = []
+    delivery = []
+    received = 0
+    requested = {}
+    connections = []
+    ready = asyncio.Event()
+
+    project_prompts = {project: set() for project in project_ids}
+    for (prompt, project) in prompt_projects.items():
+        project_prompts[project].add(prompt)
+
+    async def listen(n: int):
+        nonlocal received
+        project = project_ids[n % len(project_ids)]
+        with timer() as duration:
+            ws = await session.ws_connect(
+                base + 'project/{}/notifications'.format(project))
+        connections.append(ws)
+        latencies.append(duration())
+        if len(latencies) == sockets:
+            ready.set()
+        await ready.wait()
+        pending = set(project_prompts[project])
+        deadline = loop.time() + SOCKET_TIMEOUT
+        while pending and (remaining := deadline - loop.time()) > 0:
+            try:
+                message = await ws.receive(timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            received += 1
+            data = message.json()['image']
+            if data['kind'] == 'completed':
+                prompt = data['data']['prompt']['id']
+                if prompt in pending:
+                    pending.remove(prompt)
+                    delivery.append(loop.time() - requested[prompt])
+
+    async def generate():
+        await ready.wait()
+        for prompt in prompt_projects:
+            requested[prompt] = loop.time()
+            async with session.post(
+                    base + 'prompt/{}/generate-next'.format(prompt)) as r:
+                r.raise_for_status()
+
+    try:
+        with timer() as duration:
+            await asyncio.gather(
+                generate(),
+                *(listen(n) for n in range(sockets)))
+    finally:
+        await asyncio.gather(
+            *(
+                asyncio.wait_for(ws.close(), CLOSE_TIMEOUT)
+                for ws in connections),
+            return_exceptions=True)
+
+    result = metrics('notifications_connect', latencies, rate(
+        sockets, duration()))
+    del result['notifications_connect.throughput']
+    result.update(metrics('notifications_delivery', delivery, 0.0))
+    del result['notifications_delivery.throughput']
+    result['notifications.messages_per_second'] = rate(received, duration())
+    return result
+
+
+def run(
+        projects: int = PROJECTS,
+        prompts: int = PROMPTS,
+        requests: int = REQUESTS,
+        concurrency: int = CONCURRENCY,
+        sockets: int = SOCKETS) -> Dict[str, float]:
+    """Measures the HTTP, database, executor and broker pipeline end to end.
+
+    The application is started in process on a local port against a
+    temporary database, with the synthetic generator backend. Latencies are
+    reported in milliseconds, and throughput in requests per second.
+
+    :param projects: The number of projects to create.
+
+    :param prompts: The number of prompts to create per project.
+
+    :param requests: The number of requests for every listing and fetching
+        workload.
+
+    :param concurrency: The number of concurrent clients.
+
+    :param sockets: The number of concurrent notification WebSockets.
+
+    :return: a mapping from metric name to value
+    """
+    async def main():
+        with tempfile.TemporaryDirectory() as directory:
+            app = application(
+                db.Database(os.path.join(directory, 'bench.db')),
+                config=GeneratorConfig(
+                    backend='synthetic',
+                    synthetic_latency=GENERATOR_LATENCY))
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            try:
+                (host, port) = runner.addresses[0][:2]
+                return await benchmark(
+                    'http://{}:{}/api/'.format(host, port),
+                    projects, prompts, requests, concurrency, sockets)
+            finally:
+                await runner.cleanup()
+
+    return asyncio.run(main())
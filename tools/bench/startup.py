@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from typing import Dict, Tuple
+
+from . import BACKEND_DIR, percentile, timer
+
+
+#: The default number of times the server is started.
+RUNS = 5
+
+#: The default generator backend.
+BACKEND = 'synthetic'
+
+#: The number of seconds to wait for the server to become ready.
+TIMEOUT = 600.0
+
+#: The number of seconds between polls.
+POLL_INTERVAL = 0.005
+
+
+def port() -> int:
+    """Finds a free local port.
+
+    :return: a port number
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure(backend: str) -> Tuple[float, float]:
+    """Starts the server once and polls the readiness endpoint.
+
+    :param backend: The generator backend.
+
+    :return: the tuple ``(first_response, ready)``, the number of seconds
+        from launching the server until it first responded, and until it
+        reported being ready
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        server_port = port()
+        url = 'http://127.0.0.1:{}/api/ready'.format(server_port)
+        env = dict(
+            os.environ,
+            IJAVE_PORT=str(server_port),
+            PYTHONPATH=os.pathsep.join(filter(None, (
+                os.path.abspath(BACKEND_DIR),
+                os.environ.get('PYTHONPATH')))))
+        first_response = None
+
+        with timer() as duration:
+            process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'ijave',
+                    os.path.join(directory, 'bench.db'),
+                    '--backend', backend],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+            try:
+                while duration() < TIMEOUT:
+                    try:
+                        with urllib.request.urlopen(url) as response:
+                            ready = json.load(response)['ready']
+                    except urllib.error.HTTPError as e:
+                        ready = json.load(e)['ready']
+                    except urllib.error.URLError:
+                        if process.poll() is not None:
+                            raise RuntimeError('server exited')
+                        time.sleep(POLL_INTERVAL)
+                        continue
+
+                    if first_response is None:
+                        first_response = duration()
+                    if ready:
+                        return (first_response, duration())
+                    time.sleep(POLL_INTERVAL)
+
+                raise RuntimeError('server did not become ready')
+            finally:
+                process.terminate()
+                process.wait()
+
+
+def run(runs: int = RUNS, backend: str = BACKEND) -> Dict[str, float]:
+    """Measures the time from launching the server until it responds, and
+    until the generator backend has loaded.
+
+    The server is launched as a separate process against a temporary
+    database. Times are reported in milliseconds, as the median of all runs.
+
+    :param runs: The number of times to start the server.
+
+    :param backend: The generator backend.
+
+    :return: a mapping from metric name to value
+    """
+    first_responses = []
+    readies = []
+    for _ in range(runs):
+        (first_response, ready) = measure(backend)
+        first_responses.append(first_response)
+        readies.append(ready)
+
+    return {
+        'first_response_ms': 1000 * percentile(first_responses, 50),
+        'ready_ms': 1000 * percentile(readies, 50)}